@@ -3,10 +3,35 @@
 主应用程序文件
 """
 
+import time
 import streamlit as st
-import pandas as pd
-from supabase import create_client
-from utils import get_keywords, MARKET_CONFIG, TRANSLATIONS
+import metrics
+import tracing
+from job_queue import (
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_POLL_INTERVAL,
+    autospawn_enabled,
+    ensure_workers,
+    get_job_queue,
+    queue_key_id,
+)
+from prewarm import get_request_log
+from result_store import STATUS_PENDING, ResultStore
+from utils import (
+    generate_keywords_within_budget,
+    prioritize_markets,
+    stream_keywords_for_markets,
+    MARKET_DONE,
+    MARKET_FAILED,
+    MARKET_SKIPPED,
+    MARKET_CONFIG,
+    MARKET_NAMES,
+    TRANSLATIONS,
+    WIRE_FORMATS,
+    DEFAULT_MAX_WORKERS,
+    MAX_WORKERS_LIMIT,
+)
 
 # 初始化session state
 if "user" not in st.session_state:
@@ -16,6 +41,31 @@ if "user" not in st.session_state:
 if 'interface_lang' not in st.session_state:
     st.session_state.interface_lang = "Chinese"
 
+# 初始化会话结果存储（生成结果在重跑后仍然保留）
+if "result_store" not in st.session_state:
+    st.session_state["result_store"] = ResultStore()
+result_store = st.session_state["result_store"]
+
+# 后台运行：运行ID同时写入URL查询参数，刷新页面后从队列中恢复运行参数并继续轮询
+if "job_run" not in st.session_state:
+    st.session_state["job_run"] = None
+    restored_run_id = st.query_params.get("run")
+    if restored_run_id:
+        run_info = get_job_queue().run_info(restored_run_id)
+        if run_info is not None:
+            st.session_state["job_run"] = {
+                "id": restored_run_id,
+                "seed": run_info["seed"],
+                "interface_lang": run_info["interface_lang"],
+                "live": run_info["live"],
+            }
+            st.session_state["seed_keyword"] = run_info["seed"]
+            st.session_state["selected_markets"] = run_info["markets"]
+            st.session_state.interface_lang = run_info["interface_lang"]
+            result_store.set_view(run_info["seed"], run_info["interface_lang"], run_info["live"])
+        else:
+            del st.query_params["run"]
+
 # 设置页面配置
 st.set_page_config(
     page_title="Multi-Language SEO Intent Explorer",
@@ -24,11 +74,21 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 初始化Supabase客户端
+
+@st.cache_resource(show_spinner=False)
+def get_supabase_client(url: str, key: str):
+    """
+    进程级共享的Supabase客户端
+    所有会话和重跑复用同一个客户端；supabase在首次登录/注册时才导入和创建
+    """
+    from supabase import create_client
+    return create_client(url, key)
+
+
+# 读取Supabase配置
 try:
     supabase_url = st.secrets["SUPABASE_URL"]
     supabase_key = st.secrets["SUPABASE_KEY"]
-    supabase = create_client(supabase_url, supabase_key)
 except KeyError:
     st.error("⚠️ Supabase credentials not found in secrets. Please configure SUPABASE_URL and SUPABASE_KEY in .streamlit/secrets.toml")
     st.stop()
@@ -55,7 +115,9 @@ with st.sidebar:
                     if login_username and login_password:
                         try:
                             # 查询用户
-                            response = supabase.table('users').select("*").eq('username', login_username).eq('password', login_password).execute()
+                            with tracing.span("supabase_lookup", root=True, table="users", action="login"):
+                                supabase = get_supabase_client(supabase_url, supabase_key)
+                                response = supabase.table('users').select("*").eq('username', login_username).eq('password', login_password).execute()
                             
                             if response.data and len(response.data) > 0:
                                 user_data = response.data[0]
@@ -82,7 +144,9 @@ with st.sidebar:
                     if signup_username and signup_name and signup_email and signup_password:
                         try:
                             # 检查用户名是否已存在
-                            check_response = supabase.table('users').select("username").eq('username', signup_username).execute()
+                            with tracing.span("supabase_lookup", root=True, table="users", action="signup_check"):
+                                supabase = get_supabase_client(supabase_url, supabase_key)
+                                check_response = supabase.table('users').select("username").eq('username', signup_username).execute()
                             
                             if check_response.data and len(check_response.data) > 0:
                                 st.error("❌ Username already exists")
@@ -159,7 +223,7 @@ with st.sidebar:
     st.markdown("---")
     
     # 多选目标市场（带级别限制）
-    available_markets = list(MARKET_CONFIG.keys())
+    available_markets = MARKET_NAMES
     
     # 根据用户级别设置默认值
     if user_tier == "guest":
@@ -173,14 +237,124 @@ with st.sidebar:
     tier_info = f"Guests: 1, Registered: 5, VIP: Unlimited. You are: {user_tier.upper()}"
     help_text = t["select_markets_help"] + f" ({tier_info})"
     
+    # 恢复的后台运行可能来自更高级别的会话（刷新后需要重新登录），按当前级别截断
+    if len(st.session_state.get("selected_markets") or []) > max_countries:
+        st.session_state["selected_markets"] = st.session_state["selected_markets"][:max_countries]
+    
     selected_markets = st.multiselect(
         t["select_markets_label"],
         options=available_markets,
-        default=default_markets[:max_countries] if len(default_markets) > max_countries else default_markets,
+        default=None if "selected_markets" in st.session_state else (
+            default_markets[:max_countries] if len(default_markets) > max_countries else default_markets
+        ),
         max_selections=max_countries,
-        help=help_text
+        help=help_text,
+        key="selected_markets"
+    )
+    
+    # 并发请求数（每次运行可单独配置）
+    max_workers = st.slider(
+        t["concurrency_label"],
+        min_value=1,
+        max_value=MAX_WORKERS_LIMIT,
+        value=DEFAULT_MAX_WORKERS,
+        help=t["concurrency_help"]
+    )
+    
+    # 后台运行：提交到任务队列，由独立的工作进程执行（下面的流式、合并、对冲、响应格式和时间预算选项不适用，勾选后禁用）
+    use_job_queue = st.checkbox(
+        t["use_job_queue_label"],
+        value=False,
+        help=t["use_job_queue_help"]
+    )
+    
+    # 实时显示结果（流式生成）
+    stream_results = st.checkbox(
+        t["stream_results_label"],
+        value=True,
+        help=t["stream_results_help"],
+        disabled=use_job_queue
     )
     
+    # 同语言市场合并请求（流式模式下不可用）
+    batch_by_language = st.checkbox(
+        t["batch_by_language_label"],
+        value=False,
+        help=t["batch_by_language_help"],
+        disabled=stream_results or use_job_queue
+    )
+    
+    # 对慢请求发出对冲请求（流式模式下不可用）
+    hedge_requests = st.checkbox(
+        t["hedge_requests_label"],
+        value=False,
+        help=t["hedge_requests_help"],
+        disabled=stream_results or use_job_queue
+    )
+    
+    # 响应线格式：紧凑格式减少输出令牌，结果展开后与完整格式的结构相同
+    wire_format = st.selectbox(
+        t["wire_format_label"],
+        options=WIRE_FORMATS,
+        format_func=lambda option: t["wire_format_options"][option],
+        help=t["wire_format_help"],
+        disabled=use_job_queue
+    )
+    
+    # 本次生成的时间预算（0表示不限时），到时未完成的市场被跳过，可稍后续跑
+    time_budget = st.number_input(
+        t["time_budget_label"],
+        min_value=0,
+        max_value=3600,
+        value=0,
+        step=30,
+        help=t["time_budget_help"],
+        disabled=use_job_queue
+    )
+    
+    # 市场调度顺序：选择顺序或预期热度
+    prioritize_popular = st.checkbox(
+        t["prioritize_markets_label"],
+        value=False,
+        help=t["prioritize_markets_help"]
+    )
+    
+    # DeepSeek上下文缓存命中统计（有真实API调用后显示）
+    cache_stats = metrics.prompt_cache_snapshot()
+    if cache_stats["calls"]:
+        st.caption(t["prompt_cache_stats"].format(
+            hit_rate=cache_stats["hit_rate"],
+            hit=cache_stats["hit_tokens"],
+            miss=cache_stats["miss_tokens"],
+            calls=cache_stats["calls"]
+        ))
+    
+    # 管理面板：每个市场的调用延迟分位数和用量（仅VIP/管理员可见）
+    if user_tier == "vip":
+        with st.expander(t["metrics_panel_title"]):
+            summary = metrics.market_summary()
+            if summary:
+                import pandas as pd
+                st.dataframe(
+                    pd.DataFrame(summary),
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        q: st.column_config.NumberColumn(q, format="%.2fs")
+                        for q in ("p50", "p95", "p99")
+                    }
+                )
+            else:
+                st.caption(t["metrics_empty"])
+            st.download_button(
+                label=t["metrics_download"],
+                data=metrics.registry.render_prometheus(),
+                file_name="keyword_metrics.prom",
+                mime="text/plain"
+            )
+            # 对生成运行做采样分析（包括线程池中的网络请求和解析）
+            st.checkbox(t["profile_run_label"], help=t["profile_run_help"], key="profile_runs")
+    
     st.markdown("---")
     st.markdown(t["instructions_title"])
     st.markdown(t["instructions"])
@@ -206,7 +380,8 @@ elif user_tier == "free":
 seed_keyword = st.text_input(
     t["seed_keyword_label"],
     placeholder=t["seed_keyword_placeholder"],
-    help=t["seed_keyword_help"]
+    help=t["seed_keyword_help"],
+    key="seed_keyword"
 )
 
 # 生成按钮
@@ -216,8 +391,15 @@ generate_button = st.button(
     use_container_width=True
 )
 
+# 续跑按钮在结果区域，通过会话状态触发与生成按钮相同的流程（只会获取未完成的市场）
+resume_requested = st.session_state.pop("resume_requested", False)
+
+# 本次运行的链路（从点击生成按钮到表格渲染完成）和采样分析器
+run_trace = None
+run_profiler = None
+
 # 处理按钮点击事件
-if generate_button:
+if generate_button or resume_requested:
     if not seed_keyword or not seed_keyword.strip():
         st.error(t["error_no_keyword"])
     elif not selected_markets:
@@ -225,95 +407,288 @@ if generate_button:
     elif len(selected_markets) > max_countries:
         st.error(f"⚠️ You can only select up to {max_countries} countr{'ies' if max_countries > 1 else 'y'}. Current tier: {user_tier.upper()}")
     else:
-        # 初始化结果列表
-        all_results = []
-        all_market_insights = []
+        live = bool(api_key and api_key.strip())
+        seed = seed_keyword.strip()
+        generation_lang = st.session_state.interface_lang
+        
+        run_trace = tracing.start_trace("generate_run", seed=seed, markets=len(selected_markets), live=live)
+        if user_tier == "vip" and st.session_state.get("profile_runs"):
+            run_profiler = tracing.SamplingProfiler().start()
+        
+        # 记录真实API请求（续跑不重复计数），低峰时段的缓存预热按此统计热门组合
+        if live and generate_button:
+            get_request_log().record(
+                seed, [(country, MARKET_CONFIG.get(country, "English")) for country in selected_markets], generation_lang
+            )
+        
+        # 只获取本会话中尚未生成过的市场（包括上次失败或被跳过的市场），按优先级排序
+        missing_markets = prioritize_markets(
+            result_store.missing_markets(seed, selected_markets, generation_lang, live),
+            by_popularity=prioritize_popular
+        )
+        run_status = {MARKET_DONE: 0, MARKET_FAILED: 0, MARKET_SKIPPED: 0}
         
         # 创建进度条
         progress_bar = st.progress(0)
         status_text = st.empty()
-        total_markets = len(selected_markets)
         
         try:
-            # 循环处理每个选中的市场
-            for idx, country in enumerate(selected_markets):
-                # 获取对应的语言
-                language = MARKET_CONFIG.get(country, "English")
-                
-                # 更新进度条和状态
-                progress = (idx + 1) / total_markets
-                progress_bar.progress(progress)
-                status_text.text(t["processing_status"].format(
+            # 每个市场完成时更新进度条和状态
+            def on_market_done(current, total, country, language):
+                progress_bar.progress(current / total)
+                status_text.text(t["market_done_status"].format(
                     country=country,
                     language=language,
-                    current=idx + 1,
-                    total=total_markets
+                    current=current,
+                    total=total
                 ))
-                
-                # 调用工具函数获取关键词
-                result = get_keywords(
+            
+            if missing_markets and use_job_queue:
+                # 后台运行：每个市场一个任务，按用户级别加权排队，结果在下方轮询
+                job_queue = get_job_queue()
+                ensure_workers(job_queue)
+                run_id = job_queue.submit_run(
                     api_key=api_key,
-                    seed_keyword=seed_keyword.strip(),
-                    target_language=language,
-                    target_country=country,
-                    interface_lang=st.session_state.interface_lang
+                    seed_keyword=seed,
+                    markets=[(country, MARKET_CONFIG.get(country, "English")) for country in missing_markets],
+                    interface_lang=generation_lang,
+                    tier=user_tier
                 )
+                st.session_state["job_run"] = {
+                    "id": run_id, "seed": seed, "interface_lang": generation_lang, "live": live,
+                }
+                st.query_params["run"] = run_id
+            elif missing_markets and stream_results:
+                # 结果表只在生成结果时才需要，延迟导入以加快首次加载和普通重跑
+                from results import KeywordTable, column_labels
                 
-                # 保存市场洞察
-                market_insight = result.get("market_insight", "")
-                all_market_insights.append({
-                    "country": country,
-                    "language": language,
-                    "insight": market_insight
-                })
+                # 流式模式：关键词一生成就显示在实时表格中
+                live_caption = st.empty()
+                live_table = st.empty()
+                live_rows = KeywordTable()
+                last_render = 0.0
+                completed = 0
                 
-                # 处理关键词列表，添加国家列
-                keywords_list = result.get("keywords", [])
-                for kw in keywords_list:
-                    kw_with_country = {
-                        "Country": country,
-                        t["col_keyword"]: kw.get("native_term", ""),
-                        t["col_translation"]: kw.get("english_translation", ""),
-                        t["col_intent"]: kw.get("intent_type", ""),
-                        t["col_hotness"]: kw.get("popularity_score", 50),
-                        t["col_reason"]: kw.get("rationale", "")
-                    }
-                    all_results.append(kw_with_country)
+                for country, language, event, payload in stream_keywords_for_markets(
+                    api_key=api_key,
+                    seed_keyword=seed,
+                    markets=missing_markets,
+                    interface_lang=generation_lang,
+                    max_workers=max_workers,
+                    time_budget=time_budget,
+                    stop_on_error=False,
+                    wire_format=wire_format
+                ):
+                    if event == "keyword":
+                        live_rows.add_result(country, language, {"keywords": [payload]})
+                        # 限制重绘频率，避免大量关键词时界面卡顿
+                        if time.monotonic() - last_render > 0.25:
+                            live_caption.caption(t["live_results_caption"])
+                            live_table.dataframe(
+                                live_rows.to_pandas(labels=column_labels(t)),
+                                use_container_width=True,
+                                hide_index=True
+                            )
+                            last_render = time.monotonic()
+                    elif event == "result":
+                        # 每个市场完成后立即保存，中途出错时已完成的市场不会丢失
+                        result_store.put(seed, country, language, generation_lang, live, payload)
+                        run_status[MARKET_DONE] += 1
+                        completed += 1
+                        on_market_done(completed, len(missing_markets), country, language)
+                    elif event == "error":
+                        # 单个市场出错不影响其它市场，记录原因以便续跑
+                        result_store.mark(seed, country, generation_lang, live, MARKET_FAILED, str(payload))
+                        run_status[MARKET_FAILED] += 1
+                        completed += 1
+                        on_market_done(completed, len(missing_markets), country, language)
+                    elif event == "skipped":
+                        result_store.mark(seed, country, generation_lang, live, MARKET_SKIPPED)
+                        run_status[MARKET_SKIPPED] += 1
+                
+                live_caption.empty()
+                live_table.empty()
+            elif missing_markets:
+                # 并发处理所有新增的市场，已完成的市场即使其它市场失败或超时也会保留
+                outcomes = generate_keywords_within_budget(
+                    api_key=api_key,
+                    seed_keyword=seed,
+                    markets=missing_markets,
+                    interface_lang=generation_lang,
+                    max_workers=max_workers,
+                    on_market_done=on_market_done,
+                    batch_by_language=batch_by_language,
+                    hedge=hedge_requests,
+                    time_budget=time_budget,
+                    wire_format=wire_format
+                )
+                for outcome in outcomes:
+                    run_status[outcome["status"]] += 1
+                    if outcome["status"] == MARKET_DONE:
+                        result_store.put(
+                            seed, outcome["country"], outcome["language"],
+                            generation_lang, live, outcome["result"]
+                        )
+                    else:
+                        result_store.mark(
+                            seed, outcome["country"], generation_lang, live,
+                            outcome["status"], outcome["error"]
+                        )
+            
+            result_store.set_view(seed, generation_lang, live)
             
             # 完成进度条
             progress_bar.progress(1.0)
             status_text.text(t["processing_complete"])
             
-            # 显示市场洞察摘要
-            st.markdown("---")
-            st.markdown(t["market_insights_title"])
-            for insight_info in all_market_insights:
-                with st.expander(f"📊 {insight_info['country']} ({insight_info['language']})"):
-                    st.info(insight_info['insight'])
+            # 部分市场失败或被跳过时提示，已完成的结果照常显示
+            if run_status[MARKET_FAILED] or run_status[MARKET_SKIPPED]:
+                st.warning(t["partial_run_warning"].format(
+                    done=run_status[MARKET_DONE],
+                    failed=run_status[MARKET_FAILED],
+                    skipped=run_status[MARKET_SKIPPED]
+                ))
+                if run_status[MARKET_FAILED]:
+                    st.info(t["info_error_help"])
+                    
+        except ValueError as e:
+            st.error(t["error_format"].format(error=str(e)))
+        except Exception as e:
+            st.error(t["error_generate"].format(error=str(e)))
+            st.info(t["info_error_help"])
+        finally:
+            # 清除进度条和状态文本
+            progress_bar.empty()
+            status_text.empty()
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def poll_job_run() -> None:
+    """
+    轮询后台运行：把新完成的市场写入会话结果存储，有新结果或运行结束时重跑整个页面刷新表格
+    """
+    job_run = st.session_state.get("job_run")
+    if not job_run:
+        return
+    job_queue = get_job_queue()
+    jobs = job_queue.run_jobs(job_run["id"])
+    seed, lang, live = job_run["seed"], job_run["interface_lang"], job_run["live"]
+    
+    updated = False
+    finished = 0
+    for job in jobs:
+        if job["status"] == JOB_DONE:
+            finished += 1
+            if result_store.get(seed, job["country"], lang, live) is None:
+                result_store.put(seed, job["country"], job["language"], lang, live, job["result"])
+                updated = True
+        elif job["status"] == JOB_FAILED:
+            finished += 1
+            if result_store.statuses(seed, [job["country"]], lang, live)[0][1] != MARKET_FAILED:
+                result_store.mark(seed, job["country"], lang, live, MARKET_FAILED, job["error"])
+                updated = True
+    
+    if finished == len(jobs):
+        # 运行结束：停止轮询并清除URL中的运行ID
+        st.session_state["job_run"] = None
+        if "run" in st.query_params:
+            del st.query_params["run"]
+        st.rerun()
+    
+    st.progress(finished / len(jobs) if jobs else 0.0, text=t["job_progress_status"].format(
+        done=finished, total=len(jobs), queued=job_queue.queue_position(job_run["id"])
+    ))
+    if not job_queue.live_workers(key_id=queue_key_id()):
+        if autospawn_enabled():
+            st.warning(t["job_starting_workers"])
+            ensure_workers(job_queue)
+        else:
+            st.warning(t["job_no_workers"])
+    if updated:
+        st.rerun()
+
+
+if st.session_state.get("job_run"):
+    poll_job_run()
+
+
+def request_resume(seed: str) -> None:
+    """续跑按钮回调：恢复对应的种子关键词，并在本次重跑中触发生成流程"""
+    st.session_state["seed_keyword"] = seed
+    st.session_state["resume_requested"] = True
+
+
+# 显示结果：每次重跑都从会话结果存储中按当前选择的市场重新组装，
+# 切换界面语言或移除市场不需要重新生成
+if result_store.view is not None:
+    view_seed, view_lang, view_live = result_store.view
+    market_results = result_store.assemble(view_seed, selected_markets, view_lang, view_live)
+    market_statuses = result_store.statuses(view_seed, selected_markets, view_lang, view_live)
+    pending_markets = [country for country, status, _ in market_statuses if status == STATUS_PENDING]
+    
+    # 有市场失败或被跳过时显示每个市场的状态，并提供续跑按钮（只会获取未完成的市场）
+    if any(status in (MARKET_FAILED, MARKET_SKIPPED) for _, status, _ in market_statuses):
+        done_count = sum(1 for _, status, _ in market_statuses if status == MARKET_DONE)
+        with st.expander(t["market_status_title"].format(done=done_count, total=len(market_statuses)), expanded=True):
+            for country, status, error in market_statuses:
+                line = f"**{country}**：{t['status_' + status]}"
+                if error:
+                    line += f" — {error}"
+                st.markdown(line)
+            st.button(t["resume_btn"], on_click=request_resume, args=(view_seed,), key="resume_markets")
+    
+    if market_results:
+        from results import KeywordTable, column_labels
+        
+        # 初始化结果表（列式存储，列标题在渲染时才本地化）
+        keyword_table = KeywordTable()
+        all_market_insights = []
+        
+        for market_result in market_results:
+            country = market_result["country"]
+            language = market_result["language"]
+            result = market_result["result"]
+            
+            # 保存市场洞察
+            market_insight = result.get("market_insight", "")
+            all_market_insights.append({
+                "country": country,
+                "language": language,
+                "insight": market_insight
+            })
             
-            # 合并所有结果到一个DataFrame
-            if all_results:
-                st.markdown(t["keywords_list_title"])
-                
-                df = pd.DataFrame(all_results)
-                
-                # 按AI Hotness降序排序（流行度高的排在前面）
-                df = df.sort_values(by=t["col_hotness"], ascending=False)
-                
-                # 重新排列列顺序，将Country放在最前面
-                column_order = ["Country", t["col_keyword"], t["col_translation"], t["col_intent"], t["col_hotness"], t["col_reason"]]
-                df = df[column_order]
-                
-                # 重置索引
-                df = df.reset_index(drop=True)
-                
-                # 添加序号列
-                df.insert(0, t["col_序号"], range(1, len(df) + 1))
-                
-                # 显示说明信息
-                st.caption(t["hotness_caption"])
-                
-                # 显示表格
+            # 处理关键词列表
+            keyword_table.add_result(country, language, result)
+        
+        # 显示市场洞察摘要
+        st.markdown("---")
+        st.markdown(t["market_insights_title"])
+        for insight_info in all_market_insights:
+            with st.expander(f"📊 {insight_info['country']} ({insight_info['language']})"):
+                st.info(insight_info['insight'])
+        
+        # 新选择的市场尚未生成时提示用户（后台运行进行中时由进度条显示）
+        if pending_markets and not st.session_state.get("job_run"):
+            st.info(t["pending_markets_info"].format(markets=", ".join(pending_markets)))
+        
+        # 合并所有结果到一个DataFrame
+        if len(keyword_table):
+            st.markdown(t["keywords_list_title"])
+            
+            # 按AI Hotness降序排序（流行度高的排在前面），Country在最前面，并添加序号列
+            with tracing.span("build_table", rows=len(keyword_table)):
+                table_view = {
+                    "labels": column_labels(t),
+                    "order": keyword_table.argsort_by_score(),
+                    "number_label": t["col_序号"]
+                }
+                df = keyword_table.to_pandas(**table_view)
+            
+            # 显示说明信息
+            st.caption(t["hotness_caption"])
+            
+            # 显示表格
+            with tracing.span("render_table", rows=len(df)):
                 st.dataframe(
                     df,
                     use_container_width=True,
@@ -328,42 +703,92 @@ if generate_button:
                         )
                     }
                 )
+            
+            # 显示统计信息
+            shown_markets = [market_result["country"] for market_result in market_results]
+            st.markdown(t["total_stats"].format(count=len(df), markets=len(shown_markets)))
+            
+            # 添加下载按钮（仅VIP用户可用）
+            if user_tier == "vip":
+                from export import EXPORT_FORMATS, available_export_formats, export_bytes
                 
-                # 显示统计信息
-                st.markdown(t["total_stats"].format(count=len(df), markets=len(selected_markets)))
+                countries_str = "_".join(shown_markets[:3])  # 限制文件名长度
+                if len(shown_markets) > 3:
+                    countries_str += f"_and_{len(shown_markets)-3}_more"
                 
-                # 添加下载按钮（仅VIP用户可用）
-                if user_tier == "vip":
-                    csv = df.to_csv(index=False).encode('utf-8-sig')
-                    countries_str = "_".join(selected_markets[:3])  # 限制文件名长度
-                    if len(selected_markets) > 3:
-                        countries_str += f"_and_{len(selected_markets)-3}_more"
-                    st.download_button(
-                        label=t["download_btn"],
-                        data=csv,
-                        file_name=f"{seed_keyword}_{countries_str}_keywords.csv",
-                        mime="text/csv"
+                # 文件内容在点击下载时才分块生成，普通重跑不再序列化整张表
+                # 未安装对应可选依赖的格式不显示按钮，避免点击后才报ImportError
+                download_formats = [
+                    (fmt, label_key) for fmt, label_key in (
+                        ("csv", "download_btn"),
+                        ("parquet", "download_parquet_btn"),
+                        ("xlsx", "download_xlsx_btn")
                     )
-                else:
-                    st.info("💡 Upgrade to VIP to export data as CSV.")
+                    if fmt in available_export_formats()
+                ]
+                download_columns = st.columns(len(download_formats))
+                for column, (fmt, label_key) in zip(download_columns, download_formats):
+                    mime, extension = EXPORT_FORMATS[fmt]
+                    with column:
+                        st.download_button(
+                            label=t[label_key],
+                            data=lambda fmt=fmt: export_bytes(keyword_table, fmt, **table_view),
+                            file_name=f"{view_seed}_{countries_str}_keywords{extension}",
+                            mime=mime,
+                            key=f"download_{fmt}"
+                        )
             else:
-                st.warning(t["warning_no_keywords"])
-            
-            # 清除进度条和状态文本
-            progress_bar.empty()
-            status_text.empty()
-                    
-        except ValueError as e:
-            st.error(t["error_format"].format(error=str(e)))
-            progress_bar.empty()
-            status_text.empty()
-        except Exception as e:
-            st.error(t["error_generate"].format(error=str(e)))
-            st.info(t["info_error_help"])
-            progress_bar.empty()
-            status_text.empty()
+                st.info("💡 Upgrade to VIP to export data as CSV.")
+        else:
+            st.warning(t["warning_no_keywords"])
 
 # 页面底部的说明
 st.markdown("---")
 with st.expander(t["about_title"]):
     st.markdown(t["about_content"])
+
+# 结束本次运行的链路和采样分析（每次运行单独采样，只保留最近一次）
+if run_trace is not None:
+    st.session_state["last_trace_id"] = tracing.end_trace(run_trace)
+if run_profiler is not None:
+    st.session_state["last_profile"] = run_profiler.stop().folded()
+
+# 最近一次运行的链路：各阶段耗时和导出（仅VIP/管理员可见，追加在侧边栏末尾）
+last_trace = tracing.get_tracer().trace(st.session_state.get("last_trace_id") or "")
+if user_tier == "vip" and (last_trace or st.session_state.get("last_profile")):
+    with st.sidebar:
+        with st.expander(t["trace_panel_title"]):
+            if last_trace:
+                import pandas as pd
+                st.dataframe(
+                    pd.DataFrame(tracing.summarize(last_trace)),
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        column: st.column_config.NumberColumn(column, format="%.3fs")
+                        for column in ("total", "max")
+                    }
+                )
+                st.caption(t["trace_panel_caption"])
+                st.download_button(
+                    label=t["trace_download_chrome"],
+                    data=tracing.to_chrome_json(last_trace),
+                    file_name="keyword_trace.json",
+                    mime="application/json",
+                    key="download_trace_chrome"
+                )
+                st.download_button(
+                    label=t["trace_download_otlp"],
+                    data=tracing.to_otlp_json(last_trace),
+                    file_name="keyword_trace.otlp.json",
+                    mime="application/json",
+                    key="download_trace_otlp"
+                )
+            if st.session_state.get("last_profile"):
+                st.download_button(
+                    label=t["profile_download"],
+                    data=st.session_state["last_profile"],
+                    file_name="keyword_profile.folded",
+                    mime="text/plain",
+                    key="download_profile"
+                )
@@ -0,0 +1,145 @@
+"""
+种子近似匹配索引基准测试
+用常见电商词汇随机组合出大量种子（词汇重叠多，常见三元组的倒排表很长，接近真实情况中最难的分布），
+报告建索引耗时、查找的p50/p99延迟和内存占用，并检查几组典型的近似种子能否命中
+
+用法示例:
+    python benchmarks/bench_seed_index.py
+    python benchmarks/bench_seed_index.py --seeds 100000 --lookups 5000 --threshold 0.8
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from metrics import percentile  # noqa: E402
+from seed_index import SeedIndex  # noqa: E402
+
+MODIFIERS = (
+    "best cheap wireless portable electric smart mini large small outdoor indoor kids mens womens "
+    "professional heavy duty waterproof organic stainless steel bamboo leather cordless rechargeable "
+    "foldable adjustable ergonomic vintage modern luxury budget lightweight compact automatic"
+).split()
+PRODUCTS = (
+    "robot lawn mower coffee maker running shoes yoga mat standing desk garden hose air fryer "
+    "phone case water bottle office chair gaming mouse mechanical keyboard bluetooth speaker "
+    "noise cancelling headphones electric toothbrush hair dryer vacuum cleaner dog bed cat tree "
+    "camping tent hiking boots backpack sunglasses watch strap laptop stand led strip lights "
+    "kitchen knife set blender espresso machine pressure cooker rice cooker baby stroller car seat "
+    "bike helmet tennis racket golf balls fishing rod"
+).split()
+SUFFIXES = "for sale near me reviews 2024 deals online for women for men for kids under 100 set kit".split()
+
+# 应当命中的近似种子（原种子, 变体）
+NEAR_DUPLICATES = (
+    ("robot lawn mower", "Robot-Lawn-Mowers "),
+    ("robot lawn mower", "robot lawnmower"),
+    ("standing desk", "Standing  Desks"),
+    ("noise cancelling headphones", "noise-cancelling headphone"),
+    ("kitchen knife set", "kitchen knife sets"),
+)
+
+# 不应命中的种子（原种子, 意思不同的相近写法）：复数词干化不能把它们合并
+DISTINCT_SEEDS = (
+    ("new", "news"),
+    ("glass", "glasses"),
+    ("reading glass", "reading glasses"),
+    ("short", "shorts"),
+    ("good", "goods"),
+    ("serie", "series"),
+)
+
+
+def make_seeds(count: int, rng: random.Random) -> List[str]:
+    seeds = set()
+    while len(seeds) < count:
+        words = []
+        if rng.random() < 0.6:
+            words.append(rng.choice(MODIFIERS))
+        words.extend(rng.sample(PRODUCTS, rng.randint(1, 3)))
+        if rng.random() < 0.4:
+            words.append(rng.choice(SUFFIXES))
+        seeds.add(" ".join(words))
+    return list(seeds)
+
+
+def _rss_mb() -> float:
+    """当前进程的常驻内存（MB，读取/proc；其它平台返回0）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return 0.0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="种子近似匹配索引基准测试")
+    parser.add_argument("--seeds", type=int, default=100_000, help="索引中的种子数")
+    parser.add_argument("--lookups", type=int, default=5000, help="查找次数")
+    parser.add_argument("--threshold", type=float, default=None, help="相似度阈值（默认使用索引的默认值）")
+    parser.add_argument("--random-seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.random_seed)
+    seeds = make_seeds(args.seeds, rng)
+
+    rss_before = _rss_mb()
+    kwargs = {"path": None}
+    if args.threshold is not None:
+        kwargs["threshold"] = args.threshold
+    index = SeedIndex(**kwargs)
+    started = time.perf_counter()
+    for seed in seeds:
+        index.add(seed)
+    for seed, _ in NEAR_DUPLICATES + DISTINCT_SEEDS:
+        index.add(seed)
+    add_seconds = time.perf_counter() - started
+    # 逐个添加时三元组顺序只在后台按翻倍节奏重建，这里同步重建一次（与重启后从磁盘载入时的状态相同）
+    started = time.perf_counter()
+    index.reorder()
+    reorder_seconds = time.perf_counter() - started
+    memory_mb = _rss_mb() - rss_before
+
+    # 查找：一半是已有种子的拼写变体（复数、连字符、大小写），一半是新组合
+    queries = []
+    for _ in range(args.lookups):
+        if rng.random() < 0.5:
+            seed = rng.choice(seeds)
+            queries.append(rng.choice((seed.title(), seed.replace(" ", "-"), seed + "s", seed.upper())))
+        else:
+            queries.append(make_seeds(1, rng)[0] + " " + rng.choice(SUFFIXES))
+    latencies = []
+    hits = 0
+    for query in queries:
+        started = time.perf_counter()
+        matches = index.similar(query)
+        latencies.append(time.perf_counter() - started)
+        hits += bool(matches)
+    latencies.sort()
+
+    print(f"种子数：{len(index)}  阈值：{index.threshold}")
+    print(
+        f"逐个添加：{add_seconds:.2f}s（含后台重建）  同步重建：{reorder_seconds:.2f}s  "
+        f"常驻内存增加：{memory_mb:.1f} MB"
+    )
+    print(
+        f"查找：p50 {percentile(latencies, 0.5) * 1000:.3f} ms  p99 {percentile(latencies, 0.99) * 1000:.3f} ms  "
+        f"max {latencies[-1] * 1000:.3f} ms  命中 {hits}/{len(queries)}"
+    )
+    failed = [variant for seed, variant in NEAR_DUPLICATES if seed not in dict(index.similar(variant))]
+    failed += [variant for seed, variant in DISTINCT_SEEDS if seed in dict(index.similar(variant))]
+    for seed, variant in NEAR_DUPLICATES + DISTINCT_SEEDS:
+        print(f"  {variant!r:32} -> {index.similar(variant)[:1]}")
+    if failed:
+        print(f"匹配结果不符合预期：{failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
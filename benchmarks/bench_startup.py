@@ -0,0 +1,136 @@
+"""
+冷启动与重跑基准测试
+1. 导入耗时：在全新子进程中导入streamlit和应用依赖，并列出被提前导入的重量级模块
+2. 重跑耗时：用Streamlit AppTest运行app.py，测量首次运行和侧边栏交互触发的重跑耗时，
+   多个会话依次交替重跑以模拟并发会话
+
+用法示例:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --reruns 50 --sessions 4 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from metrics import percentile  # noqa: E402
+
+# 启动时不应加载的重量级依赖
+HEAVY_MODULES = ("pandas", "openai", "supabase", "pyarrow")
+
+# AppTest使用的占位配置（Supabase客户端在登录前不会被创建）
+FAKE_SECRETS = {
+    "SUPABASE_URL": "http://127.0.0.1:9",
+    "SUPABASE_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.bench",
+}
+
+_IMPORT_PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import streamlit
+after_streamlit = time.perf_counter()
+import metrics, utils
+finished = time.perf_counter()
+print(json.dumps({
+    "streamlit_ms": (after_streamlit - started) * 1000,
+    "app_modules_ms": (finished - after_streamlit) * 1000,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def bench_imports(repeat: int) -> Dict:
+    """在全新子进程中测量导入耗时（取中位数）"""
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-c", _IMPORT_PROBE % (HEAVY_MODULES,)], cwd=ROOT, text=True
+        )
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "streamlit_ms": round(statistics.median(s["streamlit_ms"] for s in samples), 1),
+        "app_modules_ms": round(statistics.median(s["app_modules_ms"] for s in samples), 1),
+        "heavy_modules_loaded": samples[-1]["loaded"],
+    }
+
+
+def _new_session():
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    for name, value in FAKE_SECRETS.items():
+        at.secrets[name] = value
+    return at
+
+
+def bench_reruns(reruns: int, sessions: int) -> Dict:
+    """
+    测量首次运行和重跑耗时
+    每次重跑切换一个侧边栏控件（并发数滑块），与用户调整侧边栏时的开销一致
+    """
+    cold_started = time.perf_counter()
+    apps = [_new_session()]
+    apps[0].run()
+    cold_ms = (time.perf_counter() - cold_started) * 1000
+    if apps[0].exception:
+        raise RuntimeError(f"app.py运行出错：{apps[0].exception}")
+
+    warm_first = []
+    for _ in range(sessions - 1):
+        at = _new_session()
+        started = time.perf_counter()
+        at.run()
+        warm_first.append((time.perf_counter() - started) * 1000)
+        apps.append(at)
+
+    rerun_ms = []
+    for i in range(reruns):
+        at = apps[i % len(apps)]
+        slider = at.slider[0]
+        started = time.perf_counter()
+        slider.set_value(1 + (slider.value % slider.max)).run()
+        rerun_ms.append((time.perf_counter() - started) * 1000)
+    rerun_ms.sort()
+
+    return {
+        "cold_run_ms": round(cold_ms, 1),
+        "new_session_first_run_ms": round(statistics.median(warm_first), 1) if warm_first else None,
+        "reruns": len(rerun_ms),
+        "rerun_p50_ms": round(percentile(rerun_ms, 0.50), 1),
+        "rerun_p99_ms": round(percentile(rerun_ms, 0.99), 1),
+        "heavy_modules_loaded_after_reruns": [m for m in HEAVY_MODULES if m in sys.modules],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Streamlit应用冷启动与重跑耗时基准测试")
+    parser.add_argument("--import-repeat", type=int, default=5, help="导入耗时测量的子进程次数")
+    parser.add_argument("--reruns", type=int, default=30, help="侧边栏交互重跑次数")
+    parser.add_argument("--sessions", type=int, default=3, help="交替重跑的会话数")
+    parser.add_argument("--json", dest="json_path", default=None, help="把结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    report = {"imports": bench_imports(args.import_repeat)}
+    # 重跑测试在本进程中进行，不读取真实的secrets.toml，也不访问DeepSeek
+    os.environ.pop("DEEPSEEK_API_KEY", None)
+    report["reruns"] = bench_reruns(args.reruns, max(1, args.sessions))
+
+    for section, values in report.items():
+        print(f"[{section}]")
+        for name, value in values.items():
+            print(f"  {name}: {value}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+吞吐量基准测试
+在本地模拟DeepSeek服务（mock_server.py）上驱动get_keywords和多市场流程，
+报告每秒请求数、p50/p99延迟和内存占用，结果可写入JSON以便跨提交对比
+
+用法示例:
+    python benchmarks/bench_throughput.py
+    python benchmarks/bench_throughput.py --latency lognormal:0.8,0.5 --rate-limit-rate 0.05 --json bench.json
+    python benchmarks/bench_throughput.py --base-url http://127.0.0.1:8765 --scenarios markets,stream
+    python benchmarks/bench_throughput.py --latency lognormal:0.2,1.0 --scenarios concurrent,hedged --requests 200
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from metrics import percentile  # noqa: E402
+
+SCENARIOS = ("single", "concurrent", "hedged", "markets", "batched", "stream")
+
+BENCH_API_KEY = "sk-bench"
+
+
+def _max_rss_mb() -> float:
+    """进程峰值常驻内存（MB）"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenario(name: str, requests: int, fn: Callable[[], List[float]]) -> Dict:
+    """
+    执行一个场景并汇总结果
+    fn返回每个请求（或每个市场）的延迟列表；requests为该场景发出的逻辑请求数
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    try:
+        latencies = fn()
+    except Exception as e:
+        print(f"  [{name}] 失败：{e}", file=sys.stderr)
+        latencies = []
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    result = {
+        "scenario": name,
+        "requests": len(latencies),
+        "errors": max(0, requests - len(latencies)),
+        "seconds": round(elapsed, 3),
+        "req_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_rss_mb": round(_max_rss_mb(), 1),
+    }
+    if tracing:
+        result["heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+    return result
+
+
+def bench_single(utils, count: int) -> List[float]:
+    """串行调用get_keywords（不走响应缓存）"""
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        utils.get_keywords(BENCH_API_KEY, f"bench single {i}", "German", "Germany", use_cache=False)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def bench_concurrent(utils, count: int, workers: int, hedge: bool = False) -> List[float]:
+    """多线程并发调用get_keywords（不走响应缓存）；hedge为True时启用对冲请求"""
+    markets = list(utils.MARKET_CONFIG.items())
+
+    def call(i: int) -> float:
+        country, language = markets[i % len(markets)]
+        started = time.perf_counter()
+        utils.get_keywords(BENCH_API_KEY, f"bench concurrent {i}", language, country, use_cache=False, hedge=hedge)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(call, range(count)))
+
+
+def bench_markets(utils, runs: int, workers: int, batch_by_language: bool) -> List[float]:
+    """
+    多市场流程：每轮使用新的种子关键词（避免命中缓存），对全部市场调用generate_keywords_for_markets
+    记录每个市场从本轮开始到完成的耗时
+    """
+    markets = list(utils.MARKET_CONFIG.keys())
+    label = "batched" if batch_by_language else "markets"
+    latencies = []
+    for run in range(runs):
+        started = time.perf_counter()
+
+        def on_market_done(completed, total, country, language):
+            latencies.append(time.perf_counter() - started)
+
+        utils.generate_keywords_for_markets(
+            BENCH_API_KEY, f"bench {label} {run} {time.time_ns()}", markets,
+            max_workers=workers, on_market_done=on_market_done, batch_by_language=batch_by_language
+        )
+    return latencies
+
+
+def bench_stream(utils, runs: int, workers: int) -> List[float]:
+    """流式多市场流程：记录每个市场第一个关键词到达的时间（首个结果延迟）"""
+    markets = list(utils.MARKET_CONFIG.keys())
+    latencies = []
+    for run in range(runs):
+        started = time.perf_counter()
+        seen = set()
+        for country, _, event, _ in utils.stream_keywords_for_markets(
+            BENCH_API_KEY, f"bench stream {run} {time.time_ns()}", markets, max_workers=workers
+        ):
+            if event == "keyword" and country not in seen:
+                seen.add(country)
+                latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def print_table(results: List[Dict]) -> None:
+    columns = ["scenario", "requests", "errors", "seconds", "req_per_s", "p50_ms", "p99_ms", "max_rss_mb"]
+    if any("heap_peak_mb" in r for r in results):
+        columns.append("heap_peak_mb")
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in results)) for c in columns}
+    print("  ".join(c.rjust(widths[c]) for c in columns))
+    for r in results:
+        print("  ".join(str(r.get(c, "")).rjust(widths[c]) for c in columns))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="关键词生成吞吐量基准测试（基于本地模拟DeepSeek服务）")
+    parser.add_argument("--base-url", default=None, help="使用已运行的模拟服务；默认在进程内启动一个")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"要运行的场景（{','.join(SCENARIOS)}）")
+    parser.add_argument("--requests", type=int, default=40, help="single/concurrent场景的请求数")
+    parser.add_argument("--runs", type=int, default=2, help="markets/batched/stream场景的轮数")
+    parser.add_argument("--workers", type=int, default=8, help="并发数")
+    parser.add_argument("--latency", default="lognormal:0.2,0.4", help="模拟服务的延迟分布")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="模拟服务流式分块间隔（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="模拟服务返回截断或带代码块标记内容的概率")
+    parser.add_argument("--keywords", type=int, default=6, help="每个市场返回的关键词数量")
+    parser.add_argument("--rpm", type=float, default=None, help="覆盖限流器的每分钟请求数")
+    parser.add_argument("--hedge-min-delay", type=float, default=0.1,
+                        help="hedged场景的最小对冲延迟（秒），模拟服务的延迟远低于线上时需要调小")
+    parser.add_argument("--tracemalloc", action="store_true", help="同时统计Python堆内存峰值（会降低吞吐量）")
+    parser.add_argument("--json", dest="json_path", default=None, help="把结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景：{', '.join(sorted(unknown))}")
+
+    from mock_server import MockConfig, MockDeepSeekServer
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = MockDeepSeekServer(MockConfig(
+            latency=args.latency,
+            token_delay=args.token_delay,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            retry_after=args.retry_after,
+            malformed_rate=args.malformed_rate,
+            keywords_per_market=args.keywords,
+            seed=0
+        )).start()
+        base_url = server.base_url
+
+    # 必须在导入utils之前设置：客户端地址和缓存路径在导入时读取
+    os.environ["DEEPSEEK_BASE_URL"] = base_url
+    os.environ["KEYWORD_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="kw-bench-"), "cache.sqlite3")
+
+    import utils
+    from hedging import configure_hedging
+    from rate_limit import configure_rate_limiter
+
+    limiter_kwargs = {"backoff_base": 0.1, "max_concurrency": max(args.workers, 8)}
+    if args.rpm:
+        limiter_kwargs["requests_per_minute"] = args.rpm
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    results = []
+    try:
+        for name in scenarios:
+            # 每个场景使用新的限流器，避免上一个场景的令牌桶状态影响结果
+            configure_rate_limiter(**limiter_kwargs)
+            configure_hedging(min_delay=args.hedge_min_delay)
+            print(f"运行场景 {name} ...", file=sys.stderr)
+            if name == "single":
+                results.append(run_scenario(name, args.requests, lambda: bench_single(utils, args.requests)))
+            elif name in ("concurrent", "hedged"):
+                results.append(run_scenario(
+                    name, args.requests, lambda: bench_concurrent(utils, args.requests, args.workers, name == "hedged")
+                ))
+            elif name in ("markets", "batched"):
+                total = args.runs * len(utils.MARKET_CONFIG)
+                results.append(run_scenario(
+                    name, total, lambda: bench_markets(utils, args.runs, args.workers, name == "batched")
+                ))
+            elif name == "stream":
+                total = args.runs * len(utils.MARKET_CONFIG)
+                results.append(run_scenario(name, total, lambda: bench_stream(utils, args.runs, args.workers)))
+    finally:
+        if server is not None:
+            server.stop()
+
+    print_table(results)
+    if args.json_path:
+        report = {
+            "revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {k: v for k, v in vars(args).items() if k != "json_path"},
+            "results": results,
+        }
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+响应线格式基准测试
+在本地模拟DeepSeek服务上分别用完整、紧凑、精简三种线格式请求同一批市场，
+报告每个市场的平均提示词/输出令牌、p50/p99延迟以及流式模式下首个关键词的延迟，
+并给出相对完整格式的节省比例
+
+模拟服务按每个输出令牌固定的生成时间（--token-delay）计算响应时间，所以延迟随输出长度变化，
+与真实模型的解码耗时一致；--rationale-words 控制完整格式中每条理由的长度
+
+用法示例:
+    python benchmarks/bench_wire_format.py
+    python benchmarks/bench_wire_format.py --requests 60 --token-delay 0.02 --rationale-words 25
+    python benchmarks/bench_wire_format.py --base-url http://127.0.0.1:8765 --json wire.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from metrics import percentile  # noqa: E402
+
+BENCH_API_KEY = "sk-bench"
+
+KEYWORD_FIELDS = {"native_term", "english_translation", "intent_type", "popularity_score", "rationale"}
+
+
+def _tokens(metrics, kind: str) -> float:
+    return sum(value for labels, value in metrics.TOKENS.items() if labels["kind"] == kind)
+
+
+def bench_format(utils, metrics, wire_format: str, requests: int, workers: int) -> Dict:
+    """用一种线格式并发请求requests个市场（不走响应缓存），再以流式模式请求同样多的市场，汇总令牌和延迟"""
+    markets = list(utils.MARKET_CONFIG.items())
+    prompt_before = _tokens(metrics, "prompt")
+    completion_before = _tokens(metrics, "completion")
+
+    def call(i: int) -> float:
+        country, language = markets[i % len(markets)]
+        started = time.perf_counter()
+        result = utils.get_keywords(
+            BENCH_API_KEY, f"bench wire {i}", language, country, use_cache=False, wire_format=wire_format
+        )
+        elapsed = time.perf_counter() - started
+        # 紧凑格式的结果展开后应与完整格式结构相同
+        if not result["keywords"] or set(result["keywords"][0]) != KEYWORD_FIELDS:
+            raise ValueError(f"{wire_format} 格式展开后的结果结构不完整：{result['keywords'][:1]}")
+        return elapsed
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = sorted(executor.map(call, range(requests)))
+
+    prompt_tokens = _tokens(metrics, "prompt") - prompt_before
+    completion_tokens = _tokens(metrics, "completion") - completion_before
+
+    # 流式模式：记录每个市场第一个关键词到达和整个市场完成的时间
+    def stream(i: int) -> Tuple[float, float]:
+        country, language = markets[i % len(markets)]
+        started = time.perf_counter()
+        first = None
+        for event, _ in utils.stream_keywords(
+            BENCH_API_KEY, f"bench wire stream {i}", language, country, use_cache=False, wire_format=wire_format
+        ):
+            if event == "keyword" and first is None:
+                first = time.perf_counter() - started
+        return first or 0.0, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        timings = list(executor.map(stream, range(requests)))
+    first_keyword = sorted(first for first, _ in timings)
+    stream_done = sorted(done for _, done in timings)
+
+    return {
+        "format": wire_format,
+        "requests": len(latencies),
+        "prompt_tok": round(prompt_tokens / max(len(latencies), 1), 1),
+        "output_tok": round(completion_tokens / max(len(latencies), 1), 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "stream_first_ms": round(percentile(first_keyword, 0.50) * 1000, 1),
+        "stream_done_ms": round(percentile(stream_done, 0.50) * 1000, 1),
+    }
+
+
+def add_savings(results: List[Dict]) -> None:
+    """为每种格式加上相对完整格式的输出令牌和p50延迟节省比例"""
+    baseline = next((r for r in results if r["format"] == "full"), None)
+    if baseline is None:
+        return
+    for r in results:
+        r["output_saved"] = f"{1 - r['output_tok'] / baseline['output_tok']:.0%}" if baseline["output_tok"] else "-"
+        r["p50_saved"] = f"{1 - r['p50_ms'] / baseline['p50_ms']:.0%}" if baseline["p50_ms"] else "-"
+
+
+def print_table(results: List[Dict]) -> None:
+    columns = list(results[0].keys())
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in results)) for c in columns}
+    print("  ".join(c.rjust(widths[c]) for c in columns))
+    for r in results:
+        print("  ".join(str(r.get(c, "")).rjust(widths[c]) for c in columns))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="响应线格式基准测试（基于本地模拟DeepSeek服务）")
+    parser.add_argument("--base-url", default=None, help="使用已运行的模拟服务；默认在进程内启动一个")
+    parser.add_argument("--formats", default="full,compact,minimal", help="要比较的线格式")
+    parser.add_argument("--requests", type=int, default=24, help="每种格式的请求数（非流式和流式各一轮）")
+    parser.add_argument("--workers", type=int, default=8, help="并发数")
+    parser.add_argument("--latency", default="fixed:0.3", help="模拟服务的首令牌延迟分布")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="模拟服务每个输出令牌的生成时间（秒）")
+    parser.add_argument("--keywords", type=int, default=7, help="每个市场返回的关键词数量")
+    parser.add_argument("--rationale-words", type=int, default=20, help="完整格式中每条理由的单词数")
+    parser.add_argument("--json", dest="json_path", default=None, help="把结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    from mock_server import MockConfig, MockDeepSeekServer
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = MockDeepSeekServer(MockConfig(
+            latency=args.latency,
+            token_delay=args.token_delay,
+            keywords_per_market=args.keywords,
+            rationale_words=args.rationale_words,
+            seed=0
+        )).start()
+        base_url = server.base_url
+
+    # 必须在导入utils之前设置：客户端地址和缓存路径在导入时读取
+    os.environ["DEEPSEEK_BASE_URL"] = base_url
+    bench_dir = tempfile.mkdtemp(prefix="kw-bench-")
+    os.environ["KEYWORD_CACHE_PATH"] = os.path.join(bench_dir, "cache.sqlite3")
+    os.environ["KEYWORD_SEED_INDEX_PATH"] = os.path.join(bench_dir, "seeds.sqlite3")
+
+    import metrics
+    import utils
+    from rate_limit import configure_rate_limiter
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = set(formats) - set(utils.WIRE_FORMATS)
+    if unknown:
+        parser.error(f"未知线格式：{', '.join(sorted(unknown))}")
+
+    results = []
+    try:
+        for wire_format in formats:
+            configure_rate_limiter(backoff_base=0.1, max_concurrency=max(args.workers, 8))
+            print(f"运行线格式 {wire_format} ...", file=sys.stderr)
+            results.append(bench_format(utils, metrics, wire_format, args.requests, args.workers))
+    finally:
+        if server is not None:
+            server.stop()
+
+    add_savings(results)
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "json_path"}, "results": results},
+                      f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
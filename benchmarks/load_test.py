@@ -0,0 +1,472 @@
+"""
+多会话负载测试
+在一个进程中模拟N个并发用户，每个用户用独立的Streamlit AppTest会话依次完成
+登录 → 选择市场 → 生成 → 导出CSV，逐级提高并发数，报告每一级的重跑延迟分位数、吞吐量
+以及每个会话的常驻内存增长，用来估计单个进程在重跑开始排队之前能承载多少会话
+
+DeepSeek请求发往进程内启动的本地模拟服务（mock_server.py），Supabase由本地的PostgREST替身服务
+代替（只实现users表的查询和插入），不会读取.streamlit/secrets.toml中的真实配置
+
+用法示例:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --users 1,4,8,16 --iterations 5 --latency lognormal:0.8,0.4
+    python benchmarks/load_test.py --users 8 --free-share 0.5 --repeat-seed-rate 0.3 --json load.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from metrics import percentile  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "app.py")
+BENCH_API_KEY = "sk-load-test"
+LOAD_TEST_PASSWORD = "loadtest"
+# 替身服务不校验密钥，只需满足supabase客户端对JWT格式的检查
+STAND_IN_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.load-test"
+
+# 种子关键词（--repeat-seed-rate的比例从中重复选取，以覆盖缓存命中的路径）
+SEEDS = (
+    "robot lawn mower", "standing desk", "air fryer", "running shoes", "yoga mat",
+    "noise cancelling headphones", "espresso machine", "camping tent", "office chair", "dog bed",
+)
+
+
+# ==================== Supabase替身 ====================
+
+class _SupabaseHandler(BaseHTTPRequestHandler):
+    """PostgREST子集：GET /rest/v1/<表>?列=eq.值 查询，POST /rest/v1/<表> 插入"""
+
+    protocol_version = "HTTP/1.1"
+    stand_in: "SupabaseStandIn" = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _table(self) -> Optional[str]:
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if len(parts) == 3 and parts[:2] == ["rest", "v1"]:
+            return parts[2]
+        return None
+
+    def _send_json(self, status: int, body) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        table = self._table()
+        if table is None:
+            self._send_json(404, {"message": "not found"})
+            return
+        self.stand_in.delay()
+        filters, columns = {}, None
+        for name, value in parse_qsl(urlsplit(self.path).query):
+            if name == "select":
+                columns = None if value == "*" else value.split(",")
+            elif value.startswith("eq."):
+                filters[name] = value[3:]
+        rows = self.stand_in.select(table, filters)
+        if columns is not None:
+            rows = [{c: row.get(c) for c in columns} for row in rows]
+        self._send_json(200, rows)
+
+    def do_POST(self):
+        table = self._table()
+        if table is None:
+            self._send_json(404, {"message": "not found"})
+            return
+        self.stand_in.delay()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        rows = body if isinstance(body, list) else [body]
+        self._send_json(201, [self.stand_in.insert(table, row) for row in rows])
+
+
+class SupabaseStandIn:
+    """
+    本地Supabase替身
+    预置一个VIP账号admin和若干普通账号user0, user1, ...（密码均为LOAD_TEST_PASSWORD）
+    """
+
+    def __init__(self, free_users: int = 0, latency: str = "fixed:0", host: str = "127.0.0.1", port: int = 0):
+        from mock_server import LatencyDistribution
+        self.latency = LatencyDistribution(latency)
+        self.rng = random.Random(0)
+        self.lock = threading.Lock()
+        self.tables: Dict[str, List[Dict]] = {"users": [
+            {"id": 1, "username": "admin", "name": "Load Test VIP",
+             "email": "admin@example.com", "password": LOAD_TEST_PASSWORD}
+        ]}
+        for i in range(free_users):
+            self.insert("users", {"username": f"user{i}", "name": f"Load Test {i}",
+                                  "email": f"user{i}@example.com", "password": LOAD_TEST_PASSWORD})
+        handler = type("SupabaseHandler", (_SupabaseHandler,), {"stand_in": self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self) -> None:
+        with self.lock:
+            seconds = self.latency.sample(self.rng)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def select(self, table: str, filters: Dict[str, str]) -> List[Dict]:
+        with self.lock:
+            return [dict(row) for row in self.tables.get(table, [])
+                    if all(str(row.get(k)) == v for k, v in filters.items())]
+
+    def insert(self, table: str, row: Dict) -> Dict:
+        with self.lock:
+            rows = self.tables.setdefault(table, [])
+            row = dict(row, id=len(rows) + 1)
+            rows.append(row)
+            return dict(row)
+
+    def start(self) -> "SupabaseStandIn":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="supabase-stand-in", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# ==================== 并发AppTest ====================
+
+def install_concurrent_apptest(secrets: Dict[str, str]) -> None:
+    """
+    让多个AppTest会话可以在不同线程中同时运行
+    AppTest按单会话测试设计，每次运行都会替换进程级的全局状态，这里只修补测试框架本身：
+    1. 所有会话共用一个运行时替身（与真实服务器一样只有一个媒体文件管理器和缓存管理器），
+       每次运行时对Runtime._instance的替换和清空只作用在一个子类上，不影响其它正在运行的会话
+    2. 所有会话共用一个脚本缓存（与真实服务器相同，AppTest和LocalScriptRunner原本每次运行各建一个），避免多个线程同时编译app.py
+       （Python 3.11的ast在多线程并发编译时会报 "AST constructor recursion depth mismatch"）
+    3. 每个会话使用自己的会话ID（AppTest固定为同一个ID，下载文件会被其它会话的重跑清理掉）
+    4. secrets和global.appTest配置在全局设置一次，AppTest不再逐次替换和恢复
+    """
+    from unittest.mock import MagicMock
+
+    import streamlit as st
+    from streamlit import config
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    required = ("Runtime", "ScriptCache", "LocalScriptRunner", "MediaFileManager", "MemoryMediaFileStorage",
+                "DataframeSourceManager", "MemoryCacheStorageManager", "BidiComponentManager")
+    missing = [name for name in required if not hasattr(app_test, name)]
+    if not hasattr(local_script_runner, "ScriptCache"):
+        missing.append("local_script_runner.ScriptCache")
+    if missing:
+        raise RuntimeError(f"当前Streamlit版本的AppTest缺少 {', '.join(missing)}，无法并发运行多个会话")
+
+    real_runtime = app_test.Runtime
+    if getattr(real_runtime, "_load_test_shim", False):
+        return
+
+    runtime = MagicMock(spec=real_runtime)
+    runtime.media_file_mgr = app_test.MediaFileManager(app_test.MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = app_test.DataframeSourceManager()
+    runtime.cache_storage_manager = app_test.MemoryCacheStorageManager()
+    components = app_test.BidiComponentManager()
+    components.discover_and_register_components(start_file_watching=False)
+    runtime.bidi_component_registry = components
+    real_runtime._instance = runtime
+
+    app_test.Runtime = type("Runtime", (real_runtime,), {"_load_test_shim": True})
+    script_cache = app_test.ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+    class SessionScriptRunner(app_test.LocalScriptRunner):
+        def __init__(self, script_path, session_state, *args, **kwargs):
+            super().__init__(script_path, session_state, *args, **kwargs)
+            self._session_id = f"load-test-{id(session_state):x}"
+
+    app_test.LocalScriptRunner = SessionScriptRunner
+
+    shared_secrets = Secrets()
+    shared_secrets._secrets = dict(secrets)
+    st.secrets = shared_secrets
+    config.set_option("global.appTest", True)
+
+
+# ==================== 模拟用户 ====================
+
+class SimulatedUser:
+    """
+    一个模拟用户：独立的AppTest会话，记录每次交互（一次重跑）的耗时
+    VIP用户（admin）可以导出，普通用户最多选择5个市场且没有导出按钮
+    """
+
+    def __init__(self, index: int, username: str, args, rng: random.Random):
+        self.index = index
+        self.username = username
+        self.args = args
+        self.rng = rng
+        self.samples: List[Tuple[str, float]] = []
+        self.at = None
+
+    def _run(self, action: str, target=None) -> None:
+        started = time.perf_counter()
+        (target or self.at).run()
+        self.samples.append((action, time.perf_counter() - started))
+        if self.at.exception:
+            raise RuntimeError(f"{self.username} 在 {action} 时出错：{self.at.exception[0].message}")
+
+    def _think(self) -> None:
+        if self.args.think_time > 0:
+            time.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+
+    def login(self) -> None:
+        from streamlit.testing.v1 import AppTest
+        from utils import TRANSLATIONS
+
+        t = TRANSLATIONS["Chinese"]
+        self.at = AppTest.from_file(APP_PATH, default_timeout=self.args.timeout)
+        self._run("load")
+        self._think()
+        # 登录表单在注册表单之前，取第一个同名输入框
+        next(w for w in self.at.text_input if w.label == "Username / 用户名").input(self.username)
+        next(w for w in self.at.text_input if w.label == "Password / 密码").input(LOAD_TEST_PASSWORD)
+        submit = next(b for b in self.at.button if b.label == "Login / 登录")
+        self._run("login", submit.click())
+        if self.at.session_state["user"] is None:
+            raise RuntimeError(f"{self.username} 登录失败：{[e.value for e in self.at.error]}")
+        self._think()
+        api_key = next(w for w in self.at.text_input if w.label == t["api_key_label"])
+        api_key.input(BENCH_API_KEY)
+        # 关闭流式生成时使用非流式路径
+        if self.args.no_stream:
+            next(c for c in self.at.checkbox if c.label == t["stream_results_label"]).uncheck()
+        self._run("api_key")
+
+    def journey(self, iteration: int) -> None:
+        """选择市场 → 生成 → 导出（VIP）"""
+        from streamlit.runtime import Runtime
+        from utils import MARKET_NAMES, TRANSLATIONS
+
+        t = TRANSLATIONS["Chinese"]
+        max_markets = 99 if self.username == "admin" else 5
+        count = min(self.args.markets, max_markets, len(MARKET_NAMES))
+        self._think()
+        self.at.multiselect(key="selected_markets").set_value(self.rng.sample(MARKET_NAMES, count))
+        if self.rng.random() < self.args.repeat_seed_rate:
+            seed = self.rng.choice(SEEDS)
+        else:
+            seed = f"{self.rng.choice(SEEDS)} {self.username} {iteration}"
+        self.at.text_input(key="seed_keyword").input(seed)
+        self._run("select")
+
+        self._think()
+        generate = next(b for b in self.at.button if b.label == t["generate_btn"])
+        self._run("generate", generate.click())
+        if not self.at.dataframe:
+            raise RuntimeError(f"{self.username} 生成后没有结果表：{[e.value for e in self.at.error]}")
+
+        if self.username == "admin":
+            self._think()
+            # 与服务器处理下载请求相同：点击时才执行导出函数生成文件内容
+            export = next(
+                d for d in self.at.get("download_button")
+                if d.proto.label == t["download_btn"] and d.proto.deferred_file_id
+            )
+            started = time.perf_counter()
+            Runtime.instance().media_file_mgr.execute_deferred(export.proto.deferred_file_id)
+            self.samples.append(("export", time.perf_counter() - started))
+
+
+def warm_up(args) -> None:
+    """
+    预热：用一个不计入结果的会话走一遍完整流程
+    首次运行要编译app.py并导入pandas、openai、supabase等依赖，这些一次性开销不属于任何一级并发
+    """
+    user = SimulatedUser(-1, "admin", args, random.Random(args.random_seed))
+    user.login()
+    user.journey(-1)
+
+
+def run_level(users: int, args, level_index: int) -> Dict:
+    """用users个并发用户各完成一次登录和args.iterations次生成流程"""
+    free_users = int(round(users * args.free_share))
+    names = ["admin"] * (users - free_users) + [f"user{i}" for i in range(free_users)]
+    sessions = [
+        SimulatedUser(i, name, args, random.Random(args.random_seed * 1000 + level_index * 100 + i))
+        for i, name in enumerate(names)
+    ]
+
+    def simulate(user: SimulatedUser) -> None:
+        user.login()
+        for iteration in range(args.iterations):
+            user.journey(iteration)
+
+    gc.collect()
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        for future in [executor.submit(simulate, user) for user in sessions]:
+            future.result()
+    wall = time.perf_counter() - started
+    # 会话仍然存活（保留会话状态和结果存储）时的内存增长，以及会话释放后仍未归还的部分
+    gc.collect()
+    rss_alive = _rss_mb()
+    samples = [sample for user in sessions for sample in user.samples]
+    sessions.clear()
+    gc.collect()
+    rss_released = _rss_mb()
+    return summarize_level(users, free_users, wall, samples, rss_alive - rss_before, rss_released - rss_before)
+
+
+# ==================== 汇总 ====================
+
+def _rss_mb() -> float:
+    """当前进程的常驻内存（MB，读取/proc；其它平台返回0）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return 0.0
+
+
+def _ms(sorted_values: List[float], q: float) -> float:
+    return round(percentile(sorted_values, q) * 1000, 1)
+
+
+def summarize_level(users: int, free_users: int, wall: float, samples: List[Tuple[str, float]],
+                    rss_alive: float, rss_released: float) -> Dict:
+    """
+    汇总一级并发的结果
+    交互重跑（选择市场等不触发生成的重跑）反映会话之间的排队情况，生成和导出单独统计
+    """
+    by_action: Dict[str, List[float]] = {}
+    for action, seconds in samples:
+        by_action.setdefault(action, []).append(seconds)
+    for values in by_action.values():
+        values.sort()
+    interaction = sorted(s for action, s in samples if action in ("load", "api_key", "select"))
+    generate = by_action.get("generate", [])
+    reruns = sum(1 for action, _ in samples if action != "export")
+    return {
+        "users": users,
+        "free": free_users,
+        "rerun_p50_ms": _ms(interaction, 0.50),
+        "rerun_p95_ms": _ms(interaction, 0.95),
+        "rerun_p99_ms": _ms(interaction, 0.99),
+        "login_p50_ms": _ms(by_action.get("login", []), 0.50),
+        "generate_p50_ms": _ms(generate, 0.50),
+        "generate_p95_ms": _ms(generate, 0.95),
+        "export_p50_ms": _ms(by_action.get("export", []), 0.50),
+        "reruns_per_s": round(reruns / wall, 2) if wall else 0.0,
+        "journeys_per_min": round(len(generate) / wall * 60, 1) if wall else 0.0,
+        "rss_per_session_mb": round(rss_alive / users, 1),
+        "rss_retained_mb": round(rss_released, 1),
+    }
+
+
+def add_slowdown(results: List[Dict]) -> None:
+    """为每一级加上交互重跑p95相对第一级的倍数（明显大于1说明重跑开始排队）"""
+    baseline = results[0]["rerun_p95_ms"] if results else 0
+    for r in results:
+        r["p95_slowdown"] = f"{r['rerun_p95_ms'] / baseline:.1f}x" if baseline else "-"
+
+
+def print_table(results: List[Dict]) -> None:
+    columns = list(results[0].keys())
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in results)) for c in columns}
+    print("  ".join(c.rjust(widths[c]) for c in columns))
+    for r in results:
+        print("  ".join(str(r.get(c, "")).rjust(widths[c]) for c in columns))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="多会话负载测试（基于AppTest、本地模拟DeepSeek服务和Supabase替身）")
+    parser.add_argument("--users", default="1,2,4,8", help="逐级测试的并发用户数，逗号分隔")
+    parser.add_argument("--iterations", type=int, default=3, help="每个用户登录后完成的生成流程次数")
+    parser.add_argument("--markets", type=int, default=3, help="每次生成选择的市场数（普通用户最多5个）")
+    parser.add_argument("--free-share", type=float, default=0.0,
+                        help="普通用户的比例（没有导出按钮），其余为VIP用户")
+    parser.add_argument("--repeat-seed-rate", type=float, default=0.0,
+                        help="重复使用常见种子的比例（命中响应缓存），其余为新种子")
+    parser.add_argument("--no-stream", action="store_true", help="关闭实时显示结果，使用非流式生成")
+    parser.add_argument("--think-time", type=float, default=0.0, help="每次交互前的平均思考时间（秒）")
+    parser.add_argument("--latency", default="lognormal:0.4,0.3", help="模拟DeepSeek服务的首令牌延迟分布")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="模拟DeepSeek服务每个输出令牌的生成时间（秒）")
+    parser.add_argument("--supabase-latency", default="fixed:0.02", help="Supabase替身的响应延迟分布")
+    parser.add_argument("--rpm", type=float, default=6000, help="速率限制器的每分钟请求数上限")
+    parser.add_argument("--timeout", type=float, default=300, help="单次重跑的超时时间（秒）")
+    parser.add_argument("--random-seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", default=None, help="把结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    levels = [int(u) for u in args.users.split(",") if u.strip()]
+    if not levels or min(levels) < 1:
+        parser.error("--users 需要至少一个正整数")
+
+    from mock_server import MockConfig, MockDeepSeekServer
+
+    deepseek = MockDeepSeekServer(MockConfig(latency=args.latency, token_delay=args.token_delay, seed=0)).start()
+    supabase = SupabaseStandIn(
+        free_users=int(round(max(levels) * args.free_share)), latency=args.supabase_latency
+    ).start()
+
+    # 必须在导入utils之前设置：客户端地址和各个存储路径在导入时读取
+    os.environ["DEEPSEEK_BASE_URL"] = deepseek.base_url
+    bench_dir = tempfile.mkdtemp(prefix="kw-load-")
+    for name, filename in (
+        ("KEYWORD_CACHE_PATH", "cache.sqlite3"),
+        ("KEYWORD_SEED_INDEX_PATH", "seeds.sqlite3"),
+        ("KEYWORD_REQUEST_LOG_PATH", "requests.sqlite3"),
+        ("KEYWORD_QUEUE_PATH", "queue.sqlite3"),
+        ("KEYWORD_TRACE_PATH", "traces.json"),
+    ):
+        os.environ[name] = os.path.join(bench_dir, filename)
+
+    from rate_limit import configure_rate_limiter
+
+    install_concurrent_apptest({"SUPABASE_URL": supabase.url, "SUPABASE_KEY": STAND_IN_KEY})
+
+    results = []
+    try:
+        print("预热 ...", file=sys.stderr)
+        configure_rate_limiter(requests_per_minute=args.rpm, max_concurrency=64, backoff_base=0.1)
+        warm_up(args)
+        for level_index, users in enumerate(levels):
+            configure_rate_limiter(requests_per_minute=args.rpm, max_concurrency=64, backoff_base=0.1)
+            print(f"运行 {users} 个并发用户 ...", file=sys.stderr)
+            results.append(run_level(users, args, level_index))
+    finally:
+        supabase.stop()
+        deepseek.stop()
+
+    add_slowdown(results)
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "json_path"}, "results": results},
+                      f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,502 @@
+"""
+批量关键词生成命令行工具
+读取种子关键词列表和市场列表，对其笛卡尔积并发调用get_keywords，
+结果边完成边写入JSONL、Parquet或CSV，并记录检查点以便中断后续跑
+使用 --pack 时同一市场的多个种子合并为一次请求，分摊系统提示词的开销
+使用 --hedge 时单种子请求超过近期p90耗时后发出对冲请求，削减长尾耗时
+使用 --wire-format compact/minimal 时模型以紧凑的位置数组格式输出，减少输出令牌（不能与 --pack 同时使用）
+
+用法示例:
+    python bulk.py --seeds seeds.txt --markets Germany,France,Japan --output results.jsonl
+    python bulk.py --seeds seeds.txt --markets-file markets.txt --output results.parquet --workers 16
+    python bulk.py --seeds seeds.txt --markets all --output results.jsonl --pack
+    python bulk.py --seeds seeds.txt --markets Germany,France --output results.csv
+    python bulk.py --seeds seeds.txt --markets all --output results.jsonl --wire-format compact
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import metrics
+from export import CsvExportWriter
+from results import ALL_COLUMNS, KeywordTable
+from utils import (
+    DEFAULT_MAX_WORKERS,
+    MARKET_CONFIG,
+    WIRE_FORMATS,
+    WIRE_FULL,
+    get_keywords,
+    get_keywords_packed,
+    plan_seed_packs
+)
+
+# 每完成多少个组合写出一个Parquet分片
+DEFAULT_FLUSH_EVERY = 200
+
+# 吞吐量报告间隔（秒）
+REPORT_INTERVAL = 10.0
+
+# 续跑时从文件末尾向前查找最后一个完整行的块大小（字节）
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def read_lines(path: str) -> List[str]:
+    """读取非空行（去除首尾空白，忽略#开头的注释行），保持顺序并去重"""
+    seen = set()
+    lines = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and line not in seen:
+                seen.add(line)
+                lines.append(line)
+    return lines
+
+
+def resolve_markets(markets_arg: Optional[str], markets_file: Optional[str]) -> List[str]:
+    """解析市场参数：逗号分隔列表、文件或 all"""
+    if markets_file:
+        markets = read_lines(markets_file)
+    elif markets_arg and markets_arg.strip().lower() == "all":
+        markets = list(MARKET_CONFIG.keys())
+    else:
+        markets = [m.strip() for m in (markets_arg or "").split(",") if m.strip()]
+    unknown = [m for m in markets if m not in MARKET_CONFIG]
+    if unknown:
+        raise SystemExit(f"未知市场：{', '.join(unknown)}")
+    if not markets:
+        raise SystemExit("请通过 --markets 或 --markets-file 指定至少一个市场")
+    return markets
+
+
+def truncate_partial_line(path: str, terminator: bytes = b"\n", block_size: int = TAIL_BLOCK_SIZE) -> None:
+    """
+    截断文件末尾不完整的最后一行（上次中断时可能留下）
+    从文件末尾按块向前查找最后一个行结束符，只读取最后一行所在的几个块，与文件大小无关
+    """
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        position = size
+        end = 0
+        # 行结束符可能跨越两个块：把本块开头的几个字节带到前一块的末尾
+        carry = b""
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            block = f.read(position - start) + carry
+            index = block.rfind(terminator)
+            if index >= 0:
+                end = start + index + len(terminator)
+                break
+            carry = block[:len(terminator) - 1]
+            position = start
+        if end != size:
+            f.truncate(end)
+
+
+class Checkpoint:
+    """
+    检查点文件：每行记录一个已完成并已写出的 (种子, 国家) 组合，以及写出后输出的位置
+    （JSONL/CSV为文件字节数，Parquet为分片数）
+    只有在结果写出之后才追加记录，因此续跑时不会遗漏结果；续跑时把输出截断到最后记录的位置，
+    已写出但尚未记录的结果会被丢弃并重新生成，不会重复写出
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[Tuple[str, str]] = set()
+        # 最后记录的输出位置（旧版检查点没有位置时为None）
+        self.position: Optional[int] = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if "seed" in record:
+                        self.done.add((record["seed"], record["country"]))
+                    if "position" in record:
+                        self.position = record["position"]
+        self._file = open(path, "a", encoding="utf-8")
+
+    def mark(self, pairs: List[Tuple[str, str]], position: Optional[int] = None) -> None:
+        """记录已写出的组合和写出后的输出位置；pairs为空时只在位置变化时记录位置"""
+        records = [{"seed": seed, "country": country} for seed, country in pairs]
+        if position is not None:
+            if records:
+                records[-1]["position"] = position
+            elif position != self.position:
+                records.append({"position": position})
+        if not records:
+            return
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.done.update(pairs)
+        self.position = position if position is not None else self.position
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def truncate_to(path: str, position: Optional[int], terminator: bytes = b"\n") -> None:
+    """
+    续跑前截断上次中断时留下的输出：有检查点记录的位置时截断到该位置（丢弃已写出但未记录的行），
+    否则（旧版检查点）截断到最后一个完整行
+    """
+    if not os.path.exists(path):
+        return
+    if position is None:
+        truncate_partial_line(path, terminator)
+    elif os.path.getsize(path) > position:
+        with open(path, "rb+") as f:
+            f.truncate(position)
+
+
+class JsonlSink:
+    """JSONL输出：每个 (种子, 国家) 组合一行，立即写出"""
+
+    def __init__(self, path: str, resume_position: Optional[int] = None):
+        truncate_to(path, resume_position)
+        self._file = open(path, "ab")
+
+    @property
+    def position(self) -> int:
+        """当前输出位置（文件字节数）"""
+        return self._file.tell()
+
+    def write(self, record: Dict) -> List[Tuple[str, str]]:
+        self._file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._file.flush()
+        return [(record["seed"], record["country"])]
+
+    def flush(self) -> List[Tuple[str, str]]:
+        return []
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetSink:
+    """
+    Parquet输出：每个关键词一行，按批写成目录下的分片文件（可作为一个数据集读取）
+    分片先写入临时文件再重命名，中断时不会留下损坏的分片；续跑时删除检查点记录之后写出的分片
+    """
+
+    def __init__(self, path: str, flush_every: int = DEFAULT_FLUSH_EVERY, resume_position: Optional[int] = None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("写入Parquet需要安装pyarrow：pip install pyarrow")
+        self.path = path
+        self.flush_every = flush_every
+        os.makedirs(path, exist_ok=True)
+        parts = sorted(name for name in os.listdir(path) if name.endswith(".parquet"))
+        if resume_position is not None:
+            for name in parts[resume_position:]:
+                os.remove(os.path.join(path, name))
+            parts = parts[:resume_position]
+        self._part = len(parts)
+        self._table = KeywordTable()
+        self._pending: List[Tuple[str, str]] = []
+
+    @property
+    def position(self) -> int:
+        """当前输出位置（已写出的分片数）"""
+        return self._part
+
+    def write(self, record: Dict) -> List[Tuple[str, str]]:
+        self._table.add_result(
+            record["country"], record["language"], record,
+            seed=record["seed"], interface_lang=record["interface_lang"]
+        )
+        self._pending.append((record["seed"], record["country"]))
+        if len(self._pending) >= self.flush_every:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[Tuple[str, str]]:
+        if not self._pending:
+            return []
+        import pyarrow.parquet as pq
+
+        if len(self._table):
+            # 字典编码列在Parquet中保持字典编码
+            table = self._table.to_arrow()
+            final_path = os.path.join(self.path, f"part-{self._part:05d}.parquet")
+            tmp_path = final_path + ".tmp"
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, final_path)
+            self._part += 1
+        flushed = self._pending
+        self._table = KeywordTable()
+        self._pending = []
+        return flushed
+
+    def close(self) -> None:
+        pass
+
+
+class CsvSink:
+    """
+    CSV输出：每个关键词一行，按批追加写入（不在内存中保留整个结果表）
+    行以\r\n结尾；续跑前截断到检查点记录的位置，丢弃上次中断时已写出但未记录的行
+    """
+
+    def __init__(self, path: str, flush_every: int = DEFAULT_FLUSH_EVERY, resume_position: Optional[int] = None):
+        truncate_to(path, resume_position, b"\r\n")
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.flush_every = flush_every
+        self._file = open(path, "ab")
+        self._writer = CsvExportWriter(self._file, columns=ALL_COLUMNS, bom=new_file, write_header=new_file)
+        self._table = KeywordTable()
+        self._pending: List[Tuple[str, str]] = []
+
+    @property
+    def position(self) -> int:
+        """当前输出位置（文件字节数）"""
+        return self._file.tell()
+
+    def write(self, record: Dict) -> List[Tuple[str, str]]:
+        self._table.add_result(
+            record["country"], record["language"], record,
+            seed=record["seed"], interface_lang=record["interface_lang"]
+        )
+        self._pending.append((record["seed"], record["country"]))
+        if len(self._pending) >= self.flush_every:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[Tuple[str, str]]:
+        if not self._pending:
+            return []
+        self._writer.write(self._table)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        flushed = self._pending
+        self._table = KeywordTable()
+        self._pending = []
+        return flushed
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def iter_pending_units(
+    seeds: List[str],
+    markets: List[str],
+    done: Set[Tuple[str, str]],
+    pack: bool = False
+) -> Iterator[Tuple[str, List[str]]]:
+    """
+    产出尚未完成的工作单元 (国家, 种子列表)
+    不打包时按种子优先的顺序每个单元一个种子；打包时按市场分组，并按令牌预算切分种子
+    """
+    if not pack:
+        for seed in seeds:
+            for country in markets:
+                if (seed, country) not in done:
+                    yield country, [seed]
+        return
+    for country in markets:
+        pending = [seed for seed in seeds if (seed, country) not in done]
+        for seed_pack in plan_seed_packs(pending):
+            yield country, seed_pack
+
+
+def _run_unit(
+    api_key: Optional[str],
+    country: str,
+    seeds: List[str],
+    interface_lang: str,
+    hedge: bool = False,
+    wire_format: str = WIRE_FULL
+) -> Dict[str, Dict]:
+    """执行一个工作单元，返回 种子 -> 结果"""
+    language = MARKET_CONFIG[country]
+    if len(seeds) == 1:
+        return {
+            seeds[0]: get_keywords(
+                api_key=api_key,
+                seed_keyword=seeds[0],
+                target_language=language,
+                target_country=country,
+                interface_lang=interface_lang,
+                hedge=hedge,
+                wire_format=wire_format
+            )
+        }
+    return get_keywords_packed(
+        api_key=api_key,
+        seed_keywords=seeds,
+        target_language=language,
+        target_country=country,
+        interface_lang=interface_lang
+    )
+
+
+def run_bulk(
+    api_key: Optional[str],
+    seeds: List[str],
+    markets: List[str],
+    output: str,
+    checkpoint_path: Optional[str] = None,
+    interface_lang: str = "Chinese",
+    workers: int = DEFAULT_MAX_WORKERS,
+    flush_every: int = DEFAULT_FLUSH_EVERY,
+    pack: bool = False,
+    hedge: bool = False,
+    wire_format: str = WIRE_FULL,
+    metrics_file: Optional[str] = None,
+    log=sys.stderr
+) -> Dict[str, int]:
+    """
+    执行批量生成
+
+    返回:
+        统计信息：total（组合总数）、skipped（检查点中已完成）、done、failed
+    """
+    checkpoint = Checkpoint(checkpoint_path or output + ".checkpoint")
+    if output.endswith(".parquet"):
+        sink = ParquetSink(output, flush_every=flush_every, resume_position=checkpoint.position)
+    elif output.endswith(".csv"):
+        sink = CsvSink(output, flush_every=flush_every, resume_position=checkpoint.position)
+    else:
+        sink = JsonlSink(output, resume_position=checkpoint.position)
+    # 记录起始位置：第一批结果记录之前中断时，续跑同样截断到这里
+    checkpoint.mark([], sink.position)
+
+    total = len(seeds) * len(markets)
+    skipped = sum(1 for seed in seeds for country in markets if (seed, country) in checkpoint.done)
+    stats = {"total": total, "skipped": skipped, "done": 0, "failed": 0}
+    print(f"[bulk] {total} 个组合，其中 {skipped} 个已在检查点中完成", file=log)
+
+    started = time.monotonic()
+    last_report = started
+
+    def report(final: bool = False) -> None:
+        elapsed = max(time.monotonic() - started, 1e-9)
+        rate = stats["done"] / elapsed * 60
+        remaining = total - skipped - stats["done"] - stats["failed"]
+        eta = f"{remaining / rate:.1f} 分钟" if rate > 0 else "-"
+        prefix = "完成" if final else "进度"
+        print(
+            f"[bulk] {prefix}：{skipped + stats['done']}/{total}，失败 {stats['failed']}，"
+            f"{rate:.1f} 组合/分钟，预计剩余 {eta}",
+            file=log
+        )
+        if metrics_file:
+            metrics.write_prometheus(metrics_file)
+
+    pending = iter_pending_units(seeds, markets, checkpoint.done, pack=pack)
+    # 限制在途任务数量，避免一次性为成千上万个组合创建Future
+    max_in_flight = max(1, workers) * 2
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bulk")
+    in_flight = {}
+    try:
+        while True:
+            while len(in_flight) < max_in_flight:
+                unit = next(pending, None)
+                if unit is None:
+                    break
+                country, unit_seeds = unit
+                future = executor.submit(_run_unit, api_key, country, unit_seeds, interface_lang, hedge, wire_format)
+                in_flight[future] = (country, unit_seeds)
+            if not in_flight:
+                break
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                country, unit_seeds = in_flight.pop(future)
+                try:
+                    unit_results = future.result()
+                except Exception as e:
+                    stats["failed"] += len(unit_seeds)
+                    print(f"[bulk] 失败：{', '.join(unit_seeds)} / {country}：{e}", file=log)
+                    continue
+                for seed in unit_seeds:
+                    result = unit_results[seed]
+                    record = {
+                        "seed": seed,
+                        "country": country,
+                        "language": MARKET_CONFIG[country],
+                        "interface_lang": interface_lang,
+                        "market_insight": result.get("market_insight", ""),
+                        "keywords": result.get("keywords", []),
+                    }
+                    checkpoint.mark(sink.write(record), sink.position)
+                    stats["done"] += 1
+
+            if time.monotonic() - last_report >= REPORT_INTERVAL:
+                report()
+                last_report = time.monotonic()
+    except KeyboardInterrupt:
+        print("[bulk] 已中断，正在保存进度；重新运行相同命令即可续跑", file=log)
+        for future in in_flight:
+            future.cancel()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        checkpoint.mark(sink.flush(), sink.position)
+        sink.close()
+        checkpoint.close()
+
+    report(final=True)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量生成多市场本地化关键词")
+    parser.add_argument("--seeds", required=True, help="种子关键词文件，每行一个")
+    parser.add_argument("--markets", help="逗号分隔的市场列表，或 all 表示全部市场")
+    parser.add_argument("--markets-file", help="市场列表文件，每行一个")
+    parser.add_argument("--output", required=True, help="输出路径：.jsonl、.csv 或 .parquet（目录）")
+    parser.add_argument("--checkpoint", help="检查点文件路径（默认：<output>.checkpoint）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="并发数")
+    parser.add_argument("--interface-lang", default="Chinese", choices=["Chinese", "English"],
+                        help="market_insight和rationale使用的语言")
+    parser.add_argument("--flush-every", type=int, default=DEFAULT_FLUSH_EVERY,
+                        help="Parquet输出每多少个组合写出一个分片")
+    parser.add_argument("--pack", action="store_true",
+                        help="将同一市场的多个种子打包到一次请求中（按令牌预算自动决定每包数量）")
+    parser.add_argument("--hedge", action="store_true",
+                        help="单种子请求超过近期p90耗时后再发一个相同请求，先返回的结果胜出（对冲比例上限约10%%）")
+    parser.add_argument("--wire-format", default=WIRE_FULL, choices=WIRE_FORMATS,
+                        help="响应线格式：full完整格式；compact位置数组且理由限长；minimal位置数组且不含理由")
+    parser.add_argument("--metrics-file", help="运行期间定期写出Prometheus格式的指标文件")
+    parser.add_argument("--api-key", default=os.environ.get("DEEPSEEK_API_KEY"),
+                        help="DeepSeek API密钥（默认读取环境变量DEEPSEEK_API_KEY；留空使用模拟数据）")
+    args = parser.parse_args(argv)
+    if args.pack and args.wire_format != WIRE_FULL:
+        parser.error("--pack 只支持完整线格式（--wire-format full）")
+
+    seeds = read_lines(args.seeds)
+    markets = resolve_markets(args.markets, args.markets_file)
+    if not args.api_key:
+        print("[bulk] 未提供API密钥，将使用模拟数据", file=sys.stderr)
+
+    stats = run_bulk(
+        api_key=args.api_key,
+        seeds=seeds,
+        markets=markets,
+        output=args.output,
+        checkpoint_path=args.checkpoint,
+        interface_lang=args.interface_lang,
+        workers=args.workers,
+        flush_every=args.flush_every,
+        pack=args.pack,
+        hedge=args.hedge,
+        wire_format=args.wire_format,
+        metrics_file=args.metrics_file
+    )
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+响应缓存模块
+为关键词生成结果提供两级缓存：进程内LRU + SQLite磁盘存储
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# 缓存默认配置（可通过环境变量覆盖路径）
+DEFAULT_CACHE_PATH = os.environ.get(
+    "KEYWORD_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "keywords.sqlite3")
+)
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MEMORY_ITEMS = 512
+DEFAULT_DISK_ITEMS = 50000
+
+# 每写入多少次检查一次磁盘容量
+_PRUNE_INTERVAL = 100
+
+
+def normalize_seed_keyword(seed_keyword: str) -> str:
+    """
+    规范化种子关键词：去除首尾空白、合并连续空白并忽略大小写
+    """
+    return " ".join(seed_keyword.split()).casefold()
+
+
+def make_cache_key(
+    seed_keyword: str,
+    target_country: str,
+    target_language: str,
+    interface_lang: str,
+    template_hash: str
+) -> str:
+    """
+    根据规范化后的请求参数和提示词模板指纹生成缓存键
+    """
+    normalized = {
+        "seed": normalize_seed_keyword(seed_keyword),
+        "country": target_country.strip(),
+        "language": target_language.strip(),
+        "interface_lang": interface_lang.strip(),
+        "template": template_hash,
+    }
+    raw = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    两级响应缓存
+    第一级是进程内LRU（毫秒级命中），第二级是SQLite磁盘存储（跨进程、跨重启）
+    两级都按TTL过期，并分别受条目数上限约束
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_CACHE_PATH,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        memory_items: int = DEFAULT_MEMORY_ITEMS,
+        disk_items: int = DEFAULT_DISK_ITEMS
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        if path:
+            self._open_disk(path)
+
+    def _open_disk(self, path: str) -> None:
+        """打开磁盘存储；失败时退化为仅内存缓存"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+            conn.commit()
+            self._conn = conn
+        except (sqlite3.Error, OSError):
+            self._conn = None
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        """写入内存LRU并按上限淘汰最久未使用的条目"""
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        读取缓存，未命中或已过期时返回None
+        每次返回新的字典副本，调用方修改结果不会影响缓存内容
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return json.loads(value)
+                del self._memory[key]
+
+            if self._conn is None:
+                return None
+            try:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                value, expires_at = row
+                if expires_at <= now:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                    return None
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            except sqlite3.Error:
+                return None
+            self._remember(key, value, expires_at)
+            return json.loads(value)
+
+    def expires_at(self, key: str) -> Optional[float]:
+        """
+        返回缓存条目的过期时间戳，不存在或已过期时返回None
+        只查看不读取，不更新访问时间，也不会把条目提升到内存LRU
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[0]
+            if self._conn is None:
+                return None
+            try:
+                row = self._conn.execute(
+                    "SELECT expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error:
+                return None
+        if row is None or row[0] <= now:
+            return None
+        return row[0]
+
+    def set(self, key: str, result: Dict) -> None:
+        """写入缓存（同时写入内存和磁盘）"""
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        value = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, value, now, expires_at, now)
+                )
+                self._conn.commit()
+                self._writes += 1
+                if self._writes % _PRUNE_INTERVAL == 0:
+                    self._prune(now)
+            except sqlite3.Error:
+                pass
+
+    def _prune(self, now: float) -> None:
+        """删除过期条目，并在超过容量上限时淘汰最久未访问的条目"""
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.disk_items
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+        self._conn.commit()
+
+    def clear(self) -> None:
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                try:
+                    self._conn.execute("DELETE FROM responses")
+                    self._conn.commit()
+                except sqlite3.Error:
+                    pass
+
+
+# 进程级共享缓存实例（延迟创建）
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """获取进程级共享的响应缓存"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
@@ -0,0 +1,147 @@
+"""
+DeepSeek客户端连接池模块
+按 (API密钥, base_url) 复用OpenAI客户端及其keep-alive连接，避免每次调用都重新建立TLS连接
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+# openai和httpx在首次创建客户端时才导入，缩短Streamlit应用的冷启动时间
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+# DeepSeek API地址（可通过环境变量指向本地模拟服务）
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+
+# 连接池默认配置
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 16
+DEFAULT_KEEPALIVE_EXPIRY = 90.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 180.0
+DEFAULT_IDLE_SECONDS = 900.0
+
+# 后台清理空闲客户端的间隔（秒）
+_REAP_INTERVAL = 60.0
+
+
+def api_key_hash(api_key: str) -> str:
+    """API密钥的摘要（用作客户端池和请求合并的键，不在内存中的键里保存明文密钥）"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class ClientPool:
+    """
+    OpenAI客户端注册表
+    同一 (API密钥, base_url) 在进程内共享一个客户端，跨调用、跨市场、跨Streamlit重跑复用连接
+    超过idle_seconds未使用的客户端会被自动关闭
+    """
+
+    def __init__(
+        self,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        idle_seconds: float = DEFAULT_IDLE_SECONDS
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_seconds = idle_seconds
+        # 注册表键使用API密钥的哈希，避免明文密钥作为字典键长期驻留
+        self._clients: Dict[Tuple[str, str], Tuple["OpenAI", float]] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def _create_client(self, api_key: str, base_url: str) -> "OpenAI":
+        """创建带有连接池限制和超时配置的客户端"""
+        import httpx
+        from openai import DefaultHttpxClient, OpenAI
+        
+        http_client = DefaultHttpxClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        )
+        # 重试由rate_limit模块统一负责，这里关闭SDK自带的重试
+        return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+    def get(self, api_key: str, base_url: str = DEEPSEEK_BASE_URL) -> "OpenAI":
+        """获取（必要时创建）指定API密钥和地址对应的共享客户端"""
+        key = (api_key_hash(api_key), base_url)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                client = self._create_client(api_key, base_url)
+            else:
+                client = entry[0]
+            self._clients[key] = (client, now)
+            self._ensure_reaper()
+        return client
+
+    def close_idle(self) -> int:
+        """关闭超过空闲时间的客户端，返回关闭的数量"""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle_keys = [key for key, (_, last_used) in self._clients.items() if last_used < cutoff]
+            idle_clients = [self._clients.pop(key)[0] for key in idle_keys]
+        for client in idle_clients:
+            client.close()
+        return len(idle_clients)
+
+    def close_all(self) -> None:
+        """关闭所有客户端"""
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    def _ensure_reaper(self) -> None:
+        """启动后台清理线程（调用方需持有锁）"""
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, name="client-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        """定期关闭空闲客户端；注册表清空后线程退出"""
+        while True:
+            time.sleep(min(_REAP_INTERVAL, self.idle_seconds))
+            self.close_idle()
+            with self._lock:
+                if not self._clients:
+                    self._reaper = None
+                    return
+
+
+# 进程级共享连接池
+_client_pool = ClientPool()
+
+
+def configure_client_pool(**kwargs) -> ClientPool:
+    """
+    使用新的配置替换进程级连接池（旧连接池中的客户端会被关闭）
+    参数与ClientPool的构造参数相同
+    """
+    global _client_pool
+    old_pool = _client_pool
+    _client_pool = ClientPool(**kwargs)
+    old_pool.close_all()
+    return _client_pool
+
+
+def get_client(api_key: str, base_url: str = DEEPSEEK_BASE_URL) -> "OpenAI":
+    """获取共享的DeepSeek客户端"""
+    return _client_pool.get(api_key, base_url)
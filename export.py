@@ -0,0 +1,287 @@
+"""
+结果导出模块
+把KeywordTable分块写成CSV（带BOM，Excel可直接打开）、Parquet（国家/意图等列保持字典编码）或xlsx，
+可以作为生成器逐块产出字节，也可以直接写入磁盘文件（批量运行），不需要先拼出完整的文件内容
+页面下载是例外：Streamlit把下载内容整体保存在内存中，export_bytes只能返回完整的文件内容
+"""
+
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence
+
+from results import DISPLAY_COLUMNS, KeywordTable
+
+# 支持的导出格式：格式 -> (MIME类型, 文件扩展名)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+}
+
+# 各导出格式依赖的可选模块（未安装时页面不提供该格式的下载按钮）
+FORMAT_MODULES = {
+    "parquet": "pyarrow",
+    "xlsx": "openpyxl",
+}
+
+# 每块写出的行数
+DEFAULT_CHUNK_ROWS = 5000
+
+# xlsx工作表名称
+XLSX_SHEET_TITLE = "keywords"
+
+
+def format_from_path(path: str) -> str:
+    """根据文件扩展名判断导出格式"""
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, (_, extension) in EXPORT_FORMATS.items():
+        if ext == extension:
+            return fmt
+    raise ValueError(f"不支持的导出格式：{path}（支持 .csv / .parquet / .xlsx）")
+
+
+def available_export_formats() -> List[str]:
+    """返回当前环境可用的导出格式（依赖的可选模块已安装）"""
+    return [
+        fmt for fmt in EXPORT_FORMATS
+        if fmt not in FORMAT_MODULES or importlib.util.find_spec(FORMAT_MODULES[fmt]) is not None
+    ]
+
+
+class _ExportWriter(ABC):
+    """
+    导出写入器基类
+    write可以多次调用，每次追加一个表（或其中部分行）；序号列在多次写入之间连续编号
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        columns: Sequence[str] = DISPLAY_COLUMNS,
+        labels: Optional[Dict[str, str]] = None,
+        number_label: Optional[str] = None
+    ):
+        self.fileobj = fileobj
+        self.columns = tuple(columns)
+        self.labels = labels or {}
+        self.number_label = number_label
+        self.rows_written = 0
+
+    def header(self) -> List[str]:
+        names = [self.labels.get(name, name) for name in self.columns]
+        return [self.number_label] + names if self.number_label else names
+
+    @abstractmethod
+    def write(self, table: KeywordTable, rows=None) -> None:
+        """追加写入table中rows指定的行（rows为空时写入全部行）"""
+
+    def close(self) -> None:
+        pass
+
+
+class CsvExportWriter(_ExportWriter):
+    """CSV写入器：UTF-8编码，可选BOM（与原有下载格式一致）"""
+
+    def __init__(self, fileobj: BinaryIO, columns=DISPLAY_COLUMNS, labels=None, number_label=None,
+                 bom: bool = True, write_header: bool = True):
+        super().__init__(fileobj, columns, labels, number_label)
+        if bom:
+            fileobj.write("\ufeff".encode("utf-8"))
+        if write_header:
+            self._write_rows([self.header()])
+
+    def _write_rows(self, rows) -> None:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        self.fileobj.write(buffer.getvalue().encode("utf-8"))
+
+    def write(self, table: KeywordTable, rows=None) -> None:
+        body = list(table.iter_rows(self.columns, rows))
+        if self.number_label:
+            start = self.rows_written + 1
+            body = [(start + i,) + row for i, row in enumerate(body)]
+        self._write_rows(body)
+        self.rows_written += len(body)
+
+
+class ParquetExportWriter(_ExportWriter):
+    """Parquet写入器：每次write写成一个或多个行组，字典编码列保持字典编码"""
+
+    def __init__(self, fileobj: BinaryIO, columns=DISPLAY_COLUMNS, labels=None, number_label=None):
+        super().__init__(fileobj, columns, labels, number_label)
+        if importlib.util.find_spec("pyarrow") is None:
+            raise ImportError("导出Parquet需要安装pyarrow：pip install pyarrow")
+        self._writer = None
+
+    def _arrow_chunk(self, table: KeywordTable, rows):
+        import pyarrow as pa
+
+        chunk = table.to_arrow(self.columns, self.labels, order=rows)
+        if self.number_label:
+            start = self.rows_written + 1
+            chunk = chunk.add_column(0, self.number_label, pa.array(range(start, start + chunk.num_rows), type=pa.int64()))
+        return chunk
+
+    def write(self, table: KeywordTable, rows=None) -> None:
+        import pyarrow.parquet as pq
+
+        chunk = self._arrow_chunk(table, rows)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.fileobj, chunk.schema)
+        self._writer.write_table(chunk)
+        self.rows_written += chunk.num_rows
+
+    def close(self) -> None:
+        if self._writer is None:
+            # 没有任何数据时仍写出带表头的空文件
+            import pyarrow.parquet as pq
+            empty = self._arrow_chunk(KeywordTable(), None)
+            self._writer = pq.ParquetWriter(self.fileobj, empty.schema)
+            self._writer.write_table(empty)
+        self._writer.close()
+
+
+class XlsxExportWriter(_ExportWriter):
+    """xlsx写入器：使用openpyxl的只写模式，行数据先流式写入临时文件，close时打包"""
+
+    def __init__(self, fileobj: BinaryIO, columns=DISPLAY_COLUMNS, labels=None, number_label=None):
+        super().__init__(fileobj, columns, labels, number_label)
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise ImportError("导出xlsx需要安装openpyxl：pip install openpyxl")
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet(XLSX_SHEET_TITLE)
+        self._sheet.append(self.header())
+
+    def write(self, table: KeywordTable, rows=None) -> None:
+        for row in table.iter_rows(self.columns, rows):
+            self.rows_written += 1
+            self._sheet.append((self.rows_written,) + row if self.number_label else row)
+
+    def close(self) -> None:
+        self._workbook.save(self.fileobj)
+
+
+_WRITERS = {
+    "csv": CsvExportWriter,
+    "parquet": ParquetExportWriter,
+    "xlsx": XlsxExportWriter,
+}
+
+
+def open_export_writer(
+    fmt: str,
+    fileobj: BinaryIO,
+    columns: Sequence[str] = DISPLAY_COLUMNS,
+    labels: Optional[Dict[str, str]] = None,
+    number_label: Optional[str] = None,
+    **kwargs
+) -> _ExportWriter:
+    """创建指定格式的写入器（kwargs传给具体写入器，例如CSV的bom和write_header）"""
+    if fmt not in _WRITERS:
+        raise ValueError(f"不支持的导出格式：{fmt}")
+    return _WRITERS[fmt](fileobj, columns, labels, number_label, **kwargs)
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """只写缓冲区：写入的数据由生成器取走，已取走的部分立即释放"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _write_chunks(writer: _ExportWriter, table: KeywordTable, order, chunk_rows: int) -> Iterator[None]:
+    """按chunk_rows行一块写入，每写完一块产出一次"""
+    total = len(table)
+    for start in range(0, total, chunk_rows):
+        stop = min(total, start + chunk_rows)
+        writer.write(table, order[start:stop] if order is not None else range(start, stop))
+        yield
+
+
+def iter_export_chunks(
+    table: KeywordTable,
+    fmt: str,
+    columns: Sequence[str] = DISPLAY_COLUMNS,
+    labels: Optional[Dict[str, str]] = None,
+    order=None,
+    number_label: Optional[str] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS
+) -> Iterator[bytes]:
+    """
+    逐块产出导出文件的字节
+    order为行顺序（例如argsort_by_score的结果），默认按原顺序
+    """
+    buffer = _ChunkBuffer()
+    writer = open_export_writer(fmt, buffer, columns, labels, number_label)
+    for _ in _write_chunks(writer, table, order, chunk_rows):
+        data = buffer.drain()
+        if data:
+            yield data
+    writer.close()
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def _write_file(f: BinaryIO, table: KeywordTable, fmt: str, **kwargs) -> None:
+    """把结果表分块写入已打开的二进制文件；kwargs与iter_export_chunks相同"""
+    chunk_rows = kwargs.pop("chunk_rows", DEFAULT_CHUNK_ROWS)
+    order = kwargs.pop("order", None)
+    writer = open_export_writer(fmt, f, **kwargs)
+    for _ in _write_chunks(writer, table, order, chunk_rows):
+        pass
+    writer.close()
+
+
+def export_bytes(table: KeywordTable, fmt: str, **kwargs) -> bytes:
+    """
+    生成完整的导出文件内容（供st.download_button的延迟生成回调使用）
+    Streamlit会把返回的内容整体保存在内存中，这里无法分块；先分块写入临时文件再一次读出，
+    内存中只有最终的文件内容，不会同时保留分块列表和拼接结果
+    """
+    with tempfile.TemporaryFile() as f:
+        _write_file(f, table, fmt, **kwargs)
+        f.seek(0)
+        return f.read()
+
+
+def write_export(
+    table: KeywordTable,
+    path: str,
+    fmt: Optional[str] = None,
+    **kwargs
+) -> str:
+    """
+    把结果表分块直接写入磁盘文件（先写临时文件再替换），返回写入的路径
+    fmt为空时根据扩展名判断格式；kwargs与iter_export_chunks相同
+    """
+    fmt = fmt or format_from_path(path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        _write_file(f, table, fmt, **kwargs)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,134 @@
+"""
+对冲请求模块
+请求耗时超过自适应阈值（近期耗时的p90）时再发出一个相同的请求，先得到有效结果的一方胜出，
+另一方被取消；对冲比例有上限，额外的令牌花费保持在可控范围内
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Optional, TypeVar
+
+import metrics
+import tracing
+
+T = TypeVar("T")
+
+# 默认对冲配置
+DEFAULT_QUANTILE = 0.9
+DEFAULT_MAX_HEDGE_RATE = 0.1
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_MIN_DELAY = 2.0
+DEFAULT_WINDOW = 200
+DEFAULT_MAX_THREADS = 64
+
+
+class HedgeCancelled(Exception):
+    """对冲的另一方已经胜出，本次请求被取消"""
+
+
+class Hedger:
+    """
+    对冲执行器
+    attempt函数接收一个取消事件，事件被设置时应尽快停止（例如关闭流式响应）并抛出异常；
+    attempt抛出异常表示结果无效，另一方仍可胜出
+    """
+
+    def __init__(
+        self,
+        quantile: float = DEFAULT_QUANTILE,
+        max_hedge_rate: float = DEFAULT_MAX_HEDGE_RATE,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+        min_delay: float = DEFAULT_MIN_DELAY,
+        initial_delay: Optional[float] = None,
+        window: int = DEFAULT_WINDOW,
+        max_threads: int = DEFAULT_MAX_THREADS
+    ):
+        self.quantile = quantile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._hedged: Deque[bool] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="hedge")
+
+    def observe(self, latency: float, hedged: bool = False) -> None:
+        """记录一次成功请求的耗时（未开启对冲的请求也会记录，用于估计阈值）"""
+        with self._lock:
+            self._latencies.append(latency)
+            self._hedged.append(hedged)
+
+    def threshold(self) -> Optional[float]:
+        """当前的对冲阈值（秒）；样本不足且没有初始值时返回None（不对冲）"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        index = min(len(samples) - 1, int(self.quantile * len(samples)))
+        return max(self.min_delay, samples[index])
+
+    def _may_hedge(self) -> bool:
+        """最近窗口内的对冲比例低于上限时才允许对冲"""
+        with self._lock:
+            total = len(self._hedged)
+            hedged = sum(self._hedged)
+        return hedged < self.max_hedge_rate * max(total, 1)
+
+    def run(self, attempt: Callable[[threading.Event], T], market: str = "") -> T:
+        """执行attempt，必要时发出对冲请求，返回最先成功的结果"""
+        started = time.monotonic()
+        cancel_events = [threading.Event()]
+        futures = {self._executor.submit(tracing.wrap(attempt), cancel_events[0]): 0}
+
+        hedged = False
+        threshold = self.threshold()
+        if threshold is not None:
+            done, _ = wait(futures, timeout=threshold)
+            if not done and self._may_hedge():
+                hedged = True
+                metrics.record_hedge(market, "issued")
+                cancel_events.append(threading.Event())
+                futures[self._executor.submit(tracing.wrap(attempt), cancel_events[1])] = 1
+
+        pending = set(futures)
+        errors = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                winner = futures[future]
+                # 取消另一方（流式请求会在读取下一个分块时关闭连接）
+                for index, event in enumerate(cancel_events):
+                    if index != winner:
+                        event.set()
+                self.observe(time.monotonic() - started, hedged)
+                if hedged:
+                    metrics.record_hedge(market, "hedge_won" if winner == 1 else "primary_won")
+                return result
+        raise errors[0]
+
+
+# 进程级共享的对冲执行器
+_hedger = Hedger()
+
+
+def configure_hedging(**kwargs) -> Hedger:
+    """
+    使用新的配置替换进程级对冲执行器
+    参数与Hedger的构造参数相同
+    """
+    global _hedger
+    _hedger = Hedger(**kwargs)
+    return _hedger
+
+
+def get_hedger() -> Hedger:
+    """获取进程级共享的对冲执行器"""
+    return _hedger
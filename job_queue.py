@@ -0,0 +1,670 @@
+"""
+后台任务队列模块
+基于SQLite的本地任务队列：页面把每个市场的生成请求作为任务提交，独立的工作进程池领取并执行get_keywords，
+页面只负责轮询结果，长时间的运行不再阻塞会话，刷新页面或重启Streamlit也不会中断
+
+调度采用加权公平排队（自计时公平排队，SCFQ）：每次运行是一个流，权重由用户级别决定（vip > free > guest），
+VIP的任务优先执行，但免费用户和访客的任务仍按权重比例穿插执行，不会被饿死
+
+用法示例:
+    python job_queue.py worker                       # 一个工作进程，空闲10分钟后退出
+    python job_queue.py worker --processes 4 --threads 8 --idle-exit 0
+    python job_queue.py status
+
+页面默认不自动启动工作进程，设置环境变量KEYWORD_QUEUE_AUTOSPAWN=1后，没有工作进程时由页面启动一个
+（空闲超时后自动退出）；所有工作进程通过队列数据库共享同一份DeepSeek限流额度
+
+任务中的API密钥只以加密形式写入队列数据库，加密密钥来自环境变量KEYWORD_QUEUE_SECRET（不写入数据库）；
+单独启动的工作进程需要与页面使用相同的KEYWORD_QUEUE_SECRET，否则无法领取真实API任务
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+# 队列数据库路径（可通过环境变量覆盖），默认与响应缓存放在同一目录
+DEFAULT_QUEUE_PATH = os.environ.get(
+    "KEYWORD_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jobs.sqlite3")
+)
+
+# 各用户级别的调度权重：VIP每执行6个任务，同时排队的免费用户执行3个、访客执行1个
+TIER_WEIGHTS = {"vip": 6.0, "free": 3.0, "guest": 1.0}
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# 工作进程心跳间隔（秒）；超过STALE_AFTER秒没有心跳的运行中任务会被重新排队
+HEARTBEAT_INTERVAL = 2.0
+STALE_AFTER = 30.0
+
+# 单个任务最多尝试次数（工作进程崩溃后重新排队也计入）
+MAX_ATTEMPTS = 3
+
+# 工作线程没有任务时的轮询间隔（秒）
+IDLE_POLL_INTERVAL = 0.5
+
+# 页面轮询运行进度的间隔（秒）
+JOB_POLL_INTERVAL = 1.0
+
+# 已完成任务的保留时间（秒），超过后由工作进程清理
+JOB_RETENTION_SECONDS = 24 * 3600
+
+# 页面自动启动工作进程后，在这段时间内不重复启动（秒）
+SPAWN_COOLDOWN = 15.0
+
+# 是否允许页面自动启动工作进程的环境变量（设为1启用，默认关闭）
+AUTOSPAWN_ENV = "KEYWORD_QUEUE_AUTOSPAWN"
+
+# 默认工作进程数
+DEFAULT_WORKER_PROCESSES = 1
+
+# 工作进程连续空闲多久后退出（秒，0表示不退出）
+DEFAULT_IDLE_EXIT = 600.0
+
+# 工作进程池最多补启动多少次意外退出的工作进程，超过后不再补启动
+MAX_WORKER_RESTARTS = 3
+
+# 加密任务中API密钥的密钥（Fernet格式）所在的环境变量；未设置时每个页面进程随机生成一个，
+# 只传给它自动启动的工作进程，进程重启后未完成的真实API任务无法解密，会被记为失败
+QUEUE_SECRET_ENV = "KEYWORD_QUEUE_SECRET"
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        tier TEXT NOT NULL,
+        seed TEXT NOT NULL,
+        country TEXT NOT NULL,
+        language TEXT NOT NULL,
+        interface_lang TEXT NOT NULL,
+        live INTEGER NOT NULL,
+        api_key_token TEXT,
+        key_id TEXT,
+        finish_tag REAL NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        heartbeat_at REAL,
+        finished_at REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, finish_tag, id)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_run ON jobs (run_id, position)",
+    """CREATE TABLE IF NOT EXISTS workers (
+        id TEXT PRIMARY KEY,
+        pid INTEGER NOT NULL,
+        host TEXT NOT NULL,
+        key_id TEXT,
+        started_at REAL NOT NULL,
+        heartbeat_at REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS scheduler (
+        name TEXT PRIMARY KEY,
+        value REAL NOT NULL
+    )""",
+)
+
+
+class QueueSecretError(Exception):
+    """任务中的API密钥无法解密（工作进程与页面使用的KEYWORD_QUEUE_SECRET不同）"""
+
+
+def _queue_secret() -> bytes:
+    """
+    获取加密API密钥的密钥
+    未配置时生成一个随机密钥并写入本进程的环境变量，之后启动的子进程（自动启动的工作进程）继承同一个密钥
+    """
+    secret = os.environ.get(QUEUE_SECRET_ENV)
+    if not secret:
+        from cryptography.fernet import Fernet
+        secret = os.environ[QUEUE_SECRET_ENV] = Fernet.generate_key().decode("ascii")
+    return secret.encode("ascii")
+
+
+def queue_key_id() -> str:
+    """当前加密密钥的指纹：任务和工作进程都记录指纹，工作进程只领取自己能解密的任务"""
+    return hashlib.sha256(_queue_secret()).hexdigest()[:16]
+
+
+def _encrypt_api_key(api_key: str) -> str:
+    from cryptography.fernet import Fernet
+    return Fernet(_queue_secret()).encrypt(api_key.encode("utf-8")).decode("ascii")
+
+
+def _decrypt_api_key(token: str) -> str:
+    from cryptography.fernet import Fernet, InvalidToken
+    try:
+        return Fernet(_queue_secret()).decrypt(token.encode("ascii")).decode("utf-8")
+    except InvalidToken:
+        raise QueueSecretError(f"API密钥无法解密，请确认工作进程与页面使用相同的{QUEUE_SECRET_ENV}") from None
+
+
+class JobQueue:
+    """
+    SQLite任务队列
+    多个进程可以同时打开同一个数据库（WAL模式）；领取任务在IMMEDIATE事务中完成，同一任务不会被领取两次
+    任务记录中只保存加密后的API密钥（加密密钥不在数据库中），任务结束后立即清除
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """
+        升级旧版本的队列数据库：旧版本在api_key列中保存明文密钥，
+        未完成的真实API任务直接记为失败（需要重新提交），然后删除该列
+        """
+        job_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "api_key" in job_columns:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?) AND live = 1",
+                (JOB_FAILED, "队列已升级，请重新提交任务", time.time(), JOB_QUEUED, JOB_RUNNING)
+            )
+            self._conn.execute("ALTER TABLE jobs DROP COLUMN api_key")
+            # 重写数据库文件并截断WAL，不在空闲页中留下旧的明文
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        for column in ("api_key_token", "key_id"):
+            if column not in job_columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+        worker_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(workers)")}
+        if "key_id" not in worker_columns:
+            self._conn.execute("ALTER TABLE workers ADD COLUMN key_id TEXT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _virtual_time(self) -> float:
+        row = self._conn.execute("SELECT value FROM scheduler WHERE name = 'virtual_time'").fetchone()
+        return row[0] if row else 0.0
+
+    def submit_run(
+        self,
+        api_key: Optional[str],
+        seed_keyword: str,
+        markets: List[Tuple[str, str]],
+        interface_lang: str = "Chinese",
+        tier: str = "guest"
+    ) -> str:
+        """
+        提交一次运行：markets为按优先级排列的 (国家, 语言) 列表，每个市场一个任务
+        每个任务的完成标签 = max(虚拟时间, 本次运行上一个任务的标签) + 1/权重，领取时按标签从小到大执行
+
+        返回:
+            运行ID（用于轮询结果）
+        """
+        run_id = uuid.uuid4().hex
+        weight = TIER_WEIGHTS.get(tier, TIER_WEIGHTS["guest"])
+        live = 1 if api_key and api_key.strip() else 0
+        api_key_token, key_id = (_encrypt_api_key(api_key), queue_key_id()) if live else (None, None)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                finish_tag = self._virtual_time()
+                rows = []
+                for position, (country, language) in enumerate(markets):
+                    finish_tag += 1.0 / weight
+                    rows.append((
+                        run_id, position, tier, seed_keyword, country, language, interface_lang,
+                        live, api_key_token, key_id, finish_tag, JOB_QUEUED, now
+                    ))
+                self._conn.executemany(
+                    "INSERT INTO jobs (run_id, position, tier, seed, country, language, interface_lang, "
+                    "live, api_key_token, key_id, finish_tag, status, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return run_id
+
+    def claim(self, worker_id: str, key_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        领取完成标签最小的排队任务，并把虚拟时间推进到该标签；没有任务时返回None
+        key_id为工作进程加密密钥的指纹，只领取模拟数据任务和用同一密钥加密的真实API任务
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, finish_tag, seed, country, language, interface_lang, api_key_token FROM jobs "
+                    "WHERE status = ? AND (key_id IS NULL OR key_id = ?) ORDER BY finish_tag, id LIMIT 1",
+                    (JOB_QUEUED, key_id)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                job_id, finish_tag = row[0], row[1]
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, started_at = ?, heartbeat_at = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (JOB_RUNNING, worker_id, now, now, job_id)
+                )
+                self._conn.execute(
+                    "INSERT INTO scheduler (name, value) VALUES ('virtual_time', ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)",
+                    (finish_tag,)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {
+            "id": job_id,
+            "seed": row[2],
+            "country": row[3],
+            "language": row[4],
+            "interface_lang": row[5],
+            "api_key_token": row[6],
+        }
+
+    def complete(self, job_id: int, result: Dict) -> None:
+        """保存任务结果（同时清除API密钥）"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, api_key_token = NULL, finished_at = ? "
+                "WHERE id = ?",
+                (JOB_DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id)
+            )
+
+    def fail(self, job_id: int, error: str) -> None:
+        """记录任务失败（同时清除API密钥）"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, api_key_token = NULL, finished_at = ? WHERE id = ?",
+                (JOB_FAILED, error, time.time(), job_id)
+            )
+
+    def heartbeat(self, worker_id: str, job_ids: List[int]) -> None:
+        """更新工作进程及其正在执行的任务的心跳"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE workers SET heartbeat_at = ? WHERE id = ?", (now, worker_id)
+            )
+            if job_ids:
+                self._conn.executemany(
+                    "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?",
+                    [(now, job_id, JOB_RUNNING) for job_id in job_ids]
+                )
+
+    def requeue_stale(self, stale_after: float = STALE_AFTER) -> int:
+        """
+        把心跳超时的运行中任务（工作进程已退出）重新排队，保持原有的完成标签；
+        已达到最大尝试次数的任务记为失败。返回处理的任务数
+        """
+        cutoff = time.time() - stale_after
+        with self._lock:
+            failed = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, api_key_token = NULL, finished_at = ? "
+                "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+                (JOB_FAILED, "工作进程异常退出，重试次数已用完", time.time(), JOB_RUNNING, cutoff, MAX_ATTEMPTS)
+            ).rowcount
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat_at < ?",
+                (JOB_QUEUED, JOB_RUNNING, cutoff)
+            ).rowcount
+        return failed + requeued
+
+    def purge(self, older_than: float = JOB_RETENTION_SECONDS) -> int:
+        """删除早已结束的任务和长时间没有心跳的工作进程记录"""
+        now = time.time()
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (JOB_DONE, JOB_FAILED, now - older_than)
+            ).rowcount
+            self._conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (now - older_than,))
+        return deleted
+
+    def run_jobs(self, run_id: str) -> List[Dict]:
+        """
+        按提交顺序返回一次运行的全部任务状态
+
+        返回:
+            每项包含 country、language、status、result（完成时为字典）和error
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT country, language, status, result, error FROM jobs WHERE run_id = ? ORDER BY position",
+                (run_id,)
+            ).fetchall()
+        return [
+            {
+                "country": country,
+                "language": language,
+                "status": status,
+                "result": json.loads(result) if result else None,
+                "error": error,
+            }
+            for country, language, status, result, error in rows
+        ]
+
+    def run_info(self, run_id: str) -> Optional[Dict]:
+        """返回一次运行的参数（种子关键词、界面语言、是否真实API、级别和市场列表），运行不存在时返回None"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seed, interface_lang, live, tier, country FROM jobs WHERE run_id = ? ORDER BY position",
+                (run_id,)
+            ).fetchall()
+        if not rows:
+            return None
+        seed, interface_lang, live, tier, _ = rows[0]
+        return {
+            "seed": seed,
+            "interface_lang": interface_lang,
+            "live": bool(live),
+            "tier": tier,
+            "markets": [row[4] for row in rows],
+        }
+
+    def queue_position(self, run_id: str) -> int:
+        """在该运行第一个排队任务之前还有多少个排队任务（运行没有排队任务时返回0）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(finish_tag) FROM jobs WHERE run_id = ? AND status = ?", (run_id, JOB_QUEUED)
+            ).fetchone()
+            if row is None or row[0] is None:
+                return 0
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND finish_tag < ?", (JOB_QUEUED, row[0])
+            ).fetchone()[0]
+
+    def depth(self) -> Dict[str, int]:
+        """各用户级别正在排队的任务数"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT tier, COUNT(*) FROM jobs WHERE status = ? GROUP BY tier", (JOB_QUEUED,)
+            ).fetchall()
+        return dict(rows)
+
+    def register_worker(self, worker_id: str, key_id: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers (id, pid, host, key_id, started_at, heartbeat_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (worker_id, os.getpid(), socket.gethostname(), key_id, now, now)
+            )
+
+    def unregister_worker(self, worker_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def live_workers(self, max_age: float = STALE_AFTER, key_id: Optional[str] = None) -> int:
+        """最近max_age秒内有心跳的工作进程数（指定key_id时只统计能解密该密钥所加密任务的工作进程）"""
+        with self._lock:
+            if key_id is None:
+                return self._conn.execute(
+                    "SELECT COUNT(*) FROM workers WHERE heartbeat_at >= ?", (time.time() - max_age,)
+                ).fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM workers WHERE heartbeat_at >= ? AND key_id = ?", (time.time() - max_age, key_id)
+            ).fetchone()[0]
+
+    def claim_spawn(self, cooldown: float = SPAWN_COOLDOWN) -> bool:
+        """
+        多个会话同时发现没有工作进程时，只允许其中一个启动工作进程池
+        返回True表示调用方获得了启动权
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM scheduler WHERE name = 'spawned_at'").fetchone()
+                if row is not None and now - row[0] < cooldown:
+                    self._conn.execute("COMMIT")
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO scheduler (name, value) VALUES ('spawned_at', ?)", (now,)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+
+# 进程级共享队列实例（延迟创建）
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """获取进程级共享的任务队列"""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue()
+    return _job_queue
+
+
+def autospawn_enabled() -> bool:
+    """页面是否可以自动启动工作进程（环境变量KEYWORD_QUEUE_AUTOSPAWN=1）"""
+    return os.environ.get(AUTOSPAWN_ENV, "").strip().lower() in ("1", "true", "yes")
+
+
+def ensure_workers(queue: Optional[JobQueue] = None) -> bool:
+    """
+    启用了自动启动且没有存活的工作进程时，在后台启动一个工作进程
+    （脱离当前进程组，Streamlit重启后继续运行，空闲DEFAULT_IDLE_EXIT秒后自动退出）
+    返回True表示本次启动了工作进程
+    """
+    if not autospawn_enabled():
+        return False
+    queue = queue or get_job_queue()
+    if queue.live_workers(key_id=queue_key_id()) or not queue.claim_spawn():
+        return False
+    subprocess.Popen(
+        [
+            sys.executable, os.path.abspath(__file__), "worker", "--queue", queue.path,
+            "--processes", "1", "--idle-exit", str(DEFAULT_IDLE_EXIT)
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    return True
+
+
+def _execute(job: Dict) -> Dict:
+    """执行一个任务（在工作进程中调用get_keywords，结果同样写入响应缓存）"""
+    from utils import get_keywords
+
+    return get_keywords(
+        api_key=_decrypt_api_key(job["api_key_token"]) if job["api_key_token"] else None,
+        seed_keyword=job["seed"],
+        target_language=job["language"],
+        target_country=job["country"],
+        interface_lang=job["interface_lang"]
+    )
+
+
+def _stop_on_sigterm(stop: threading.Event) -> None:
+    """收到SIGTERM时设置stop；信号处理函数只能在主线程中安装，在其他线程中运行时跳过（由调用方通过stop结束）"""
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+
+def _worker_main(
+    path: str,
+    threads: int,
+    stop: Optional[threading.Event] = None,
+    idle_exit: float = DEFAULT_IDLE_EXIT
+) -> None:
+    """
+    工作进程入口：threads个线程循环领取并执行任务，后台线程定期发送心跳、回收超时任务
+    get_keywords主要在等待网络，每个进程用多个线程；多个进程分摊JSON解析等CPU开销
+    DeepSeek限流额度保存在队列数据库中，所有工作进程共享；连续idle_exit秒没有任务时退出
+    """
+    from rate_limit import configure_rate_limiter
+
+    configure_rate_limiter(shared_path=path)
+    stop = stop or threading.Event()
+    queue = JobQueue(path)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    key_id = queue_key_id()
+    queue.register_worker(worker_id, key_id)
+    running = set()
+    running_lock = threading.Lock()
+    last_active = [time.monotonic()]
+
+    def work_loop() -> None:
+        while not stop.is_set():
+            job = queue.claim(worker_id, key_id)
+            if job is None:
+                stop.wait(IDLE_POLL_INTERVAL)
+                continue
+            with running_lock:
+                running.add(job["id"])
+            try:
+                queue.complete(job["id"], _execute(job))
+            except Exception as e:
+                queue.fail(job["id"], str(e))
+            finally:
+                with running_lock:
+                    running.discard(job["id"])
+                    last_active[0] = time.monotonic()
+
+    def heartbeat_loop() -> None:
+        last_purge = 0.0
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            with running_lock:
+                job_ids = list(running)
+            try:
+                queue.heartbeat(worker_id, job_ids)
+                queue.requeue_stale()
+                if time.monotonic() - last_purge > 3600:
+                    queue.purge()
+                    last_purge = time.monotonic()
+            except sqlite3.Error:
+                continue
+
+    _stop_on_sigterm(stop)
+    heartbeat = threading.Thread(target=heartbeat_loop, name="job-heartbeat", daemon=True)
+    heartbeat.start()
+    workers = [
+        threading.Thread(target=work_loop, name=f"job-worker-{i}", daemon=True)
+        for i in range(max(1, threads))
+    ]
+    for thread in workers:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in workers):
+            for thread in workers:
+                thread.join(timeout=1.0)
+            with running_lock:
+                idle = not running and time.monotonic() - last_active[0] > idle_exit
+            if idle_exit and idle:
+                stop.set()
+    except KeyboardInterrupt:
+        stop.set()
+    finally:
+        queue.unregister_worker(worker_id)
+        queue.close()
+
+
+def run_worker_pool(
+    path: str = DEFAULT_QUEUE_PATH,
+    processes: int = DEFAULT_WORKER_PROCESSES,
+    threads: int = 4,
+    idle_exit: float = DEFAULT_IDLE_EXIT
+) -> None:
+    """
+    启动并看护工作进程池：进程意外退出时补上（最多MAX_WORKER_RESTARTS次），
+    空闲超时正常退出的进程不再补上，所有进程都退出后工作进程池结束
+    收到SIGTERM或Ctrl+C时通知所有工作进程结束
+    """
+    processes = max(1, processes)
+    context = multiprocessing.get_context("spawn")
+    stopping = threading.Event()
+    _stop_on_sigterm(stopping)
+
+    def start() -> multiprocessing.Process:
+        process = context.Process(target=_worker_main, args=(path, threads, None, idle_exit), daemon=False)
+        process.start()
+        return process
+
+    pool = [start() for _ in range(processes)]
+    restarts = 0
+    print(f"[job_queue] {processes} 个工作进程 × {threads} 个线程，队列：{path}", file=sys.stderr)
+    try:
+        while not stopping.wait(1.0):
+            for i, process in enumerate(pool):
+                if process.is_alive() or process.exitcode == 0:
+                    continue
+                if restarts >= MAX_WORKER_RESTARTS:
+                    continue
+                restarts += 1
+                print(f"[job_queue] 工作进程 {process.pid} 已退出（{process.exitcode}），重新启动", file=sys.stderr)
+                pool[i] = start()
+            if not any(process.is_alive() for process in pool):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in pool:
+            if process.is_alive():
+                process.terminate()
+        for process in pool:
+            process.join(timeout=HEARTBEAT_INTERVAL * 5)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="关键词生成后台任务队列")
+    parser.add_argument("command", choices=["worker", "status"], help="worker：启动工作进程池；status：查看队列状态")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="队列数据库路径")
+    parser.add_argument("--processes", type=int, default=DEFAULT_WORKER_PROCESSES, help="工作进程数")
+    parser.add_argument("--threads", type=int, default=4, help="每个工作进程的并发任务数")
+    parser.add_argument("--idle-exit", type=float, default=DEFAULT_IDLE_EXIT,
+                        help="工作进程连续空闲多少秒后退出（0表示不退出）")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        run_worker_pool(args.queue, args.processes, args.threads, args.idle_exit)
+        return 0
+
+    queue = JobQueue(args.queue)
+    print(f"存活的工作进程：{queue.live_workers()}")
+    for tier, count in sorted(queue.depth().items()):
+        print(f"排队任务（{tier}）：{count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
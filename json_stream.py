@@ -0,0 +1,105 @@
+"""
+增量JSON解析模块
+在流式生成过程中逐步解析 {"market_insight": ..., "keywords": [...]} 对象（或紧凑格式的 {"i": ..., "k": [[...]]}），
+每当一个关键词对象（或数组）闭合时立即产出，而不必等待完整响应
+"""
+
+import json
+from typing import Any, List, Tuple
+
+
+class KeywordStreamParser:
+    """
+    关键词响应的增量解析器
+    通过feed()逐段输入文本，返回本段新解析出的事件列表：
+        ("market_insight", str)  顶层market_insight字符串完整时产出
+        ("keyword", dict | list) keywords数组中的每个元素（对象或紧凑格式的位置数组）闭合时产出
+    只跟踪字符串、转义和括号嵌套状态，不会重复扫描已处理的文本
+    """
+
+    def __init__(self, keywords_field: str = "keywords", insight_field: str = "market_insight"):
+        self.keywords_field = keywords_field
+        self.insight_field = insight_field
+        self._text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._current_key = None
+        self._object_start = -1
+
+    @property
+    def text(self) -> str:
+        """目前为止收到的全部文本"""
+        return self._text
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """输入一段文本，返回新产生的事件"""
+        events: List[Tuple[str, Any]] = []
+        if not chunk:
+            return events
+        self._text += chunk
+        text = self._text
+        stack = self._stack
+
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._on_string_end(i, events)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == "{" or ch == "[":
+                stack.append(ch)
+                if ch == "{" and len(stack) == 1:
+                    self._expect_key = True
+                elif self._in_keywords_array(depth=len(stack) - 1):
+                    self._object_start = i
+            elif ch == "}" or ch == "]":
+                if stack:
+                    stack.pop()
+                if self._object_start >= 0 and self._in_keywords_array(depth=len(stack)):
+                    raw = text[self._object_start:i + 1]
+                    self._object_start = -1
+                    try:
+                        events.append(("keyword", json.loads(raw)))
+                    except json.JSONDecodeError:
+                        pass
+            elif len(stack) == 1 and stack[0] == "{":
+                if ch == ":":
+                    self._expect_key = False
+                elif ch == ",":
+                    self._expect_key = True
+
+        self._pos = len(text)
+        return events
+
+    def _in_keywords_array(self, depth: int) -> bool:
+        """判断前depth层是否正好是 顶层对象 -> keywords数组"""
+        return (
+            depth == 2
+            and self._stack[0] == "{"
+            and self._stack[1] == "["
+            and self._current_key == self.keywords_field
+        )
+
+    def _on_string_end(self, end: int, events: List[Tuple[str, Any]]) -> None:
+        """顶层对象中的字符串结束时，记录键名或产出market_insight"""
+        if len(self._stack) != 1 or self._stack[0] != "{":
+            return
+        raw = self._text[self._string_start:end + 1]
+        if self._expect_key:
+            self._current_key = json.loads(raw)
+        elif self._current_key == self.insight_field:
+            events.append(("market_insight", json.loads(raw)))
@@ -0,0 +1,298 @@
+"""
+关键词响应的解析、校验与修复模块
+- 使用orjson（已安装时）解析JSON，否则回退到标准库json
+- 预先编译的市场结果校验器：检查必要字段，规范化intent_type枚举，把popularity_score强制转换为0-100的整数
+- 修复被截断、被Markdown代码块包裹或带有多余文本的响应，尽量保留其中完整的关键词对象（多市场响应保留其中完整的市场）
+- 紧凑格式（{"i": 市场洞察, "k": [[原文, 英文翻译, 意图代码, 热度, 理由], ...]}）展开为完整格式后再校验
+"""
+
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from json_stream import KeywordStreamParser
+
+try:
+    import orjson
+except ImportError:  # orjson是可选依赖
+    orjson = None
+
+# 合法的意图类型（与提示词中的约定一致）
+INTENT_TYPES = ("Primary", "Synonym", "Long-tail")
+
+# 无法识别的意图类型按长尾词处理（最保守的分类）
+DEFAULT_INTENT = "Long-tail"
+
+# 缺少或无法解析分数时使用的默认值
+DEFAULT_SCORE = 50
+
+# 紧凑格式：顶层字段名和意图代码
+COMPACT_INSIGHT_FIELD = "i"
+COMPACT_KEYWORDS_FIELD = "k"
+INTENT_CODES = {"P": "Primary", "S": "Synonym", "L": "Long-tail"}
+
+# 意图类型的常见变体（去掉空格、连字符和下划线并转为小写后匹配）
+_INTENT_ALIASES = {
+    "primary": "Primary",
+    "main": "Primary",
+    "head": "Primary",
+    "headterm": "Primary",
+    "synonym": "Synonym",
+    "synonyms": "Synonym",
+    "variant": "Synonym",
+    "longtail": "Long-tail",
+    "longtailkeyword": "Long-tail",
+}
+
+_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*\n?(.*?)\n?\s*(?:```\s*)?$", re.DOTALL)
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def loads(text):
+    """解析JSON（优先使用orjson；解析失败时抛出json.JSONDecodeError或其子类）"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def normalize_intent(value: Any) -> str:
+    """把意图类型规范化为INTENT_TYPES之一"""
+    if value in INTENT_TYPES:
+        return value
+    if isinstance(value, str):
+        compact = re.sub(r"[\s_\-]+", "", value).casefold()
+        return _INTENT_ALIASES.get(compact, DEFAULT_INTENT)
+    return DEFAULT_INTENT
+
+
+def coerce_score(value: Any) -> int:
+    """把popularity_score转换为0-100的整数（支持浮点数和 "85"、"85%" 之类的字符串）"""
+    if type(value) is int:
+        return 0 if value < 0 else 100 if value > 100 else value
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return DEFAULT_SCORE
+        return max(0, min(100, int(round(value))))
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value)
+        if match:
+            return max(0, min(100, int(round(float(match.group())))))
+    return DEFAULT_SCORE
+
+
+def compile_market_validator(
+    intents: Tuple[str, ...] = INTENT_TYPES,
+    default_score: int = DEFAULT_SCORE
+) -> Callable[[Any], Dict]:
+    """
+    生成单个市场结果的校验函数
+    校验规则在这里一次性绑定为局部变量，校验时不再查找配置；
+    返回的函数原地规范化结果并返回它，缺少market_insight或keywords时抛出ValueError，
+    缺少native_term的关键词会被丢弃
+    """
+    intent_set = frozenset(intents)
+    _str = str
+    _dict = dict
+    _int = int
+    _normalize_intent = normalize_intent
+    _coerce_score = coerce_score
+
+    def validate(result: Any) -> Dict:
+        if type(result) is not _dict or "market_insight" not in result or "keywords" not in result:
+            raise ValueError("API返回的JSON格式不正确，缺少必要字段")
+        insight = result["market_insight"]
+        if type(insight) is not _str:
+            result["market_insight"] = "" if insight is None else _str(insight)
+        keywords = result["keywords"]
+        if type(keywords) is not list:
+            raise ValueError("API返回的JSON格式不正确，keywords必须是数组")
+
+        cleaned: List[Dict] = []
+        for kw in keywords:
+            if type(kw) is not _dict:
+                continue
+            term = kw.get("native_term")
+            if type(term) is not _str or not term.strip():
+                continue
+            if type(kw.get("english_translation")) is not _str:
+                kw["english_translation"] = _str(kw.get("english_translation") or "")
+            if type(kw.get("rationale")) is not _str:
+                kw["rationale"] = _str(kw.get("rationale") or "")
+            intent = kw.get("intent_type")
+            if intent not in intent_set:
+                kw["intent_type"] = _normalize_intent(intent)
+            score = kw.get("popularity_score", default_score)
+            if type(score) is not _int or score < 0 or score > 100:
+                kw["popularity_score"] = _coerce_score(score)
+            elif "popularity_score" not in kw:
+                kw["popularity_score"] = default_score
+            cleaned.append(kw)
+        if len(cleaned) != len(keywords):
+            result["keywords"] = cleaned
+        return result
+
+    return validate
+
+
+def expand_compact_keyword(row: Any) -> Any:
+    """
+    把紧凑格式的关键词行 [原文, 英文翻译, 意图代码, 热度, 理由（可省略）] 展开为完整的关键词字典
+    模型没有遵守紧凑格式、仍返回对象时原样返回；其它类型原样返回，由校验器丢弃
+    """
+    if type(row) is not list:
+        return row
+    length = len(row)
+    code = row[2] if length > 2 else None
+    if isinstance(code, str) and code[:1].upper() in INTENT_CODES and len(code) <= 2:
+        intent = INTENT_CODES[code[:1].upper()]
+    else:
+        intent = normalize_intent(code)
+    return {
+        "native_term": row[0] if length > 0 else None,
+        "english_translation": row[1] if length > 1 else "",
+        "intent_type": intent,
+        "popularity_score": row[3] if length > 3 else DEFAULT_SCORE,
+        "rationale": row[4] if length > 4 else "",
+    }
+
+
+def expand_compact_result(data: Any) -> Any:
+    """把紧凑格式的市场结果展开为完整格式（已经是完整格式时原样返回）"""
+    if type(data) is not dict or COMPACT_KEYWORDS_FIELD not in data or "keywords" in data:
+        return data
+    rows = data[COMPACT_KEYWORDS_FIELD]
+    return {
+        "market_insight": data.get(COMPACT_INSIGHT_FIELD, ""),
+        "keywords": [expand_compact_keyword(row) for row in rows] if type(rows) is list else rows,
+    }
+
+
+# 默认的市场结果校验器
+validate_market_result = compile_market_validator()
+
+
+def strip_code_fence(text: str) -> str:
+    """去掉包裹在外面的Markdown代码块标记（```json ... ```）"""
+    match = _FENCE_RE.match(text)
+    return match.group(1) if match else text
+
+
+def loads_lenient(text: str) -> Any:
+    """
+    宽松解析：依次尝试原文、去掉代码块标记后的文本、以及第一个 { 到最后一个 } 之间的内容
+    全部失败时抛出原文的解析错误
+    """
+    try:
+        return loads(text)
+    except json.JSONDecodeError as error:
+        original_error = error
+    candidates = []
+    stripped = strip_code_fence(text).strip()
+    if stripped != text:
+        candidates.append(stripped)
+    start, end = stripped.find("{"), stripped.rfind("}")
+    if 0 <= start < end and (start, end) != (0, len(stripped) - 1):
+        candidates.append(stripped[start:end + 1])
+    for candidate in candidates:
+        try:
+            return loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    raise original_error
+
+
+def salvage_keywords(text: str, compact: bool = False) -> Optional[Dict]:
+    """
+    从被截断或格式有误的单市场响应中提取完整的关键词对象（compact为True时按紧凑格式提取并展开）
+    至少找到一个关键词时返回 {"market_insight": ..., "keywords": [...]}，否则返回None
+    """
+    if compact:
+        parser = KeywordStreamParser(COMPACT_KEYWORDS_FIELD, COMPACT_INSIGHT_FIELD)
+    else:
+        parser = KeywordStreamParser()
+    insight = ""
+    keywords: List[Dict] = []
+    try:
+        for event, payload in parser.feed(strip_code_fence(text)):
+            if event == "keyword":
+                keywords.append(expand_compact_keyword(payload) if compact else payload)
+            elif event == "market_insight":
+                insight = payload
+    except (ValueError, TypeError):
+        # 解析到损坏的对象时停止，保留之前已经完整的关键词
+        pass
+    if not keywords:
+        return None
+    return {"market_insight": insight, "keywords": keywords}
+
+
+def _skip_separators(text: str, pos: int, separators: str) -> int:
+    """跳过空白和指定的分隔符，返回下一个有效字符的位置"""
+    while pos < len(text) and (text[pos].isspace() or text[pos] in separators):
+        pos += 1
+    return pos
+
+
+def salvage_entries(text: str, field: str) -> Dict[str, Any]:
+    """
+    从被截断的多结果响应（例如 {"markets": {"国家": {...}, ...}}）中提取field对象里已经完整的条目
+    按顺序逐个解码键和值，遇到不完整或损坏的条目时停止；找不到field时返回空字典
+    """
+    decoder = json.JSONDecoder()
+    text = strip_code_fence(text)
+    entries: Dict[str, Any] = {}
+    pos = text.find("{")
+    if pos < 0:
+        return entries
+    pos += 1
+    try:
+        # 顶层对象：跳过其他字段，找到field后进入其中
+        while True:
+            pos = _skip_separators(text, pos, ",")
+            key, pos = decoder.raw_decode(text, pos)
+            pos = _skip_separators(text, pos, ":")
+            if key == field and text.startswith("{", pos):
+                break
+            _, pos = decoder.raw_decode(text, pos)
+        pos += 1
+        while True:
+            pos = _skip_separators(text, pos, ",")
+            if text.startswith("}", pos):
+                break
+            key, pos = decoder.raw_decode(text, pos)
+            pos = _skip_separators(text, pos, ":")
+            value, pos = decoder.raw_decode(text, pos)
+            entries[key] = value
+    except (json.JSONDecodeError, IndexError):
+        # 截断处之前的条目已经完整，保留
+        pass
+    return entries
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def parse_market_response(text: str, compact: bool = False) -> Tuple[Dict, bool]:
+    """
+    解析并校验单个市场的响应（compact为True时先把紧凑格式展开为完整格式）
+
+    返回:
+        (校验后的结果, 是否经过了修复)
+    异常:
+        json.JSONDecodeError: 无法解析且无法修复
+        ValueError: JSON结构不符合要求
+    """
+    expand = expand_compact_result if compact else _identity
+    try:
+        return validate_market_result(expand(loads(text))), False
+    except json.JSONDecodeError as error:
+        decode_error = error
+    try:
+        return validate_market_result(expand(loads_lenient(text))), True
+    except (json.JSONDecodeError, ValueError):
+        pass
+    salvaged = salvage_keywords(text, compact)
+    if salvaged is None:
+        raise decode_error
+    return validate_market_result(salvaged), True
@@ -0,0 +1,362 @@
+"""
+指标模块
+进程内的计数器和直方图，记录每次关键词生成调用的耗时、令牌用量、重试次数、缓存命中和结果，
+可导出为Prometheus文本格式（HTTP端点或文件），也供Streamlit侧边栏的管理面板读取
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+import tracing
+
+# 直方图默认分桶（秒），覆盖从缓存命中的毫秒级到慢速生成的数分钟
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+# 每个标签组合保留的最近样本数（用于计算分位数）
+_RESERVOIR_SIZE = 2048
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = []
+    for name, value in items:
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Counter:
+    """带标签的单调递增计数器"""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def items(self) -> List[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            return [(dict(key), value) for key, value in self._values.items()]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """
+    带标签的直方图
+    分桶计数用于Prometheus导出，同时为每个标签组合保留最近的样本用于计算p50/p95/p99
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelKey, List[int]] = {}
+        self._sums: Dict[LabelKey, float] = {}
+        self._samples: Dict[LabelKey, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+                self._samples[key] = deque(maxlen=_RESERVOIR_SIZE)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[key] += value
+            self._samples[key].append(value)
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99), **label_filter) -> Dict[str, Dict]:
+        """
+        按标签组合计算分位数；label_filter只保留匹配的标签组合
+
+        返回:
+            {标签组合描述: {"count": 样本数, "p50": ..., "p95": ..., "p99": ...}}
+        """
+        wanted = {k: str(v) for k, v in label_filter.items()}
+        result = {}
+        with self._lock:
+            snapshot = {key: sorted(samples) for key, samples in self._samples.items()}
+            totals = {key: sum(counts) for key, counts in self._counts.items()}
+        for key, values in snapshot.items():
+            labels = dict(key)
+            if any(labels.get(k) != v for k, v in wanted.items()):
+                continue
+            name = ",".join(f"{k}={v}" for k, v in key if k not in wanted) or "all"
+            stats = {"count": totals[key]}
+            for q in quantiles:
+                stats[f"p{int(q * 100)}"] = percentile(values, q)
+            result[name] = stats
+        return result
+
+    def quantile(self, q: float, **label_filter) -> Optional[float]:
+        """合并所有匹配标签组合的最近样本后计算分位数，没有样本时返回None"""
+        wanted = {k: str(v) for k, v in label_filter.items()}
+        values: List[float] = []
+        with self._lock:
+            for key, samples in self._samples.items():
+                labels = dict(key)
+                if all(labels.get(k) == v for k, v in wanted.items()):
+                    values.extend(samples)
+        if not values:
+            return None
+        values.sort()
+        return percentile(values, q)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key in sorted(self._counts):
+                cumulative = 0
+                for bound, count in zip(self.buckets, self._counts[key]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                cumulative += self._counts[key][-1]
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {self._sums[key]:g}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, documentation)
+            return self._metrics[name]
+
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, documentation, buckets)
+            return self._metrics[name]
+
+    def render_prometheus(self) -> str:
+        """导出为Prometheus文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 进程级注册表和关键词生成相关的指标
+registry = MetricsRegistry()
+
+CALL_DURATION = registry.histogram(
+    "keyword_call_duration_seconds",
+    "Duration of keyword generation stages (prompt_build, network, parse, validate, total)"
+)
+CALLS = registry.counter(
+    "keyword_calls_total",
+    "Keyword generation calls by market, cache status (hit, near, miss, coalesced, mock) and outcome"
+)
+TOKENS = registry.counter(
+    "keyword_tokens_total",
+    "Tokens reported by the API by market and kind (prompt, completion, cache_hit, cache_miss)"
+)
+RETRIES = registry.counter(
+    "keyword_retries_total",
+    "API call retries by market"
+)
+REPAIRS = registry.counter(
+    "keyword_repairs_total",
+    "Responses that were truncated or malformed and had their keywords salvaged, by market"
+)
+COALESCED = registry.counter(
+    "keyword_coalesced_total",
+    "Calls that shared an identical in-flight API request instead of making their own, by market"
+)
+HEDGES = registry.counter(
+    "keyword_hedges_total",
+    "Hedged duplicate requests, by market and outcome (issued/primary_won/hedge_won)"
+)
+
+
+@contextmanager
+def timer(stage: str, market: str) -> Iterator[None]:
+    """记录一个阶段的耗时（无论成功与否）；在链路追踪中同时记为一个区间"""
+    started = time.perf_counter()
+    try:
+        with tracing.span(stage, market=market):
+            yield
+    finally:
+        CALL_DURATION.observe(time.perf_counter() - started, stage=stage, market=market)
+
+
+def record_call(market: str, cache: str, outcome: str, duration: float) -> None:
+    """记录一次get_keywords调用的结果和总耗时"""
+    CALLS.inc(market=market, cache=cache, outcome=outcome)
+    CALL_DURATION.observe(duration, stage="total", market=market)
+
+
+def record_retry(market: str) -> None:
+    RETRIES.inc(market=market)
+
+
+def record_repair(market: str) -> None:
+    REPAIRS.inc(market=market)
+
+
+def record_coalesced(market: str) -> None:
+    COALESCED.inc(market=market)
+
+
+def record_hedge(market: str, outcome: str) -> None:
+    HEDGES.inc(market=market, outcome=outcome)
+
+
+def record_usage(market: str, usage) -> None:
+    """记录API返回的令牌用量（包括DeepSeek的上下文缓存命中/未命中令牌）"""
+    if usage is None:
+        return
+    TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, market=market, kind="prompt")
+    TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, market=market, kind="completion")
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    miss = getattr(usage, "prompt_cache_miss_tokens", None)
+    if hit is not None or miss is not None:
+        TOKENS.inc(hit or 0, market=market, kind="cache_hit")
+        TOKENS.inc(miss or 0, market=market, kind="cache_miss")
+
+
+def prompt_cache_snapshot() -> Dict:
+    """汇总DeepSeek上下文缓存命中情况"""
+    hit = miss = 0.0
+    for labels, value in TOKENS.items():
+        if labels["kind"] == "cache_hit":
+            hit += value
+        elif labels["kind"] == "cache_miss":
+            miss += value
+    calls = sum(value for labels, value in CALLS.items() if labels["cache"] == "miss")
+    total = hit + miss
+    return {
+        "calls": int(calls),
+        "hit_tokens": int(hit),
+        "miss_tokens": int(miss),
+        "hit_rate": hit / total if total else 0.0,
+    }
+
+
+def market_summary() -> List[Dict]:
+    """
+    按市场汇总：调用数、错误数、缓存命中数、合并请求数、对冲请求数、令牌数以及总耗时的p50/p95/p99（秒）
+    供管理面板展示
+    """
+    rows: Dict[str, Dict] = {}
+
+    def row(market: str) -> Dict:
+        return rows.setdefault(market, {
+            "market": market, "calls": 0, "errors": 0, "cache_hits": 0, "coalesced": 0,
+            "hedges": 0, "retries": 0, "tokens": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0,
+        })
+
+    for labels, value in CALLS.items():
+        r = row(labels["market"])
+        r["calls"] += int(value)
+        if labels["outcome"] != "success":
+            r["errors"] += int(value)
+        if labels["cache"] in ("hit", "near"):
+            r["cache_hits"] += int(value)
+    for labels, value in RETRIES.items():
+        row(labels["market"])["retries"] += int(value)
+    for labels, value in COALESCED.items():
+        row(labels["market"])["coalesced"] += int(value)
+    for labels, value in HEDGES.items():
+        if labels["outcome"] == "issued":
+            row(labels["market"])["hedges"] += int(value)
+    for labels, value in TOKENS.items():
+        if labels["kind"] in ("prompt", "completion"):
+            row(labels["market"])["tokens"] += int(value)
+    for name, stats in CALL_DURATION.percentiles(stage="total").items():
+        market = name.split("=", 1)[1] if "=" in name else name
+        r = row(market)
+        r["p50"], r["p95"], r["p99"] = stats["p50"], stats["p95"], stats["p99"]
+    return sorted(rows.values(), key=lambda r: r["calls"], reverse=True)
+
+
+def write_prometheus(path: str) -> None:
+    """把当前指标写入文件（先写临时文件再替换，供node_exporter文本采集器等读取）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render_prometheus())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """在后台线程中启动 /metrics 端点（重复调用只启动一次）"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server
+
+
+# 设置环境变量KEYWORD_METRICS_PORT时自动启动指标端点
+if os.environ.get("KEYWORD_METRICS_PORT"):
+    start_http_server(int(os.environ["KEYWORD_METRICS_PORT"]))
@@ -0,0 +1,365 @@
+"""
+本地DeepSeek模拟服务
+实现OpenAI兼容的 /chat/completions 接口（含流式SSE），用于离线测试和性能基准：
+可配置延迟分布、错误率、429限流率、畸形响应率、每个市场的关键词数量和输出长度；
+系统提示词要求紧凑线格式时按位置数组输出，请求带max_tokens时按令牌上限截断
+
+用法示例:
+    python mock_server.py --port 8765 --latency lognormal:1.5,0.4 --rate-limit-rate 0.05
+    DEEPSEEK_BASE_URL=http://127.0.0.1:8765 streamlit run app.py
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+INTENT_TYPES = ("Primary", "Synonym", "Long-tail")
+
+# 近似每个令牌的字符数（用于usage、max_tokens截断和流式分块）
+CHARS_PER_TOKEN = 4
+
+
+class LatencyDistribution:
+    """
+    延迟分布（秒），由字符串描述：
+        fixed:0.5 / uniform:0.2,1.0 / normal:1.0,0.3 / lognormal:1.5,0.4（中位数, sigma）
+    """
+
+    def __init__(self, spec: str = "fixed:0"):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"未知的延迟分布：{spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0] if p else 0.0
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        else:
+            value = p[0] * rng.lognormvariate(0, p[1])
+        return max(0.0, value)
+
+
+class MockConfig:
+    """模拟服务配置"""
+
+    def __init__(
+        self,
+        latency: str = "fixed:0",
+        token_delay: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        malformed_rate: float = 0.0,
+        keywords_per_market: int = 6,
+        rationale_words: int = 12,
+        seed: Optional[int] = None
+    ):
+        self.latency = LatencyDistribution(latency)
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.malformed_rate = malformed_rate
+        self.keywords_per_market = keywords_per_market
+        self.rationale_words = rationale_words
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def random(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def sample_latency(self) -> float:
+        with self.rng_lock:
+            return self.latency.sample(self.rng)
+
+
+def _request_field(user_prompt: str, name: str) -> Optional[str]:
+    """从用户提示词中读取 "Name: value" 行"""
+    match = re.search(rf"^{re.escape(name)}: (.*)$", user_prompt, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+
+def _market_payload(config: MockConfig, seed: str, country: str, language: str) -> Dict:
+    """生成一个市场的模拟结果"""
+    filler = " ".join(["detail"] * config.rationale_words)
+    keywords = []
+    for i in range(config.keywords_per_market):
+        keywords.append({
+            "native_term": f"{seed} {language} {i + 1}",
+            "english_translation": f"{seed} variant {i + 1}",
+            "intent_type": INTENT_TYPES[i % len(INTENT_TYPES)],
+            "rationale": f"Mock rationale for {country}: {filler}",
+            "popularity_score": max(0, 95 - i * 9),
+        })
+    return {
+        "market_insight": f"Mock insight for '{seed}' in {country} ({language}).",
+        "keywords": keywords,
+    }
+
+
+def _compact_payload(payload: Dict, rationale_words: Optional[int]) -> Dict:
+    """
+    把单市场结果转换为紧凑线格式 {"i": ..., "k": [[原文, 英文, 意图代码, 热度, 理由]]}
+    rationale_words为None时省略理由，否则截断到该词数
+    """
+    rows = []
+    for kw in payload["keywords"]:
+        row = [kw["native_term"], kw["english_translation"], kw["intent_type"][0], kw["popularity_score"]]
+        if rationale_words is not None:
+            row.append(" ".join(kw["rationale"].split()[:rationale_words]))
+        rows.append(row)
+    return {"i": payload["market_insight"], "k": rows}
+
+
+def build_completion_content(config: MockConfig, user_prompt: str, system_prompt: str = "") -> str:
+    """
+    根据用户提示词的格式（单市场、同语言批量或多种子打包）生成JSON内容
+    单市场请求的系统提示词要求紧凑线格式时，按位置数组输出并遵守其中的理由词数限制
+    """
+    language = _request_field(user_prompt, "Target language") or "English"
+    seeds_field = _request_field(user_prompt, "Seed keywords")
+    markets_field = _request_field(user_prompt, "Target markets")
+    if seeds_field:
+        country = _request_field(user_prompt, "Target market") or "Unknown"
+        seeds = json.loads(seeds_field)
+        payload = {"results": {seed: _market_payload(config, seed, country, language) for seed in seeds}}
+    elif markets_field:
+        seed = _request_field(user_prompt, "Seed keyword") or "seed"
+        countries = [c.strip() for c in markets_field.split(",") if c.strip()]
+        payload = {"markets": {c: _market_payload(config, seed, c, language) for c in countries}}
+    else:
+        seed = _request_field(user_prompt, "Seed keyword") or "seed"
+        country = _request_field(user_prompt, "Target market") or "Unknown"
+        payload = _market_payload(config, seed, country, language)
+        if '"k":[[' in system_prompt:
+            cap = re.search(r"rationale must be at most (\d+) words", system_prompt)
+            payload = _compact_payload(payload, int(cap.group(1)) if cap else None)
+            return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def malform_content(config: MockConfig, content: str) -> str:
+    """模拟模型输出的常见问题：一半概率被截断（约在70%处），一半概率被Markdown代码块包裹"""
+    if config.random() < 0.5:
+        return content[:int(len(content) * 0.7)]
+    return f"```json\n{content}\n```"
+
+
+def _usage(prompt_text: str, content: str) -> Dict:
+    prompt_tokens = len(prompt_text) // CHARS_PER_TOKEN + 1
+    completion_tokens = len(content) // CHARS_PER_TOKEN + 1
+    # 模拟DeepSeek上下文缓存：系统提示词部分视为命中
+    hit = prompt_tokens * 3 // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_cache_hit_tokens": hit,
+        "prompt_cache_miss_tokens": prompt_tokens - hit,
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 流式响应由大量小分块组成，关闭Nagle算法避免与延迟ACK叠加产生额外等待
+    disable_nagle_algorithm = True
+    config: MockConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        config = self.config
+
+        time.sleep(config.sample_latency())
+
+        roll = config.random()
+        if roll < config.rate_limit_rate:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                {"Retry-After": f"{config.retry_after:g}"}
+            )
+            return
+        if roll < config.rate_limit_rate + config.error_rate:
+            self._send_json(500, {"error": {"message": "Mock internal error", "type": "server_error"}})
+            return
+
+        messages = request.get("messages", [])
+        user_prompt = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        system_prompt = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        prompt_text = "".join(m.get("content", "") for m in messages)
+        content = build_completion_content(config, user_prompt, system_prompt)
+        if config.malformed_rate and config.random() < config.malformed_rate:
+            content = malform_content(config, content)
+        # 与真实服务一样，输出达到max_tokens时截断并以length结束
+        finish_reason = "stop"
+        max_tokens = request.get("max_tokens")
+        if max_tokens and len(content) > max_tokens * CHARS_PER_TOKEN:
+            content = content[:max_tokens * CHARS_PER_TOKEN]
+            finish_reason = "length"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get("model", "deepseek-chat")
+        created = int(time.time())
+
+        if request.get("stream"):
+            self._stream(completion_id, model, created, content, prompt_text, request, finish_reason)
+            return
+
+        # 非流式模式下模型同样逐个令牌生成，整段输出的生成时间计入响应延迟
+        if config.token_delay:
+            time.sleep(config.token_delay * -(-len(content) // CHARS_PER_TOKEN))
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }],
+            "usage": _usage(prompt_text, content),
+        })
+
+    def _stream(
+        self,
+        completion_id: str,
+        model: str,
+        created: int,
+        content: str,
+        prompt_text: str,
+        request: Dict,
+        finish_reason: str = "stop"
+    ) -> None:
+        """以SSE分块发送内容，每块约4个字符（近似一个令牌）"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(chunk: Dict) -> None:
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+        try:
+            send({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+            for start in range(0, len(content), CHARS_PER_TOKEN):
+                if self.config.token_delay:
+                    time.sleep(self.config.token_delay)
+                chunk = content[start:start + CHARS_PER_TOKEN]
+                send({**base, "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]})
+            send({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+            if (request.get("stream_options") or {}).get("include_usage"):
+                send({**base, "choices": [], "usage": _usage(prompt_text, content)})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前关闭了流（例如对冲请求的另一方已经胜出），与真实服务一样停止生成
+            pass
+
+
+class MockDeepSeekServer:
+    """
+    在后台线程中运行的模拟服务，可用作上下文管理器：
+        with MockDeepSeekServer(MockConfig(latency="fixed:0.2")) as server:
+            get_client(api_key, server.base_url)
+    """
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        handler = type("MockHandler", (_Handler,), {"config": config or MockConfig()})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockDeepSeekServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-deepseek", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockDeepSeekServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地DeepSeek模拟服务（OpenAI兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:1.0,0.5",
+                        help="响应延迟分布：fixed:S / uniform:A,B / normal:MEAN,STD / lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="每个输出令牌的生成时间（秒）；流式模式下为分块间隔")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500错误的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429限流的概率")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的Retry-After秒数")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回截断或带代码块标记的内容的概率")
+    parser.add_argument("--keywords", type=int, default=6, help="每个市场返回的关键词数量")
+    parser.add_argument("--rationale-words", type=int, default=12, help="每条rationale的长度（单词数）")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子（便于复现）")
+    args = parser.parse_args(argv)
+
+    config = MockConfig(
+        latency=args.latency,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        malformed_rate=args.malformed_rate,
+        keywords_per_market=args.keywords,
+        rationale_words=args.rationale_words,
+        seed=args.seed
+    )
+    server = MockDeepSeekServer(config, host=args.host, port=args.port)
+    print(f"模拟DeepSeek服务已启动：{server.base_url}（Ctrl+C 停止）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
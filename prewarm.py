@@ -0,0 +1,389 @@
+"""
+缓存预热模块
+页面每次生成时把 (种子关键词, 市场, 界面语言) 记入请求日志；预热任务从日志中找出近期最常被请求的组合，
+在低峰时段、令牌预算之内提前刷新它们的响应缓存（缺失或即将过期的条目），
+分析师白天请求热门种子时直接命中缓存，不需要等待DeepSeek
+
+用法示例:
+    python prewarm.py hot                                    # 查看热门组合及其缓存状态
+    python prewarm.py run --window 02:00-07:00               # 在低峰时段内执行一次（不在时段内时直接退出，适合cron）
+    python prewarm.py run --now --token-budget 200000        # 立即执行一次
+    python prewarm.py daemon --window 02:00-07:00            # 常驻进程，每天在低峰时段执行
+"""
+
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import metrics
+from cache import get_response_cache, make_cache_key, normalize_seed_keyword
+
+# 请求日志路径（可通过环境变量覆盖），默认与响应缓存放在同一目录
+DEFAULT_REQUEST_LOG_PATH = os.environ.get(
+    "KEYWORD_REQUEST_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "requests.sqlite3")
+)
+
+# 统计热门组合时回看的天数、最多预热的组合数，以及组合至少被请求的次数
+DEFAULT_LOOKBACK_DAYS = 14
+DEFAULT_TOP = 300
+DEFAULT_MIN_REQUESTS = 2
+
+# 单次预热的令牌预算（提示词 + 输出）
+DEFAULT_TOKEN_BUDGET = 500_000
+
+# 默认低峰时段（本地时间，可以跨越午夜，例如 22:00-06:00）
+DEFAULT_WINDOW = "02:00-07:00"
+
+# 缓存条目在这段时间内过期的也会被刷新（秒），保证白天不会恰好过期
+DEFAULT_REFRESH_AHEAD = 24 * 3600
+
+# 预热并发数（低于交互请求的默认并发，给白天的流量留出限流额度）
+DEFAULT_PREWARM_WORKERS = 4
+
+# 请求日志保留天数
+LOG_RETENTION_DAYS = 60
+
+
+class RequestLog:
+    """
+    请求日志：每行记录一次 (种子关键词, 国家, 语言, 界面语言) 请求
+    种子关键词同时保存原文和规范化形式，按规范化形式聚合（与缓存键一致）
+    """
+
+    def __init__(self, path: str = DEFAULT_REQUEST_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS requests (
+                    ts REAL NOT NULL,
+                    seed TEXT NOT NULL,
+                    seed_key TEXT NOT NULL,
+                    country TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    interface_lang TEXT NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_requests_ts ON requests (ts)")
+            conn.commit()
+            self._conn = conn
+        except (sqlite3.Error, OSError):
+            # 日志只用于预热，打不开时静默停用，不影响页面
+            self._conn = None
+
+    def record(self, seed_keyword: str, markets: Sequence[Tuple[str, str]], interface_lang: str) -> None:
+        """记录一次生成请求涉及的全部市场（markets为 (国家, 语言) 列表）"""
+        if self._conn is None or not markets:
+            return
+        now = time.time()
+        seed = " ".join(seed_keyword.split())
+        seed_key = normalize_seed_keyword(seed_keyword)
+        rows = [(now, seed, seed_key, country, language, interface_lang) for country, language in markets]
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    "INSERT INTO requests (ts, seed, seed_key, country, language, interface_lang) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def hot(
+        self,
+        since: float,
+        limit: int = DEFAULT_TOP,
+        min_requests: int = DEFAULT_MIN_REQUESTS
+    ) -> List[Dict]:
+        """
+        返回since之后请求次数最多的组合（次数相同时最近请求过的优先）
+
+        返回:
+            每项包含 seed、country、language、interface_lang、requests 和 last_requested
+        """
+        if self._conn is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT MAX(seed), country, language, interface_lang, COUNT(*) AS n, MAX(ts) AS last "
+                "FROM requests WHERE ts >= ? "
+                "GROUP BY seed_key, country, language, interface_lang "
+                "HAVING n >= ? ORDER BY n DESC, last DESC LIMIT ?",
+                (since, min_requests, limit)
+            ).fetchall()
+        return [
+            {
+                "seed": seed,
+                "country": country,
+                "language": language,
+                "interface_lang": interface_lang,
+                "requests": count,
+                "last_requested": last,
+            }
+            for seed, country, language, interface_lang, count, last in rows
+        ]
+
+    def purge(self, older_than_days: float = LOG_RETENTION_DAYS) -> int:
+        """删除超过保留期的日志，返回删除的行数"""
+        if self._conn is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM requests WHERE ts < ?", (time.time() - older_than_days * 86400,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+
+# 进程级共享的请求日志（延迟创建）
+_request_log: Optional[RequestLog] = None
+_request_log_lock = threading.Lock()
+
+
+def get_request_log() -> RequestLog:
+    """获取进程级共享的请求日志"""
+    global _request_log
+    if _request_log is None:
+        with _request_log_lock:
+            if _request_log is None:
+                _request_log = RequestLog()
+    return _request_log
+
+
+def parse_window(window: str) -> Tuple[datetime.time, datetime.time]:
+    """解析 "HH:MM-HH:MM" 形式的时段"""
+    try:
+        start, end = (datetime.datetime.strptime(part.strip(), "%H:%M").time() for part in window.split("-"))
+    except ValueError:
+        raise ValueError(f"无效的时段：{window}（格式为 HH:MM-HH:MM）")
+    if start == end:
+        raise ValueError(f"时段的开始和结束时间不能相同：{window}")
+    return start, end
+
+
+def window_bounds(
+    window: Tuple[datetime.time, datetime.time],
+    now: Optional[datetime.datetime] = None
+) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    返回当前所在或下一个时段的 (开始, 结束) 时间
+    now在时段内时开始时间不晚于now
+    """
+    now = now or datetime.datetime.now()
+    start_time, end_time = window
+    start = datetime.datetime.combine(now.date(), start_time)
+    end = datetime.datetime.combine(now.date(), end_time)
+    if end <= start:
+        # 跨越午夜的时段
+        if now < end:
+            start -= datetime.timedelta(days=1)
+        else:
+            end += datetime.timedelta(days=1)
+    if now >= end:
+        start += datetime.timedelta(days=1)
+        end += datetime.timedelta(days=1)
+    return start, end
+
+
+def _tokens_spent() -> int:
+    """本进程至今由API报告的令牌总数（提示词 + 输出）"""
+    return int(sum(
+        value for labels, value in metrics.TOKENS.items() if labels["kind"] in ("prompt", "completion")
+    ))
+
+
+def _estimate_tokens(task: Dict) -> int:
+    """单个组合预计消耗的令牌数（与限流器的估算方式一致）"""
+    from rate_limit import estimate_tokens
+    from utils import EXPECTED_OUTPUT_TOKENS_PER_MARKET, _build_prompts
+
+    system_prompt, user_prompt = _build_prompts(
+        task["seed"], task["language"], task["country"], task["interface_lang"]
+    )
+    return estimate_tokens(system_prompt + user_prompt) + EXPECTED_OUTPUT_TOKENS_PER_MARKET
+
+
+def plan_prewarm(
+    lookback_days: float = DEFAULT_LOOKBACK_DAYS,
+    top: int = DEFAULT_TOP,
+    min_requests: int = DEFAULT_MIN_REQUESTS,
+    refresh_ahead: float = DEFAULT_REFRESH_AHEAD,
+    request_log: Optional[RequestLog] = None
+) -> List[Dict]:
+    """
+    列出需要预热的热门组合（按热度排序）：缓存中没有，或将在refresh_ahead秒内过期
+    每项在hot()返回的字段之外增加 expires_at（缓存过期时间，未缓存时为None）
+    """
+    from utils import PROMPT_TEMPLATE_HASH
+
+    request_log = request_log or get_request_log()
+    cache = get_response_cache()
+    now = time.time()
+    tasks = []
+    for entry in request_log.hot(now - lookback_days * 86400, top, min_requests):
+        key = make_cache_key(
+            entry["seed"], entry["country"], entry["language"], entry["interface_lang"], PROMPT_TEMPLATE_HASH
+        )
+        entry["expires_at"] = cache.expires_at(key)
+        if entry["expires_at"] is None or entry["expires_at"] - now < refresh_ahead:
+            tasks.append(entry)
+    return tasks
+
+
+def run_prewarm(
+    api_key: str,
+    tasks: List[Dict],
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    workers: int = DEFAULT_PREWARM_WORKERS,
+    deadline: Optional[float] = None,
+    on_task_done: Optional[Callable[[Dict, Optional[str]], None]] = None
+) -> Dict:
+    """
+    按顺序刷新tasks中的组合，写入响应缓存
+    已花费的令牌加上进行中和下一个组合的预估令牌超过预算，或到达deadline（time.time()时间戳）时停止派发新组合，
+    进行中的请求会正常完成
+
+    参数:
+        on_task_done: 每个组合完成时回调 (组合, 错误信息或None)
+
+    返回:
+        统计信息：refreshed、failed、skipped（因预算或时段未执行）、tokens（实际花费的令牌）
+    """
+    from utils import get_keywords
+
+    def refresh(task: Dict) -> None:
+        get_keywords(
+            api_key=api_key,
+            seed_keyword=task["seed"],
+            target_language=task["language"],
+            target_country=task["country"],
+            interface_lang=task["interface_lang"],
+            refresh=True
+        )
+
+    workers = max(1, workers)
+    started_tokens = _tokens_spent()
+    stats = {"refreshed": 0, "failed": 0, "skipped": 0, "tokens": 0}
+    pending = {}
+    reserved = 0
+    queue = list(tasks)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while queue or pending:
+            while queue and len(pending) < workers:
+                estimate = _estimate_tokens(queue[0])
+                spent = _tokens_spent() - started_tokens
+                if spent + reserved + estimate > token_budget or (deadline is not None and time.time() >= deadline):
+                    stats["skipped"] += len(queue)
+                    queue = []
+                    break
+                task = queue.pop(0)
+                reserved += estimate
+                pending[executor.submit(refresh, task)] = (task, estimate)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, estimate = pending.pop(future)
+                reserved -= estimate
+                error = future.exception()
+                if error is None:
+                    stats["refreshed"] += 1
+                else:
+                    stats["failed"] += 1
+                if on_task_done:
+                    on_task_done(task, None if error is None else str(error))
+    stats["tokens"] = _tokens_spent() - started_tokens
+    return stats
+
+
+def prewarm_once(args: argparse.Namespace, deadline: Optional[float]) -> Dict:
+    """按命令行参数执行一次预热，并清理过期的请求日志"""
+    tasks = plan_prewarm(args.lookback_days, args.top, args.min_requests, args.refresh_ahead)
+    print(f"[prewarm] 需要刷新 {len(tasks)} 个组合，令牌预算 {args.token_budget}", file=sys.stderr)
+
+    def on_task_done(task: Dict, error: Optional[str]) -> None:
+        label = f"{task['seed']} / {task['country']} / {task['interface_lang']}"
+        print(f"[prewarm] {'✗' if error else '✓'} {label}" + (f"：{error}" if error else ""), file=sys.stderr)
+
+    stats = run_prewarm(args.api_key, tasks, args.token_budget, args.workers, deadline, on_task_done)
+    get_request_log().purge()
+    print(
+        f"[prewarm] 刷新 {stats['refreshed']} 个，失败 {stats['failed']} 个，"
+        f"因预算或时段跳过 {stats['skipped']} 个，花费 {stats['tokens']} 个令牌",
+        file=sys.stderr
+    )
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="热门种子关键词的响应缓存预热")
+    parser.add_argument("command", choices=["run", "daemon", "hot"],
+                        help="run：执行一次；daemon：每天在低峰时段执行；hot：查看热门组合")
+    parser.add_argument("--window", default=DEFAULT_WINDOW, help="低峰时段（本地时间，HH:MM-HH:MM）")
+    parser.add_argument("--now", action="store_true", help="run时忽略低峰时段立即执行（不限制结束时间）")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="单次预热的令牌预算")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="最多预热的热门组合数")
+    parser.add_argument("--min-requests", type=int, default=DEFAULT_MIN_REQUESTS, help="组合至少被请求的次数")
+    parser.add_argument("--lookback-days", type=float, default=DEFAULT_LOOKBACK_DAYS, help="统计热度时回看的天数")
+    parser.add_argument("--refresh-ahead", type=float, default=DEFAULT_REFRESH_AHEAD,
+                        help="缓存在这么多秒内过期的组合也会被刷新")
+    parser.add_argument("--workers", type=int, default=DEFAULT_PREWARM_WORKERS, help="并发请求数")
+    parser.add_argument("--api-key", default=os.environ.get("DEEPSEEK_API_KEY"),
+                        help="DeepSeek API密钥（默认读取环境变量DEEPSEEK_API_KEY）")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers 至少为1")
+
+    if args.command == "hot":
+        now = time.time()
+        for task in plan_prewarm(args.lookback_days, args.top, args.min_requests, refresh_ahead=float("inf")):
+            expires = task["expires_at"]
+            status = f"{(expires - now) / 3600:.1f}h" if expires else "未缓存"
+            print(f"{task['requests']:>6}  {status:>8}  {task['seed']} / {task['country']} / {task['interface_lang']}")
+        return 0
+
+    if not args.api_key:
+        # 模拟数据不写入缓存，预热没有意义
+        print("[prewarm] 请通过 --api-key 或环境变量DEEPSEEK_API_KEY提供API密钥", file=sys.stderr)
+        return 2
+    window = parse_window(args.window)
+
+    if args.command == "run":
+        if args.now:
+            stats = prewarm_once(args, deadline=None)
+            return 1 if stats["failed"] else 0
+        start, end = window_bounds(window)
+        if start > datetime.datetime.now():
+            print(f"[prewarm] 当前不在低峰时段 {args.window} 内，跳过", file=sys.stderr)
+            return 0
+        stats = prewarm_once(args, deadline=end.timestamp())
+        return 1 if stats["failed"] else 0
+
+    try:
+        while True:
+            start, end = window_bounds(window)
+            delay = (start - datetime.datetime.now()).total_seconds()
+            if delay > 0:
+                print(f"[prewarm] 下一次预热：{start:%Y-%m-%d %H:%M}", file=sys.stderr)
+                time.sleep(delay)
+            prewarm_once(args, deadline=end.timestamp())
+            # 等到本时段结束，避免同一时段内重复执行
+            time.sleep(max(0.0, (end - datetime.datetime.now()).total_seconds()))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,413 @@
+"""
+限流与重试模块
+所有DeepSeek请求共享：令牌桶（每分钟请求数/令牌数）+ AIMD自适应并发，
+遇到429/5xx时降低并发、遵守Retry-After，并以带抖动的指数退避重试
+"""
+
+import email.utils
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 默认限流配置
+DEFAULT_REQUESTS_PER_MINUTE = 600
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+DEFAULT_INITIAL_CONCURRENCY = 8
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_CAP = 30.0
+
+# Retry-After最多等待的秒数
+_MAX_RETRY_AFTER = 60.0
+
+# 两次并发减半之间的最短间隔（同一波429只减半一次）
+_DECREASE_COOLDOWN = 2.0
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的令牌数（偏保守：约3个字符一个令牌）"""
+    return len(text) // 3 + 1
+
+
+class TokenBucket:
+    """
+    令牌桶：每分钟补充rate_per_minute个令牌，最多累积capacity个
+    允许事后扣减成负数（按实际用量校正估算值），欠下的额度由后续请求等待补齐
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """阻塞直到可以取出amount个令牌"""
+        # 单次请求超过桶容量时按容量计算，避免永远等不到
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, delta: float) -> None:
+        """按实际用量校正：delta为正表示多用了令牌"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= delta
+
+
+class SharedTokenBucket:
+    """
+    跨进程共享的令牌桶：桶的状态保存在SQLite数据库中，使用同一数据库和名称的所有进程共同消耗一份额度
+    （后台工作进程池使用，避免每个进程各自按完整的每分钟额度发送请求）
+    接口与TokenBucket相同
+    """
+
+    def __init__(self, path: str, name: str, rate_per_minute: float, capacity: Optional[float] = None):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def _take(self, amount: float, force: bool = False) -> float:
+        """
+        在一个IMMEDIATE事务中补充并取出amount个令牌，返回还需等待的秒数（0表示已取出）
+        force为True时无论余额多少都扣减（按实际用量校正）
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated FROM rate_buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                now = time.time()
+                if row is None:
+                    tokens = self.capacity
+                else:
+                    tokens = min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+                wait = 0.0
+                if force or tokens >= amount:
+                    tokens -= amount
+                else:
+                    wait = (amount - tokens) / self.rate
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    (self.name, tokens, now)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """阻塞直到可以取出amount个令牌"""
+        amount = min(amount, self.capacity)
+        while True:
+            wait = self._take(amount)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def adjust(self, delta: float) -> None:
+        """按实际用量校正：delta为正表示多用了令牌"""
+        self._take(delta, force=True)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD自适应并发上限
+    每次成功加性增长（约每轮并发+1），遇到限流或服务端错误时乘性减半
+    """
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_INITIAL_CONCURRENCY,
+        minimum: int = DEFAULT_MIN_CONCURRENCY,
+        maximum: int = DEFAULT_MAX_CONCURRENCY
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self._limit = float(max(minimum, min(initial, maximum)))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            self._cond.notify()
+
+    def on_throttle(self) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease >= _DECREASE_COOLDOWN:
+                self._limit = max(float(self.minimum), self._limit / 2)
+                self._last_decrease = now
+
+
+def _is_retryable(error: Exception) -> bool:
+    """429、5xx、超时和连接错误可以重试；其它错误（如401、400）直接失败"""
+    # openai延迟导入：尚未导入时不可能出现openai的异常
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return False
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+def _is_throttle(error: Exception) -> bool:
+    """是否应当降低并发（限流或服务端过载）"""
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return False
+    if isinstance(error, openai.RateLimitError):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """从错误响应头中读取Retry-After（支持秒数、毫秒和HTTP日期）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return min(_MAX_RETRY_AFTER, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return min(_MAX_RETRY_AFTER, max(0.0, float(retry_after)))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after).timestamp()
+        return min(_MAX_RETRY_AFTER, max(0.0, retry_at - time.time()))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    进程级共享的DeepSeek限流器
+    每个请求先取得并发名额，再从请求数和令牌数两个令牌桶中取额度；
+    收到429时所有线程一起暂停到Retry-After之后
+    shared_path不为空时，请求数和令牌数两个令牌桶保存在该SQLite数据库中，由使用同一数据库的所有进程共享
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+        min_concurrency: int = DEFAULT_MIN_CONCURRENCY,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_cap: float = DEFAULT_BACKOFF_CAP,
+        shared_path: Optional[str] = None
+    ):
+        if shared_path:
+            self.requests = SharedTokenBucket(shared_path, "requests", requests_per_minute)
+            self.tokens = SharedTokenBucket(shared_path, "tokens", tokens_per_minute)
+        else:
+            self.requests = TokenBucket(requests_per_minute)
+            self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_if_paused(self) -> None:
+        while True:
+            with self._lock:
+                wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def _pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _backoff(self, attempt: int) -> float:
+        """全抖动指数退避"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """请求完成后按实际令牌用量校正令牌桶"""
+        if actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def _admit(self, estimated_tokens: int) -> None:
+        """等待暂停结束并取得并发名额和令牌桶额度"""
+        self._wait_if_paused()
+        self.concurrency.acquire()
+        try:
+            self.requests.acquire(1)
+            self.tokens.acquire(estimated_tokens)
+        except BaseException:
+            self.concurrency.release()
+            raise
+
+    def _on_error(self, error: Exception) -> None:
+        """限流或服务端错误时降低并发，并让所有线程一起等待Retry-After"""
+        if _is_throttle(error):
+            self.concurrency.on_throttle()
+            retry_after = _retry_after_seconds(error)
+            if retry_after:
+                self._pause(retry_after)
+
+    def _retry_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """返回下一次重试前的等待秒数；不应重试时返回None"""
+        if attempt >= self.max_retries or not _is_retryable(error):
+            return None
+        delay = self._backoff(attempt)
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        estimated_tokens: int,
+        on_retry: Optional[Callable[[int, Exception], None]] = None
+    ) -> T:
+        """
+        在限流保护下执行fn，可重试的错误按退避策略重试
+
+        参数:
+            fn: 发起一次API请求的无参函数
+            estimated_tokens: 本次请求预估的令牌数（提示词 + 预期输出）
+            on_retry: 每次重试前的回调 (第几次重试, 导致重试的异常)
+        """
+        attempt = 0
+        while True:
+            self._admit(estimated_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self._on_error(e)
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                if on_retry is not None:
+                    on_retry(attempt, e)
+                time.sleep(delay)
+                continue
+            finally:
+                self.concurrency.release()
+            self.concurrency.on_success()
+            return result
+
+    def stream(
+        self,
+        open_fn: Callable[[], Iterable[T]],
+        estimated_tokens: int,
+        on_retry: Optional[Callable[[int, Exception], None]] = None
+    ) -> Iterator[T]:
+        """
+        流式版本的call：建立流的过程可以重试，读取期间一直占用并发名额
+        开始产出数据后出错不再重试（已产出的内容无法撤回）
+        """
+        attempt = 0
+        while True:
+            self._admit(estimated_tokens)
+            try:
+                stream = open_fn()
+                break
+            except Exception as e:
+                self.concurrency.release()
+                self._on_error(e)
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                if on_retry is not None:
+                    on_retry(attempt, e)
+                time.sleep(delay)
+
+        try:
+            yield from stream
+        except Exception as e:
+            self._on_error(e)
+            raise
+        else:
+            self.concurrency.on_success()
+        finally:
+            self.concurrency.release()
+            # 提前结束读取时关闭底层连接
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+
+# 进程级共享限流器
+_rate_limiter = RateLimiter()
+
+
+def configure_rate_limiter(**kwargs) -> RateLimiter:
+    """
+    使用新的配置替换进程级限流器
+    参数与RateLimiter的构造参数相同
+    """
+    global _rate_limiter
+    _rate_limiter = RateLimiter(**kwargs)
+    return _rate_limiter
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取进程级共享限流器"""
+    return _rate_limiter
@@ -0,0 +1,127 @@
+"""
+会话结果存储模块
+按 (种子关键词, 市场) 保存每个市场的生成结果，存放在Streamlit的session_state中，
+使结果在重跑后仍然可用；市场选择变化时只需获取新增的市场
+失败或因时间预算被跳过的市场也会记录状态，之后再次生成时只续跑这些市场
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from cache import normalize_seed_keyword
+
+# 每个会话最多保存的市场结果数（超出后淘汰最久未使用的）
+MAX_STORED_RESULTS = 200
+
+StoreKey = Tuple[str, str, str, bool]
+
+# 市场状态（与utils中的MARKET_DONE/MARKET_FAILED/MARKET_SKIPPED一致）；pending表示从未请求过
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+STATUS_PENDING = "pending"
+
+
+class ResultStore:
+    """
+    单个会话的结果存储
+    键包含界面语言（决定理由和洞察的语言）以及结果是否来自真实API，
+    避免模拟数据在填写API密钥后被当作真实结果复用
+    """
+
+    def __init__(self, max_entries: int = MAX_STORED_RESULTS):
+        self.max_entries = max_entries
+        self._results: "OrderedDict[StoreKey, Dict]" = OrderedDict()
+        self._view: Optional[Tuple[str, str, bool]] = None
+        # 未完成市场的状态和原因：键 -> (failed/skipped, 错误信息)
+        self._statuses: Dict[StoreKey, Tuple[str, str]] = {}
+
+    @staticmethod
+    def _key(seed_keyword: str, country: str, interface_lang: str, live: bool) -> StoreKey:
+        return (normalize_seed_keyword(seed_keyword), country, interface_lang, live)
+
+    def get(self, seed_keyword: str, country: str, interface_lang: str, live: bool) -> Optional[Dict]:
+        """读取一个市场的结果（包含country、language、result），不存在时返回None"""
+        key = self._key(seed_keyword, country, interface_lang, live)
+        entry = self._results.get(key)
+        if entry is not None:
+            self._results.move_to_end(key)
+        return entry
+
+    def put(
+        self,
+        seed_keyword: str,
+        country: str,
+        language: str,
+        interface_lang: str,
+        live: bool,
+        result: Dict
+    ) -> None:
+        """保存一个市场的结果"""
+        key = self._key(seed_keyword, country, interface_lang, live)
+        self._results[key] = {"country": country, "language": language, "result": result}
+        self._results.move_to_end(key)
+        self._statuses.pop(key, None)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def mark(
+        self,
+        seed_keyword: str,
+        country: str,
+        interface_lang: str,
+        live: bool,
+        status: str,
+        error: str = ""
+    ) -> None:
+        """记录一个未完成市场的状态（failed或skipped）"""
+        key = self._key(seed_keyword, country, interface_lang, live)
+        if key in self._results:
+            return
+        self._statuses[key] = (status, error or "")
+        while len(self._statuses) > self.max_entries:
+            del self._statuses[next(iter(self._statuses))]
+
+    def statuses(self, seed_keyword: str, markets: List[str], interface_lang: str, live: bool) -> List[Tuple[str, str, str]]:
+        """按市场顺序返回 (国家, 状态, 错误信息)"""
+        rows = []
+        for country in markets:
+            key = self._key(seed_keyword, country, interface_lang, live)
+            if key in self._results:
+                rows.append((country, STATUS_DONE, ""))
+            else:
+                status, error = self._statuses.get(key, (STATUS_PENDING, ""))
+                rows.append((country, status, error))
+        return rows
+
+    def missing_markets(self, seed_keyword: str, markets: List[str], interface_lang: str, live: bool) -> List[str]:
+        """返回尚未保存结果的市场（保持传入顺序）"""
+        return [
+            country for country in markets
+            if self._key(seed_keyword, country, interface_lang, live) not in self._results
+        ]
+
+    def assemble(self, seed_keyword: str, markets: List[str], interface_lang: str, live: bool) -> List[Dict]:
+        """按市场顺序组装已保存的结果，格式与generate_keywords_for_markets的返回值相同"""
+        market_results = []
+        for country in markets:
+            entry = self.get(seed_keyword, country, interface_lang, live)
+            if entry is not None:
+                market_results.append(entry)
+        return market_results
+
+    def set_view(self, seed_keyword: str, interface_lang: str, live: bool) -> None:
+        """记录最近一次生成对应的种子关键词和界面语言，重跑时据此重新组装表格"""
+        self._view = (seed_keyword, interface_lang, live)
+
+    @property
+    def view(self) -> Optional[Tuple[str, str, bool]]:
+        return self._view
+
+    def clear(self) -> None:
+        self._results.clear()
+        self._statuses.clear()
+        self._view = None
+
+    def __len__(self) -> int:
+        return len(self._results)
@@ -0,0 +1,233 @@
+"""
+关键词结果表模块
+以列式结构保存关键词结果：文本列为列表，国家/语言/意图等重复值按字典编码（整数代码 + 驻留字符串），
+热度分数保存在紧凑的整数数组中，可向量化排序，并直接转换为pandas DataFrame或Arrow表
+列名统一使用内部字段名，本地化的列标题只在渲染或导出时应用
+"""
+
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+# 字典编码列（取值重复度高）
+DICTIONARY_COLUMNS = ("seed", "country", "language", "interface_lang", "intent_type")
+# 普通文本列
+TEXT_COLUMNS = ("native_term", "english_translation", "rationale")
+SCORE_COLUMN = "popularity_score"
+
+# 完整的列顺序（bulk导出使用）
+ALL_COLUMNS = (
+    "seed", "country", "language", "interface_lang",
+    "native_term", "english_translation", "intent_type", "popularity_score", "rationale",
+)
+
+# 页面表格显示的列顺序
+DISPLAY_COLUMNS = ("country", "native_term", "english_translation", "intent_type", "popularity_score", "rationale")
+
+# 缺少分数时使用的默认值（与原有表格逻辑一致）
+DEFAULT_SCORE = 50
+
+
+def column_labels(t: Dict[str, str]) -> Dict[str, str]:
+    """根据翻译字典生成内部列名到本地化列标题的映射"""
+    return {
+        "country": "Country",
+        "native_term": t["col_keyword"],
+        "english_translation": t["col_translation"],
+        "intent_type": t["col_intent"],
+        "popularity_score": t["col_hotness"],
+        "rationale": t["col_reason"],
+    }
+
+
+class _DictionaryColumn:
+    """字典编码列：每行保存一个int32代码，不同取值只保存一份（驻留字符串）"""
+
+    __slots__ = ("codes", "values", "_index")
+
+    def __init__(self):
+        self.codes = array("i")
+        self.values: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def code_for(self, value: str) -> int:
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(sys.intern(value))
+        return code
+
+    def append(self, value: str) -> None:
+        self.codes.append(self.code_for(value))
+
+    def extend_repeat(self, value: str, count: int) -> None:
+        self.codes.extend(array("i", [self.code_for(value)]) * count)
+
+
+def _to_numpy(values: array, dtype, order=None):
+    """
+    把array列复制为numpy数组（order为行顺序）
+    不能直接返回np.frombuffer的视图：导出的DataFrame或Arrow数组存活期间，
+    array的缓冲区无法扩容，之后add_result会抛出BufferError
+    """
+    import numpy as np
+
+    if not len(values):
+        return np.empty(0, dtype=dtype)
+    view = np.frombuffer(values, dtype=dtype)
+    return view[order] if order is not None else view.copy()
+
+
+def _score(value) -> int:
+    try:
+        return max(0, min(100, int(value)))
+    except (TypeError, ValueError):
+        return DEFAULT_SCORE
+
+
+class KeywordTable:
+    """
+    列式关键词结果表
+    每个市场的结果通过add_result追加，不再为每个关键词构建以本地化标题为键的字典
+    """
+
+    __slots__ = ("_dictionary", "_text", "_scores")
+
+    def __init__(self):
+        self._dictionary: Dict[str, _DictionaryColumn] = {name: _DictionaryColumn() for name in DICTIONARY_COLUMNS}
+        self._text: Dict[str, List[str]] = {name: [] for name in TEXT_COLUMNS}
+        self._scores = array("h")
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def add_result(
+        self,
+        country: str,
+        language: str,
+        result: Dict,
+        seed: str = "",
+        interface_lang: str = ""
+    ) -> int:
+        """追加一个市场结果中的全部关键词，返回追加的行数"""
+        keywords = result.get("keywords", [])
+        count = len(keywords)
+        if not count:
+            return 0
+        for name, value in (("seed", seed), ("country", country), ("language", language), ("interface_lang", interface_lang)):
+            self._dictionary[name].extend_repeat(value, count)
+        intents = self._dictionary["intent_type"]
+        native_terms = self._text["native_term"]
+        translations = self._text["english_translation"]
+        rationales = self._text["rationale"]
+        for kw in keywords:
+            native_terms.append(kw.get("native_term", ""))
+            translations.append(kw.get("english_translation", ""))
+            rationales.append(kw.get("rationale", ""))
+            intents.append(kw.get("intent_type", ""))
+            self._scores.append(_score(kw.get("popularity_score", DEFAULT_SCORE)))
+        return count
+
+    @classmethod
+    def from_market_results(cls, market_results: Iterable[Dict], seed: str = "", interface_lang: str = "") -> "KeywordTable":
+        """从generate_keywords_for_markets格式的结果列表构建"""
+        table = cls()
+        for market_result in market_results:
+            table.add_result(
+                market_result["country"], market_result["language"], market_result["result"],
+                seed=seed, interface_lang=interface_lang
+            )
+        return table
+
+    def argsort_by_score(self, descending: bool = True):
+        """
+        按热度分数排序后的行号（numpy数组）
+        使用稳定排序：分数相同时保持原有的市场和关键词顺序
+        """
+        import numpy as np
+
+        scores = np.frombuffer(self._scores, dtype=np.int16) if len(self._scores) else np.empty(0, dtype=np.int16)
+        if descending:
+            scores = -scores.astype(np.int32)
+        return np.argsort(scores, kind="stable")
+
+    def to_pandas(
+        self,
+        columns: Sequence[str] = DISPLAY_COLUMNS,
+        labels: Optional[Dict[str, str]] = None,
+        order=None,
+        number_label: Optional[str] = None
+    ):
+        """
+        转换为pandas DataFrame
+        字典编码列转换为Categorical（直接使用代码数组），分数列为int16；
+        labels为列标题映射，order为行顺序（例如argsort_by_score的结果），
+        number_label不为空时在最前面插入从1开始的序号列
+        """
+        import numpy as np
+        import pandas as pd
+
+        labels = labels or {}
+        data = {}
+        for name in columns:
+            if name in self._dictionary:
+                column = self._dictionary[name]
+                codes = _to_numpy(column.codes, np.int32, order)
+                values = pd.Categorical.from_codes(codes, categories=pd.Index(column.values, dtype=object))
+            elif name == SCORE_COLUMN:
+                values = _to_numpy(self._scores, np.int16, order)
+            else:
+                values = np.array(self._text[name], dtype=object)
+                if order is not None:
+                    values = values[order]
+            data[labels.get(name, name)] = values
+        df = pd.DataFrame(data, copy=False)
+        if number_label:
+            df.insert(0, number_label, np.arange(1, len(df) + 1))
+        return df
+
+    def iter_rows(self, columns: Sequence[str] = ALL_COLUMNS, rows=None) -> Iterator[tuple]:
+        """按行产出元组（rows为要产出的行号序列，默认全部行按原顺序）"""
+        if rows is None:
+            rows = range(len(self))
+        getters = []
+        for name in columns:
+            if name in self._dictionary:
+                column = self._dictionary[name]
+                codes, values = column.codes, column.values
+                getters.append(lambda i, codes=codes, values=values: values[codes[i]])
+            elif name == SCORE_COLUMN:
+                getters.append(self._scores.__getitem__)
+            else:
+                getters.append(self._text[name].__getitem__)
+        for i in rows:
+            i = int(i)
+            yield tuple(getter(i) for getter in getters)
+
+    def to_arrow(self, columns: Sequence[str] = ALL_COLUMNS, labels: Optional[Dict[str, str]] = None, order=None):
+        """
+        转换为pyarrow.Table
+        字典编码列转换为DictionaryArray（写Parquet时保持字典编码），分数列为int16；
+        order可以是部分行号，便于分块导出
+        """
+        import numpy as np
+        import pyarrow as pa
+
+        labels = labels or {}
+        arrays = []
+        names = []
+        for name in columns:
+            if name in self._dictionary:
+                column = self._dictionary[name]
+                codes = _to_numpy(column.codes, np.int32, order)
+                arrays.append(pa.DictionaryArray.from_arrays(pa.array(codes), pa.array(column.values, type=pa.string())))
+            elif name == SCORE_COLUMN:
+                scores = _to_numpy(self._scores, np.int16, order)
+                arrays.append(pa.array(scores))
+            else:
+                values = self._text[name]
+                if order is not None:
+                    values = [values[i] for i in order]
+                arrays.append(pa.array(values, type=pa.string()))
+            names.append(labels.get(name, name))
+        return pa.Table.from_arrays(arrays, names=names)
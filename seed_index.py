@@ -0,0 +1,331 @@
+"""
+种子关键词规范化与近似匹配索引模块
+"Robot Lawn Mower"、"robot lawnmower"、"robot lawn mowers " 和 "Robot-Lawn-Mower" 表达的是同一个种子，
+规范化后在字符三元组索引中查找已经回答过的相似种子，相似度超过阈值时直接复用其缓存结果，不再调用API
+
+- 规范化：NFKC + casefold，连字符、下划线和标点视为空白，合并空白，并做简单的英文复数词干化
+- 相似度：去掉空格后的规范化形式的字符三元组Jaccard相似度（"lawn mower" 与 "lawnmower" 相同）；
+  其中的数字必须完全一致（"iphone 14 case" 不会匹配 "iphone 15 case"）
+- 查找：倒排表只收录每个种子最稀有的几个三元组（前缀过滤），候选再按三元组数量和位置剪枝，
+  10万个种子时单次查找仍在亚毫秒级
+"""
+
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from cache import normalize_seed_keyword
+
+# 索引数据库路径（可通过环境变量覆盖），默认与响应缓存放在同一目录
+DEFAULT_SEED_INDEX_PATH = os.environ.get(
+    "KEYWORD_SEED_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "seeds.sqlite3")
+)
+
+# 默认相似度阈值（三元组Jaccard相似度，可通过环境变量覆盖；1.0表示只复用规范化后完全相同的种子）
+DEFAULT_SIMILARITY_THRESHOLD = float(os.environ.get("KEYWORD_SEED_SIMILARITY", "0.85"))
+
+# 单次查找最多返回的相似种子数
+DEFAULT_MAX_MATCHES = 5
+
+# 种子数达到上次确定三元组顺序时的两倍（且不少于这个数）时在后台重建索引
+REORDER_MIN_SEEDS = 1000
+
+_SEPARATOR_RE = re.compile(r"[\W_]+")
+_DIGITS_RE = re.compile(r"\d+")
+
+# 不做复数词干化的词尾（glass、bus、tennis、chaos……）
+_NON_PLURAL_ENDINGS = ("ss", "us", "is", "os")
+
+# 以s结尾但去掉s后意思不同（或没有单数形式）的词，不做复数词干化
+# 近似匹配直接复用缓存结果，误匹配（news -> new）比漏匹配更糟
+_INVARIANT_PLURALS = frozenset((
+    "news", "glasses", "sunglasses", "eyeglasses", "series", "species", "means", "goods", "arms",
+    "savings", "clothes", "jeans", "pants", "shorts", "trousers", "tights", "scissors", "pliers",
+    "physics", "mathematics", "economics", "politics", "electronics", "athletics", "gymnastics",
+    "aerobics", "graphics", "logistics", "analytics", "ethics", "customs", "thanks", "outdoors",
+))
+
+
+def _stem(token: str) -> str:
+    """简单的英文复数词干化（只处理ASCII字母组成的词）"""
+    if len(token) <= 3 or not token.isascii() or not token.isalpha() or token in _INVARIANT_PLURALS:
+        return token
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith(("sses", "ches", "shes", "xes")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith(_NON_PLURAL_ENDINGS):
+        return token[:-1]
+    return token
+
+
+def canonicalize_seed(seed_keyword: str) -> str:
+    """
+    规范化种子关键词：NFKC、casefold、标点和连字符视为空白、合并空白、复数词干化
+    例如 "Robot-Lawn-Mowers " -> "robot lawn mower"
+    """
+    text = unicodedata.normalize("NFKC", seed_keyword).casefold()
+    return " ".join(_stem(token) for token in _SEPARATOR_RE.sub(" ", text).split())
+
+
+def seed_trigrams(canonical: str) -> frozenset:
+    """规范化形式去掉空格后（首尾补白）的字符三元组集合"""
+    padded = "  " + canonical.replace(" ", "") + " "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class SeedIndex:
+    """
+    已回答种子的字符三元组索引（PPJoin式的前缀过滤 + 位置过滤）
+    种子按缓存使用的规范化形式（normalize_seed_keyword）保存，匹配到的种子可以直接用来构造缓存键
+
+    所有三元组有一个固定的全局顺序（越稀有越靠前），每个种子只把最靠前的 |x| - ceil(t*|x|) + 1 个三元组
+    连同其位置写入倒排表；Jaccard >= t 的两个种子在这个顺序下的前缀必然有公共三元组，因此查找时只需探查查询的前缀。
+    倒排表按种子的三元组数量分桶（长度过滤），探查时再用位置估计剩余可能的重叠数（位置过滤），
+    只有少数候选需要计算真实的相似度。
+    全局顺序在载入时按三元组频率确定；之后新出现的三元组视为最稀有，种子数翻倍时在后台按新的频率重建
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_SEED_INDEX_PATH,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        max_matches: int = DEFAULT_MAX_MATCHES
+    ):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("相似度阈值必须在 (0, 1] 之间")
+        self.path = path
+        self.threshold = threshold
+        self.max_matches = max_matches
+        self._seeds: List[str] = []
+        self._canonical: List[str] = []
+        self._grams: List[Tuple[str, ...]] = []
+        self._ids: Dict[str, int] = {}
+        self._exact: Dict[str, List[int]] = {}
+        self._rank: Dict[str, int] = {}
+        # 三元组 -> 种子的三元组数量 -> (种子编号, 三元组在该种子前缀中的位置)
+        self._postings: Dict[str, Dict[int, Tuple[array, array]]] = {}
+        self._ordered_size = 0
+        self._reordering = False
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._reorder_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            self._open_disk(path)
+
+    def _open_disk(self, path: str) -> None:
+        """打开磁盘存储并载入已有种子；失败时退化为仅内存索引"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS seeds (seed TEXT PRIMARY KEY)")
+            conn.commit()
+            self._load([seed for (seed,) in conn.execute("SELECT seed FROM seeds ORDER BY rowid")])
+            self._conn = conn
+        except (sqlite3.Error, OSError):
+            self._conn = None
+
+    def _load(self, seeds: List[str]) -> None:
+        """批量载入种子：先统计三元组频率确定全局顺序（常见的排名靠后），再逐个建索引"""
+        frequency: Dict[str, int] = {}
+        for seed in seeds:
+            for gram in seed_trigrams(canonicalize_seed(seed)):
+                frequency[gram] = frequency.get(gram, 0) + 1
+        for gram in sorted(frequency, key=lambda gram: (-frequency[gram], gram)):
+            self._rank[gram] = len(self._rank)
+        for seed in seeds:
+            self._insert(seed)
+        self._ordered_size = len(self._seeds)
+
+    def __len__(self) -> int:
+        return len(self._seeds)
+
+    def _prefix(self, grams: frozenset) -> List[str]:
+        """按全局顺序取最稀有的 |x| - ceil(t*|x|) + 1 个三元组（新三元组先分配排名）"""
+        rank = self._rank
+        for gram in grams:
+            if gram not in rank:
+                rank[gram] = len(rank)
+        size = len(grams)
+        length = size - math.ceil(self.threshold * size - 1e-9) + 1
+        return sorted(grams, key=rank.__getitem__, reverse=True)[:length]
+
+    def _insert(self, seed: str) -> None:
+        if seed in self._ids:
+            return
+        seed_id = len(self._seeds)
+        canonical = canonicalize_seed(seed)
+        grams = seed_trigrams(canonical)
+        size = len(grams)
+        self._seeds.append(seed)
+        self._canonical.append(canonical)
+        # 三元组字符串驻留后在所有种子之间共享，10万个种子的三元组元组只占几十MB
+        self._grams.append(tuple(sys.intern(gram) for gram in grams))
+        self._ids[seed] = seed_id
+        self._exact.setdefault(canonical, []).append(seed_id)
+        for position, gram in enumerate(self._prefix(grams)):
+            buckets = self._postings.get(gram)
+            if buckets is None:
+                buckets = self._postings[gram] = {}
+            bucket = buckets.get(size)
+            if bucket is None:
+                bucket = buckets[size] = (array("I"), array("H"))
+            bucket[0].append(seed_id)
+            bucket[1].append(position)
+
+    def add(self, seed_keyword: str) -> None:
+        """登记一个已回答的种子（重复登记会被忽略）"""
+        seed = normalize_seed_keyword(seed_keyword)
+        if not seed:
+            return
+        with self._lock:
+            if seed in self._ids:
+                return
+            self._insert(seed)
+            if self._conn is not None:
+                try:
+                    self._conn.execute("INSERT OR IGNORE INTO seeds (seed) VALUES (?)", (seed,))
+                    self._conn.commit()
+                except sqlite3.Error:
+                    pass
+            if not self._reordering and len(self._seeds) >= max(REORDER_MIN_SEEDS, 2 * self._ordered_size):
+                self._reordering = True
+                threading.Thread(target=self.reorder, name="seed-index-reorder", daemon=True).start()
+
+    def reorder(self) -> None:
+        """
+        按当前的三元组频率重建索引（在锁外构建，完成后替换，期间新增的种子随后补入）
+        种子编号与插入顺序一致，重建前后保持不变；同一时间只有一个重建在进行
+        """
+        with self._reorder_lock:
+            with self._lock:
+                seeds = list(self._seeds)
+                generation = self._generation
+            fresh = SeedIndex(path=None, threshold=self.threshold, max_matches=self.max_matches)
+            fresh._load(seeds)
+            with self._lock:
+                self._reordering = False
+                if generation != self._generation:
+                    # 重建期间索引被清空
+                    return
+                for seed in self._seeds[len(seeds):]:
+                    fresh._insert(seed)
+                self._seeds, self._canonical, self._grams = fresh._seeds, fresh._canonical, fresh._grams
+                self._ids, self._exact = fresh._ids, fresh._exact
+                self._rank, self._postings = fresh._rank, fresh._postings
+                self._ordered_size = len(seeds)
+
+    def similar(self, seed_keyword: str) -> List[Tuple[str, float]]:
+        """
+        查找与seed_keyword相似度不低于阈值的已回答种子（不包括缓存规范化形式完全相同的种子本身）
+
+        返回:
+            [(种子, 相似度)]，按相似度从高到低排列，最多max_matches个
+        """
+        seed = normalize_seed_keyword(seed_keyword)
+        canonical = canonicalize_seed(seed_keyword)
+        if not canonical:
+            return []
+        threshold = self.threshold
+        matches: List[Tuple[str, float]] = []
+
+        with self._lock:
+            # 规范化后完全相同的种子（最常见的情况）不需要查倒排表
+            exact = self._exact.get(canonical, ())
+            for seed_id in exact:
+                if self._seeds[seed_id] != seed:
+                    matches.append((self._seeds[seed_id], 1.0))
+            if threshold < 1.0 and len(matches) < self.max_matches:
+                grams = seed_trigrams(canonical)
+                size = len(grams)
+                # 长度过滤：Jaccard >= t 要求 t*q <= |y| <= q/t
+                min_size = math.ceil(threshold * size - 1e-9)
+                max_size = math.floor(size / threshold + 1e-9)
+                # 位置过滤：重叠数至少为 ceil(t/(1+t)*(q+|y|))，已匹配数加上双方剩余三元组数的较小者达不到时剪枝
+                overlaps: Dict[int, int] = {}
+                for position, gram in enumerate(self._prefix(grams)):
+                    buckets = self._postings.get(gram)
+                    if buckets is None:
+                        continue
+                    remaining = size - position
+                    for other_size, (ids, positions) in buckets.items():
+                        if other_size < min_size or other_size > max_size:
+                            continue
+                        required = math.ceil(threshold / (1 + threshold) * (size + other_size) - 1e-9)
+                        for seed_id, other_position in zip(ids, positions):
+                            overlap = overlaps.get(seed_id, 0)
+                            if overlap < 0:
+                                continue
+                            if overlap + min(remaining, other_size - other_position) >= required:
+                                overlaps[seed_id] = overlap + 1
+                            else:
+                                overlaps[seed_id] = -1
+                overlaps.pop(self._ids.get(seed), None)
+                for seed_id in exact:
+                    overlaps.pop(seed_id, None)
+
+                digits = None
+                for seed_id, overlap in overlaps.items():
+                    if overlap <= 0:
+                        continue
+                    other_grams = self._grams[seed_id]
+                    overlap = len(grams.intersection(other_grams))
+                    score = overlap / (size + len(other_grams) - overlap)
+                    if score < threshold:
+                        continue
+                    if digits is None:
+                        digits = _DIGITS_RE.findall(canonical)
+                    if _DIGITS_RE.findall(self._canonical[seed_id]) == digits:
+                        matches.append((self._seeds[seed_id], score))
+
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches[:self.max_matches]
+
+    def clear(self) -> None:
+        """清空索引"""
+        with self._lock:
+            self._seeds, self._canonical, self._grams = [], [], []
+            self._ids, self._exact, self._rank, self._postings = {}, {}, {}, {}
+            self._ordered_size = 0
+            self._generation += 1
+            if self._conn is not None:
+                try:
+                    self._conn.execute("DELETE FROM seeds")
+                    self._conn.commit()
+                except sqlite3.Error:
+                    pass
+
+
+# 进程级共享索引（延迟创建，首次使用时从磁盘载入）
+_seed_index: Optional[SeedIndex] = None
+_seed_index_lock = threading.Lock()
+
+
+def configure_seed_index(**kwargs) -> SeedIndex:
+    """
+    使用新的配置替换进程级种子索引
+    参数与SeedIndex的构造参数相同
+    """
+    global _seed_index
+    with _seed_index_lock:
+        _seed_index = SeedIndex(**kwargs)
+    return _seed_index
+
+
+def get_seed_index() -> SeedIndex:
+    """获取进程级共享的种子索引"""
+    global _seed_index
+    if _seed_index is None:
+        with _seed_index_lock:
+            if _seed_index is None:
+                _seed_index = SeedIndex()
+    return _seed_index
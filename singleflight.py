@@ -0,0 +1,100 @@
+"""
+请求合并（single-flight）模块
+同一进程内多个会话同时发起相同的请求时，只有第一个请求真正调用API，
+其余请求等待并共享它的结果（或异常），减少高峰期的重复花费和负载
+"""
+
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class FlightAbandoned(Exception):
+    """发起请求的调用方中途放弃（例如流式读取被提前关闭），等待者需要自行重新请求"""
+
+
+class _Call:
+    """一次进行中的请求"""
+
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """等待请求完成并返回结果的副本；请求失败时抛出同样的异常"""
+        if not self.done.wait(timeout):
+            raise TimeoutError("等待合并请求超时")
+        if self.error is not None:
+            raise self.error
+        # 每个等待者拿到独立的副本，避免调用方修改结果时互相影响
+        return copy.deepcopy(self.result)
+
+
+class SingleFlight:
+    """
+    按键合并进行中的请求
+    do()用于普通调用；begin()/finish()用于流式等需要由调用方自己控制完成时机的场景
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key: Hashable) -> Tuple[_Call, bool]:
+        """
+        登记一次请求
+        返回 (请求对象, 是否为发起者)；发起者必须在完成后调用finish，非发起者调用请求对象的wait等待结果
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def finish(self, key: Hashable, call: _Call, result: Any = None, error: Optional[BaseException] = None) -> None:
+        """发起者完成请求，唤醒所有等待者"""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        执行fn，相同键的并发调用共享同一次执行
+
+        返回:
+            (结果, 是否为共享结果)
+        """
+        call, leader = self.begin(key)
+        if not leader:
+            return call.wait(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e if isinstance(e, Exception) else FlightAbandoned(str(e)))
+            raise
+        self.finish(key, call, result=result)
+        return result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+# 进程级共享实例（Streamlit的所有会话都在同一进程中）
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """获取进程级共享的请求合并器"""
+    return _single_flight
@@ -0,0 +1,400 @@
+"""
+链路追踪模块
+轻量的嵌套耗时区间（span）：当前区间保存在contextvars中，提交到线程池的任务通过wrap()继承调用方的上下文，
+一次运行（从点击生成按钮到表格渲染完成）的所有区间组成一条链路，结束后保存在内存中，
+并可导出为Chrome trace-event JSON（chrome://tracing、Perfetto）或OTLP JSON（OpenTelemetry文件格式）；
+另外提供采样分析器，记录一次运行期间所有线程的调用栈（折叠栈格式，可用speedscope或flamegraph.pl查看）
+
+用法示例:
+    KEYWORD_TRACE_PATH=.cache/traces.json streamlit run app.py
+    KEYWORD_TRACE_PATH=.cache/traces.jsonl KEYWORD_TRACE_FORMAT=otlp streamlit run app.py
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 链路导出文件（为空时不写文件，只保存在内存中）和导出格式
+DEFAULT_TRACE_PATH = os.environ.get("KEYWORD_TRACE_PATH") or None
+DEFAULT_TRACE_FORMAT = os.environ.get("KEYWORD_TRACE_FORMAT", "chrome")
+TRACE_FORMATS = ("chrome", "otlp")
+
+# 内存中保留的已完成链路数，以及未结束链路数的上限（根区间因st.stop等提前退出时不会结束）
+DEFAULT_KEEP_TRACES = 50
+MAX_OPEN_TRACES = 256
+
+# 采样分析器的默认采样间隔（秒）
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# OTLP导出使用的服务名
+SERVICE_NAME = "multi-language-keyword-explorer"
+
+
+class Span:
+    """一个耗时区间"""
+
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "attributes",
+        "start_ns", "end_ns", "thread_id", "thread_name", "_started", "_token"
+    )
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        thread = threading.current_thread()
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.thread_id = thread.ident or 0
+        self.thread_name = thread.name
+        self._started = time.perf_counter_ns()
+        self._token: Optional[contextvars.Token] = None
+
+    def set(self, **attributes) -> None:
+        """补充属性（例如缓存状态、关键词数）"""
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        """耗时（秒），未结束时为到目前为止的耗时"""
+        end = self.end_ns if self.end_ns is not None else self.start_ns + time.perf_counter_ns() - self._started
+        return (end - self.start_ns) / 1e9
+
+    def _finish(self) -> None:
+        # 用单调时钟计算耗时，避免系统时间调整造成负值
+        self.end_ns = self.start_ns + time.perf_counter_ns() - self._started
+
+
+# 当前线程（或协程）中正在进行的区间
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("keyword_trace_span", default=None)
+
+
+class Tracer:
+    """
+    区间收集器
+    子区间结束时暂存在所属链路下，根区间结束时整条链路移入已完成列表并按配置写入文件
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_TRACE_PATH,
+        fmt: str = DEFAULT_TRACE_FORMAT,
+        keep: int = DEFAULT_KEEP_TRACES,
+        enabled: bool = True
+    ):
+        if fmt not in TRACE_FORMATS:
+            raise ValueError(f"未知的链路导出格式：{fmt}")
+        self.path = path
+        self.fmt = fmt
+        self.enabled = enabled
+        self._open: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._finished: Deque[List[Span]] = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def start(self, name: str, root: bool = False, **attributes) -> Optional[Span]:
+        """开始一个区间（root为True时总是开始一条新链路）；没有所属链路且不是根区间时返回None"""
+        if not self.enabled:
+            return None
+        parent = None if root else _current.get()
+        if parent is None and not root:
+            return None
+        trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        span = Span(name, trace_id, parent.span_id if parent is not None else None, attributes)
+        if parent is None:
+            with self._lock:
+                self._open[trace_id] = []
+                while len(self._open) > MAX_OPEN_TRACES:
+                    self._open.popitem(last=False)
+        return span
+
+    def finish(self, span: Span) -> None:
+        """结束区间；根区间结束时整条链路完成"""
+        span._finish()
+        with self._lock:
+            spans = self._open.get(span.trace_id)
+            if spans is None:
+                return
+            spans.append(span)
+            if span.parent_id is not None:
+                return
+            del self._open[span.trace_id]
+            self._finished.append(spans)
+        if self.path:
+            self._write(spans)
+
+    def traces(self) -> List[List[Span]]:
+        """已完成的链路（最早的在前）"""
+        with self._lock:
+            return list(self._finished)
+
+    def trace(self, trace_id: str) -> Optional[List[Span]]:
+        """按链路ID查找已完成的链路"""
+        with self._lock:
+            for spans in self._finished:
+                if spans and spans[0].trace_id == trace_id:
+                    return list(spans)
+        return None
+
+    def _write(self, spans: List[Span]) -> None:
+        """把一条链路追加到导出文件（Chrome格式为不闭合的JSON数组，OTLP格式为每行一个导出请求）"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._file_lock, open(self.path, "a", encoding="utf-8") as f:
+            if self.fmt == "otlp":
+                f.write(json.dumps(to_otlp(spans), ensure_ascii=False) + "\n")
+                return
+            # Chrome trace-event的JSON数组格式允许省略结尾的 ]，因此可以不断追加
+            if f.tell() == 0:
+                f.write("[\n")
+            for event in to_chrome_events(spans):
+                f.write(json.dumps(event, ensure_ascii=False) + ",\n")
+
+
+# 进程级共享的区间收集器
+_tracer = Tracer()
+
+
+def configure_tracing(**kwargs) -> Tracer:
+    """
+    使用新的配置替换进程级区间收集器
+    参数与Tracer的构造参数相同
+    """
+    global _tracer
+    _tracer = Tracer(**kwargs)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    """获取进程级共享的区间收集器"""
+    return _tracer
+
+
+@contextmanager
+def span(name: str, root: bool = False, **attributes) -> Iterator[Optional[Span]]:
+    """
+    在当前链路下记录一个嵌套区间；不在任何链路中时什么也不做（开销只有一次contextvar读取），
+    root为True时则开始一条以它为根的新链路
+    异常会记录在区间的error属性中并继续抛出
+    """
+    tracer = _tracer
+    current = tracer.start(name, root=root and _current.get() is None, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        tracer.finish(current)
+
+
+def start_trace(name: str, **attributes) -> Optional[Span]:
+    """
+    开始一条新链路并把根区间设为当前区间，之后的span()都记录在这条链路下，直到调用end_trace
+    用于无法用with包住的流程（例如Streamlit脚本中从按钮处理到页面末尾的渲染）
+    """
+    root = _tracer.start(name, root=True, **attributes)
+    if root is not None:
+        root._token = _current.set(root)
+    return root
+
+
+def end_trace(root: Optional[Span]) -> Optional[str]:
+    """结束start_trace开始的链路，返回链路ID"""
+    if root is None:
+        return None
+    token, root._token = root._token, None
+    if token is not None:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # 在其它上下文中结束（不应发生），只清除当前区间
+            _current.set(None)
+    _tracer.finish(root)
+    return root.trace_id
+
+
+def record_span(name: str, duration: float, **attributes) -> None:
+    """在当前链路下补记一个已经结束的区间（用于生成器等无法用with包住的阶段）"""
+    tracer = _tracer
+    current = tracer.start(name, **attributes)
+    if current is None:
+        return
+    offset = int(duration * 1e9)
+    current.start_ns -= offset
+    current._started -= offset
+    tracer.finish(current)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current.get()
+    return current.trace_id if current is not None else None
+
+
+def wrap(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    让提交到线程池的函数在调用方当前上下文的副本中执行，子线程中的区间因此记录在同一条链路下
+    每次提交都需要重新调用wrap（同一个上下文副本不能同时在两个线程中进入）
+    """
+    if _current.get() is None:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def to_chrome_events(spans: List[Span]) -> List[Dict]:
+    """转换为Chrome trace-event格式的事件列表（完整事件"X"，加上线程名元数据）"""
+    pid = os.getpid()
+    events = []
+    threads = {}
+    for s in spans:
+        threads.setdefault(s.thread_id, s.thread_name)
+        args = dict(s.attributes)
+        args["trace_id"] = s.trace_id
+        events.append({
+            "name": s.name,
+            "cat": "keyword",
+            "ph": "X",
+            "ts": s.start_ns / 1000,
+            "dur": (s.end_ns - s.start_ns) / 1000,
+            "pid": pid,
+            "tid": s.thread_id,
+            "args": args,
+        })
+    for tid, thread_name in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+    return events
+
+
+def to_chrome_json(spans: List[Span]) -> str:
+    """一条链路的Chrome trace-event JSON（可直接在chrome://tracing或Perfetto中打开）"""
+    return json.dumps({"traceEvents": to_chrome_events(spans), "displayTimeUnit": "ms"}, ensure_ascii=False)
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Span]) -> Dict:
+    """转换为OTLP/JSON的ExportTraceServiceRequest（OpenTelemetry Collector的文件接收器可直接读取）"""
+    otlp_spans = []
+    for s in spans:
+        attributes = dict(s.attributes)
+        attributes["thread.name"] = s.thread_name
+        error = attributes.get("error")
+        otlp_spans.append({
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": s.parent_id or "",
+            "name": s.name,
+            "kind": 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+            "status": {"code": 2, "message": str(error)} if error else {},
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+        }]
+    }
+
+
+def to_otlp_json(spans: List[Span]) -> str:
+    return json.dumps(to_otlp(spans), ensure_ascii=False)
+
+
+def summarize(spans: List[Span]) -> List[Dict]:
+    """按区间名汇总耗时（次数、合计、最大），按合计耗时降序；并发的子区间合计可能超过根区间"""
+    totals: Dict[str, Dict] = {}
+    for s in spans:
+        entry = totals.setdefault(s.name, {"stage": s.name, "count": 0, "total": 0.0, "max": 0.0})
+        entry["count"] += 1
+        entry["total"] += s.duration
+        entry["max"] = max(entry["max"], s.duration)
+    return sorted(totals.values(), key=lambda entry: entry["total"], reverse=True)
+
+
+class SamplingProfiler:
+    """
+    采样分析器：后台线程按固定间隔读取所有线程的调用栈并累计，
+    与cProfile不同，它同样能看到线程池中执行的网络请求和解析，开销与采样间隔成正比而与调用次数无关
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def __enter__(self) -> "SamplingProfiler":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """折叠栈格式：每行“线程;外层函数;...;内层函数 次数”"""
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def top(self, limit: int = 20) -> List[Dict]:
+        """按自身采样数排序的最热函数"""
+        own: Counter = Counter()
+        for stack, count in self._stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        total = max(sum(own.values()), 1)
+        return [
+            {"function": name, "samples": count, "share": count / total}
+            for name, count in own.most_common(limit)
+        ]
@@ -3,9 +3,40 @@
 处理DeepSeek API调用和JSON解析（通过OpenAI SDK）
 """
 
+import hashlib
 import json
-from typing import Dict, List, Optional
-from openai import OpenAI
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from cache import get_response_cache, make_cache_key, normalize_seed_keyword
+from client_pool import api_key_hash, get_client
+from hedging import HedgeCancelled, get_hedger
+from json_stream import KeywordStreamParser
+from keyword_schema import (
+    COMPACT_INSIGHT_FIELD,
+    COMPACT_KEYWORDS_FIELD,
+    DEFAULT_SCORE,
+    coerce_score,
+    expand_compact_keyword,
+    loads,
+    loads_lenient,
+    normalize_intent,
+    parse_market_response,
+    salvage_entries,
+    validate_market_result
+)
+import metrics
+import tracing
+from rate_limit import estimate_tokens, get_rate_limiter
+from seed_index import get_seed_index
+from singleflight import FlightAbandoned, get_single_flight
+
+# 多市场并发生成的默认并发数和上限
+DEFAULT_MAX_WORKERS = 8
+MAX_WORKERS_LIMIT = 16
 
 # 国际化翻译字典
 TRANSLATIONS = {
@@ -37,6 +68,39 @@ TRANSLATIONS = {
         "error_no_market": "❌ 请至少选择一个目标市场！",
         "processing_status": "正在处理 {country} ({language})... ({current}/{total})",
         "processing_complete": "✅ 所有市场处理完成！",
+        "market_done_status": "已完成 {country} ({language})... ({current}/{total})",
+        "concurrency_label": "并发请求数",
+        "concurrency_help": "同时处理的市场数量。数值越大整体越快，但更容易触发API限流",
+        "batch_by_language_label": "合并同语言市场",
+        "batch_by_language_help": "将使用同一语言的市场合并为一次API请求，减少请求次数和提示词消耗",
+        "hedge_requests_label": "对冲慢请求",
+        "hedge_requests_help": "某个市场的请求明显慢于平时（超过近期p90耗时）时再发一个相同请求，先返回的结果胜出；最多约10%的请求会被对冲",
+        "wire_format_label": "响应格式",
+        "wire_format_help": "紧凑格式让模型以位置数组输出关键词、理由限长（精简格式不输出理由），输出令牌和等待时间明显减少；紧凑格式下不合并同语言市场",
+        "wire_format_options": {"full": "完整", "compact": "紧凑（理由限长）", "minimal": "精简（无理由）"},
+        "time_budget_label": "时间预算（秒）",
+        "time_budget_help": "本次生成的时间上限，0表示不限时。到时仍未完成的市场会被跳过，已完成的结果照常显示，之后可以续跑",
+        "prioritize_markets_label": "优先生成主要市场",
+        "prioritize_markets_help": "按市场规模而不是选择顺序安排生成顺序，时间预算不足时先完成更重要的市场",
+        "use_job_queue_label": "后台运行",
+        "use_job_queue_help": "把生成任务提交到后台工作进程执行，页面只轮询结果；刷新或关闭页面不会中断生成，VIP用户的任务优先执行",
+        "job_progress_status": "⏳ 后台生成中：{done}/{total} 个市场已完成，前面还有 {queued} 个排队任务",
+        "job_no_workers": "⚠️ 暂无可用的后台工作进程，请在服务器上运行 python job_queue.py worker（与页面使用相同的KEYWORD_QUEUE_SECRET）",
+        "job_starting_workers": "⚠️ 暂无可用的后台工作进程，正在启动……",
+        "stream_results_label": "实时显示结果",
+        "stream_results_help": "边生成边显示关键词，无需等待所有市场完成（此模式下不合并同语言市场）",
+        "live_results_caption": "⏳ 实时结果（生成中，完成后将按AI Hotness排序）",
+        "prompt_cache_stats": "🧠 上下文缓存命中率：{hit_rate:.0%}（命中 {hit} / 未命中 {miss} 提示词令牌，{calls} 次调用）",
+        "metrics_panel_title": "📈 性能指标（管理员）",
+        "metrics_empty": "暂无调用记录",
+        "metrics_download": "📥 下载Prometheus指标",
+        "profile_run_label": "采样分析生成运行",
+        "profile_run_help": "每次生成时在后台按5毫秒间隔采样所有线程的调用栈（包括并发的网络请求），结果以折叠栈格式下载，可用speedscope或flamegraph.pl查看",
+        "trace_panel_title": "⏱️ 最近一次运行的链路",
+        "trace_panel_caption": "各阶段合计耗时（并发的市场会重叠，合计可能超过整次运行）。导出的链路可在Perfetto / chrome://tracing或OpenTelemetry工具中查看",
+        "trace_download_chrome": "📥 下载链路（Chrome Trace）",
+        "trace_download_otlp": "📥 下载链路（OTLP JSON）",
+        "profile_download": "📥 下载采样分析（折叠栈）",
         "market_insights_title": "### 💡 市场洞察摘要",
         "keywords_list_title": "### 📋 本地化关键词列表（所有市场）",
         "col_序号": "序号",
@@ -50,7 +114,17 @@ TRANSLATIONS = {
         "hotness_help": "基于AI训练数据估算的相对流行度分数（0-100），不是真实的Google搜索数据",
         "total_stats": "**总计**：{count} 个关键词，覆盖 {markets} 个市场",
         "download_btn": "📥 下载为CSV文件（包含所有市场）",
+        "download_parquet_btn": "📥 下载为Parquet文件",
+        "download_xlsx_btn": "📥 下载为Excel文件",
         "warning_no_keywords": "⚠️ 未生成任何关键词，请检查API响应格式",
+        "pending_markets_info": "ℹ️ 以下新选择的市场尚未生成，点击生成按钮只会获取这些市场：{markets}",
+        "partial_run_warning": "⚠️ 本次运行完成 {done} 个市场，失败 {failed} 个，跳过 {skipped} 个。已完成的结果见下方，其余市场可以稍后续跑。",
+        "market_status_title": "📋 市场状态：{done}/{total} 个已完成",
+        "status_done": "✅ 已完成",
+        "status_failed": "❌ 失败",
+        "status_skipped": "⏭️ 已跳过（时间预算用完）",
+        "status_pending": "⏳ 未生成",
+        "resume_btn": "▶️ 续跑未完成的市场",
         "error_format": "❌ 数据格式错误：{error}",
         "error_generate": "❌ 生成关键词时出错：{error}",
         "info_error_help": "💡 提示：如果没有输入API密钥，将自动使用模拟数据。如果输入了API密钥仍出现错误，请检查密钥是否正确。您可以在侧边栏点击链接获取API密钥。",
@@ -104,6 +178,39 @@ TRANSLATIONS = {
         "error_no_market": "❌ Please select at least one target market!",
         "processing_status": "Processing {country} ({language})... ({current}/{total})",
         "processing_complete": "✅ All markets processed!",
+        "market_done_status": "Finished {country} ({language})... ({current}/{total})",
+        "concurrency_label": "Concurrent Requests",
+        "concurrency_help": "Number of markets processed at the same time. Higher is faster overall but more likely to hit API rate limits",
+        "batch_by_language_label": "Batch Same-Language Markets",
+        "batch_by_language_help": "Combine markets that share a language into one API request to cut request count and prompt tokens",
+        "hedge_requests_label": "Hedge Slow Requests",
+        "hedge_requests_help": "When a market's request runs past the recent p90 latency, send a duplicate and keep whichever answers first; at most about 10% of requests are hedged",
+        "wire_format_label": "Response Format",
+        "wire_format_help": "Compact formats make the model return keywords as positional arrays with a short rationale (Minimal drops it), cutting output tokens and wait time; same-language batching is not used with compact formats",
+        "wire_format_options": {"full": "Full", "compact": "Compact (short rationale)", "minimal": "Minimal (no rationale)"},
+        "time_budget_label": "Time Budget (seconds)",
+        "time_budget_help": "Upper limit for this run, 0 means no limit. Markets still unfinished at the deadline are skipped; finished results are shown and the rest can be resumed later",
+        "prioritize_markets_label": "Major Markets First",
+        "prioritize_markets_help": "Schedule markets by market size instead of selection order, so the most important ones finish first when time is short",
+        "use_job_queue_label": "Run in Background",
+        "use_job_queue_help": "Submit generation to background worker processes and poll for results; reloading or closing the page does not interrupt the run, and VIP jobs are scheduled first",
+        "job_progress_status": "⏳ Generating in background: {done}/{total} markets finished, {queued} jobs queued ahead",
+        "job_no_workers": "⚠️ No background workers available. Run python job_queue.py worker on the server (with the same KEYWORD_QUEUE_SECRET as the app)",
+        "job_starting_workers": "⚠️ No background workers available, starting one…",
+        "stream_results_label": "Show Results Live",
+        "stream_results_help": "Show keywords as they are generated instead of waiting for all markets (same-language batching is not used in this mode)",
+        "live_results_caption": "⏳ Live results (generating; will be sorted by AI Hotness when finished)",
+        "prompt_cache_stats": "🧠 Context cache hit rate: {hit_rate:.0%} ({hit} hit / {miss} missed prompt tokens over {calls} calls)",
+        "metrics_panel_title": "📈 Performance Metrics (Admin)",
+        "metrics_empty": "No calls recorded yet",
+        "metrics_download": "📥 Download Prometheus Metrics",
+        "profile_run_label": "Profile Generation Runs",
+        "profile_run_help": "Sample the call stacks of all threads every 5 ms during each run (including concurrent network requests); download as folded stacks for speedscope or flamegraph.pl",
+        "trace_panel_title": "⏱️ Last Run Trace",
+        "trace_panel_caption": "Total time per stage (concurrent markets overlap, so totals can exceed the whole run). Exported traces open in Perfetto / chrome://tracing or OpenTelemetry tools",
+        "trace_download_chrome": "📥 Download Trace (Chrome)",
+        "trace_download_otlp": "📥 Download Trace (OTLP JSON)",
+        "profile_download": "📥 Download Profile (Folded Stacks)",
         "market_insights_title": "### 💡 Market Insights Summary",
         "keywords_list_title": "### 📋 Localized Keywords List (All Markets)",
         "col_序号": "No.",
@@ -117,7 +224,17 @@ TRANSLATIONS = {
         "hotness_help": "AI-estimated relative popularity score (0-100) based on training data, not real Google search data",
         "total_stats": "**Total**: {count} keywords covering {markets} markets",
         "download_btn": "📥 Download as CSV (All Markets)",
+        "download_parquet_btn": "📥 Download as Parquet",
+        "download_xlsx_btn": "📥 Download as Excel",
         "warning_no_keywords": "⚠️ No keywords generated. Please check API response format.",
+        "pending_markets_info": "ℹ️ These newly selected markets have not been generated yet. Clicking generate will only fetch them: {markets}",
+        "partial_run_warning": "⚠️ This run finished {done} markets, {failed} failed and {skipped} were skipped. Finished results are shown below; the rest can be resumed later.",
+        "market_status_title": "📋 Market Status: {done}/{total} finished",
+        "status_done": "✅ Done",
+        "status_failed": "❌ Failed",
+        "status_skipped": "⏭️ Skipped (time budget used up)",
+        "status_pending": "⏳ Not generated",
+        "resume_btn": "▶️ Resume Unfinished Markets",
         "error_format": "❌ Data format error: {error}",
         "error_generate": "❌ Error generating keywords: {error}",
         "info_error_help": "💡 Tip: If no API key is entered, mock data will be used automatically. If you entered an API key and still see errors, please check if the key is correct. You can click the link in the sidebar to get an API key.",
@@ -273,6 +390,289 @@ MARKET_CONFIG = {
     "Cape Verde": "Portuguese",
 }
 
+# 市场名称列表（模块级常量，Streamlit每次重跑时直接复用）
+MARKET_NAMES = list(MARKET_CONFIG.keys())
+
+
+# DeepSeek模型配置
+DEEPSEEK_MODEL = "deepseek-chat"
+
+# 提示词布局：系统提示词完全静态，每次请求变化的参数全部放在用户消息末尾，
+# 这样所有请求共享尽可能长的字节级相同前缀，可以命中DeepSeek的上下文缓存
+
+# 系统提示词：指导LLM作为本地SEO专家，返回严格JSON格式
+SYSTEM_PROMPT = """You are an experienced local SEO specialist focusing on search intent and keyword strategies in target markets.
+
+Each request gives you an English seed keyword, a target market, a target language and an explanation language.
+
+Your tasks are:
+1. Analyze the search intent of the English seed keyword in the target market
+2. Generate localized keywords, not direct translations
+3. Consider local consumer search habits, language conventions, and cultural background
+4. Estimate the relative popularity of each keyword (based on your training data knowledge)
+5. Return a response in strict JSON format
+
+Required JSON format:
+{
+  "market_insight": "A summary of the local market search landscape (in the explanation language)",
+  "keywords": [
+    {
+      "native_term": "Local keyword (in target language)",
+      "english_translation": "English translation",
+      "intent_type": "Primary" | "Synonym" | "Long-tail",
+      "rationale": "Explanation of why this keyword was chosen (in the explanation language)",
+      "popularity_score": integer (0-100)
+    }
+  ]
+}
+
+Important rules:
+- intent_type must be one of: "Primary", "Synonym", or "Long-tail"
+- Generate 5-8 high-quality keywords
+- Consider different search intents: purchase intent, informational intent, navigational intent, etc.
+- Do not directly translate; generate keywords based on search intent and local habits
+- **popularity_score rules**:
+  * popularity_score must be an integer from 0 to 100
+  * 100 = Extremely common head term (e.g., "Rasenmähroboter" in the German market should score 90-100)
+  * 80-99 = Very popular keywords
+  * 60-79 = Moderately popular keywords
+  * 40-59 = Less used keywords
+  * 0-39 = Very rare long-tail keywords
+  * You must estimate this score based on knowledge from your training data; common head terms should score high, long-tail specific queries should score low
+- **CRITICAL: Output the 'market_insight' and 'rationale' fields strictly in the explanation language. For example, if the explanation language is English, explain the German keywords using English.**
+- **Important: Must return raw JSON string, do not use Markdown code block format (do not use ```json markers), return JSON object directly**"""
+
+# 紧凑线格式的系统提示词模板：关键词用位置数组输出，意图用单字母代码，显著减少输出令牌
+# {rationale_format} 和 {rationale_rule} 决定理由字段是限长输出还是完全省略
+COMPACT_SYSTEM_PROMPT_TEMPLATE = """You are an experienced local SEO specialist focusing on search intent and keyword strategies in target markets.
+
+Each request gives you an English seed keyword, a target market, a target language and an explanation language.
+
+Your tasks are:
+1. Analyze the search intent of the English seed keyword in the target market
+2. Generate localized keywords, not direct translations
+3. Consider local consumer search habits, language conventions, and cultural background
+4. Estimate the relative popularity of each keyword (based on your training data knowledge)
+5. Return a response in strict compact JSON format
+
+Required compact JSON format (no extra whitespace):
+{{"i":"One-sentence summary of the local market search landscape (in the explanation language)","k":[["Local keyword (in target language)","English translation","P",95{rationale_format}]]}}
+
+Each element of "k" is a positional array: [native term, English translation, intent code, popularity score{rationale_field}].
+
+Important rules:
+- The intent code must be one of: "P" (Primary), "S" (Synonym), "L" (Long-tail)
+- Generate 5-8 high-quality keywords
+- Consider different search intents: purchase intent, informational intent, navigational intent, etc.
+- Do not directly translate; generate keywords based on search intent and local habits
+- The popularity score is an integer from 0 to 100: 90-100 extremely common head terms, 60-89 popular, 40-59 less used, 0-39 rare long-tail queries
+{rationale_rule}
+- **Important: Must return raw JSON string, do not use Markdown code block format (do not use ```json markers), return JSON object directly**"""
+
+# 紧凑线格式中理由的最大词数
+COMPACT_RATIONALE_MAX_WORDS = 12
+
+# 紧凑线格式：理由限长
+COMPACT_SYSTEM_PROMPT = COMPACT_SYSTEM_PROMPT_TEMPLATE.format(
+    rationale_format=',"Short rationale (in the explanation language)"',
+    rationale_field=", rationale",
+    rationale_rule=(
+        f"- The rationale must be at most {COMPACT_RATIONALE_MAX_WORDS} words\n"
+        "- **CRITICAL: Output the \"i\" value and the rationale strictly in the explanation language.**"
+    )
+)
+
+# 最小线格式：不输出理由
+MINIMAL_SYSTEM_PROMPT = COMPACT_SYSTEM_PROMPT_TEMPLATE.format(
+    rationale_format="",
+    rationale_field="",
+    rationale_rule=(
+        "- Do not output any rationale\n"
+        "- **CRITICAL: Output the \"i\" value strictly in the explanation language.**"
+    )
+)
+
+# 用户提示词模板：只包含每次请求变化的参数
+USER_PROMPT_TEMPLATE = """Seed keyword: {seed_keyword}
+Target market: {target_country}
+Target language: {target_language}
+Explanation language: {interface_lang_desc}"""
+
+# 同语言多市场批量请求的系统提示词：一次请求返回每个国家各自的结果
+BATCH_SYSTEM_PROMPT = """You are an experienced local SEO specialist focusing on search intent and keyword strategies in target markets.
+
+Each request gives you an English seed keyword, several target markets that all share one target language, and an explanation language.
+
+Your tasks are:
+1. Analyze the search intent of the English seed keyword in each of the target markets
+2. Generate localized keywords for each market separately, not direct translations
+3. Consider each country's own consumer search habits, regional vocabulary, and cultural background
+4. Estimate the relative popularity of each keyword in that specific market (based on your training data knowledge)
+5. Return a response in strict JSON format
+
+Required JSON format:
+{
+  "markets": {
+    "<Country name exactly as given>": {
+      "market_insight": "A summary of the local market search landscape (in the explanation language)",
+      "keywords": [
+        {
+          "native_term": "Local keyword (in target language)",
+          "english_translation": "English translation",
+          "intent_type": "Primary" | "Synonym" | "Long-tail",
+          "rationale": "Explanation of why this keyword was chosen (in the explanation language)",
+          "popularity_score": integer (0-100)
+        }
+      ]
+    }
+  }
+}
+
+Important rules:
+- Include exactly one entry in "markets" for every requested country, using the country name exactly as given
+- intent_type must be one of: "Primary", "Synonym", or "Long-tail"
+- Generate 5-8 high-quality keywords per market
+- Consider different search intents: purchase intent, informational intent, navigational intent, etc.
+- Do not directly translate; generate keywords based on search intent and local habits, and reflect regional differences between the markets
+- **popularity_score rules**:
+  * popularity_score must be an integer from 0 to 100
+  * 100 = Extremely common head term (e.g., "Rasenmähroboter" in the German market should score 90-100)
+  * 80-99 = Very popular keywords
+  * 60-79 = Moderately popular keywords
+  * 40-59 = Less used keywords
+  * 0-39 = Very rare long-tail keywords
+  * You must estimate this score based on knowledge from your training data; common head terms should score high, long-tail specific queries should score low
+- **CRITICAL: Output the 'market_insight' and 'rationale' fields strictly in the explanation language. For example, if the explanation language is English, explain the German keywords using English.**
+- **Important: Must return raw JSON string, do not use Markdown code block format (do not use ```json markers), return JSON object directly**"""
+
+# 同语言多市场批量请求的用户提示词模板
+BATCH_USER_PROMPT_TEMPLATE = """Seed keyword: {seed_keyword}
+Target markets: {target_countries}
+Target language: {target_language}
+Explanation language: {interface_lang_desc}"""
+
+# 同一市场多种子打包请求的系统提示词：一次请求返回每个种子关键词各自的结果
+PACKED_SYSTEM_PROMPT = """You are an experienced local SEO specialist focusing on search intent and keyword strategies in target markets.
+
+Each request gives you a list of English seed keywords, one target market, its target language and an explanation language.
+
+Your tasks are:
+1. Analyze the search intent of each English seed keyword in the target market, independently of the other seeds
+2. Generate localized keywords for each seed separately, not direct translations
+3. Consider local consumer search habits, language conventions, and cultural background
+4. Estimate the relative popularity of each keyword (based on your training data knowledge)
+5. Return a response in strict JSON format
+
+Required JSON format:
+{
+  "results": {
+    "<Seed keyword exactly as given>": {
+      "market_insight": "A summary of the local market search landscape for this seed (in the explanation language)",
+      "keywords": [
+        {
+          "native_term": "Local keyword (in target language)",
+          "english_translation": "English translation",
+          "intent_type": "Primary" | "Synonym" | "Long-tail",
+          "rationale": "Explanation of why this keyword was chosen (in the explanation language)",
+          "popularity_score": integer (0-100)
+        }
+      ]
+    }
+  }
+}
+
+Important rules:
+- Include exactly one entry in "results" for every seed keyword, using the seed keyword exactly as given
+- intent_type must be one of: "Primary", "Synonym", or "Long-tail"
+- Generate 5-8 high-quality keywords per seed
+- Consider different search intents: purchase intent, informational intent, navigational intent, etc.
+- Do not directly translate; generate keywords based on search intent and local habits
+- **popularity_score rules**:
+  * popularity_score must be an integer from 0 to 100
+  * 100 = Extremely common head term (e.g., "Rasenmähroboter" in the German market should score 90-100)
+  * 80-99 = Very popular keywords
+  * 60-79 = Moderately popular keywords
+  * 40-59 = Less used keywords
+  * 0-39 = Very rare long-tail keywords
+  * You must estimate this score based on knowledge from your training data; common head terms should score high, long-tail specific queries should score low
+- **CRITICAL: Output the 'market_insight' and 'rationale' fields strictly in the explanation language. For example, if the explanation language is English, explain the German keywords using English.**
+- **Important: Must return raw JSON string, do not use Markdown code block format (do not use ```json markers), return JSON object directly**"""
+
+# 多种子打包请求的用户提示词模板（种子列表以JSON数组给出，保证原样返回）
+PACKED_USER_PROMPT_TEMPLATE = """Seed keywords: {seed_keywords}
+Target market: {target_country}
+Target language: {target_language}
+Explanation language: {interface_lang_desc}"""
+
+# 单次批量请求最多包含的市场数（控制提示词长度；输出长度由BATCH_OUTPUT_TOKEN_BUDGET控制）
+MAX_MARKETS_PER_BATCH = 10
+
+# 每个市场预计的输出令牌数（用于限流时估算令牌用量）
+EXPECTED_OUTPUT_TOKENS_PER_MARKET = 1000
+
+# 多种子打包：单次请求的输出令牌预算和上限（deepseek-chat最多输出8K令牌）
+PACK_OUTPUT_TOKEN_BUDGET = 7000
+PACK_MAX_OUTPUT_TOKENS = 8192
+MAX_SEEDS_PER_PACK = 10
+
+# 多市场批量请求：单次请求的输出令牌预算和上限（默认上限4096会截断多个市场的响应）
+BATCH_OUTPUT_TOKEN_BUDGET = PACK_OUTPUT_TOKEN_BUDGET
+BATCH_MAX_OUTPUT_TOKENS = PACK_MAX_OUTPUT_TOKENS
+
+# 单市场响应无法解析或修复时，只针对该市场重新请求的次数
+MAX_FORMAT_RETRIES = 1
+
+# 响应线格式：full为完整字典格式（默认），compact为位置数组且理由限长，minimal为位置数组且不含理由
+WIRE_FULL = "full"
+WIRE_COMPACT = "compact"
+WIRE_MINIMAL = "minimal"
+WIRE_FORMATS = (WIRE_FULL, WIRE_COMPACT, WIRE_MINIMAL)
+
+# 各线格式的系统提示词
+WIRE_SYSTEM_PROMPTS = {
+    WIRE_FULL: SYSTEM_PROMPT,
+    WIRE_COMPACT: COMPACT_SYSTEM_PROMPT,
+    WIRE_MINIMAL: MINIMAL_SYSTEM_PROMPT
+}
+
+# 各线格式单市场请求的输出令牌上限（None表示不限制）和预计输出令牌数（用于限流估算）
+WIRE_MAX_OUTPUT_TOKENS = {WIRE_FULL: None, WIRE_COMPACT: 700, WIRE_MINIMAL: 450}
+WIRE_EXPECTED_OUTPUT_TOKENS = {
+    WIRE_FULL: EXPECTED_OUTPUT_TOKENS_PER_MARKET,
+    WIRE_COMPACT: 450,
+    WIRE_MINIMAL: 250
+}
+
+# 多市场运行中每个市场的状态
+MARKET_DONE = "done"
+MARKET_FAILED = "failed"
+MARKET_SKIPPED = "skipped"
+
+# 提示词模板指纹：模板或模型变化后旧缓存自动失效
+PROMPT_TEMPLATE_HASH = hashlib.sha256(
+    (
+        DEEPSEEK_MODEL
+        + SYSTEM_PROMPT
+        + USER_PROMPT_TEMPLATE
+        + BATCH_SYSTEM_PROMPT
+        + BATCH_USER_PROMPT_TEMPLATE
+        + PACKED_SYSTEM_PROMPT
+        + PACKED_USER_PROMPT_TEMPLATE
+    ).encode("utf-8")
+).hexdigest()[:16]
+
+# 各线格式的缓存指纹：完整格式沿用PROMPT_TEMPLATE_HASH，已有缓存继续有效；
+# 紧凑格式的结果（理由较短或为空）与完整格式分开缓存
+WIRE_TEMPLATE_HASHES = {
+    WIRE_FULL: PROMPT_TEMPLATE_HASH,
+    **{
+        wire_format: hashlib.sha256(
+            (DEEPSEEK_MODEL + WIRE_SYSTEM_PROMPTS[wire_format] + USER_PROMPT_TEMPLATE).encode("utf-8")
+        ).hexdigest()[:16]
+        for wire_format in (WIRE_COMPACT, WIRE_MINIMAL)
+    }
+}
+
 
 def get_mock_response(keyword: str, target_language: str, target_country: str) -> Dict:
     """
@@ -322,12 +722,114 @@ def get_mock_response(keyword: str, target_language: str, target_country: str) -
     return mock_data
 
 
+def _build_prompts(
+    seed_keyword: str,
+    target_language: str,
+    target_country: str,
+    interface_lang: str,
+    wire_format: str = WIRE_FULL
+) -> Tuple[str, str]:
+    """
+    构建单市场请求的系统提示词和用户提示词（系统提示词由线格式决定）
+    """
+    # 确定界面语言描述
+    interface_lang_desc = "English" if interface_lang == "English" else "Chinese"
+    
+    user_prompt = USER_PROMPT_TEMPLATE.format(
+        seed_keyword=seed_keyword,
+        target_country=target_country,
+        target_language=target_language,
+        interface_lang_desc=interface_lang_desc
+    )
+    return WIRE_SYSTEM_PROMPTS[wire_format], user_prompt
+
+
+def _max_tokens_kwargs(wire_format: str) -> Dict:
+    """线格式对应的max_tokens请求参数（不限制时为空）"""
+    max_tokens = WIRE_MAX_OUTPUT_TOKENS[wire_format]
+    return {} if max_tokens is None else {"max_tokens": max_tokens}
+
+
+def _iter_sse_chunks(response) -> Iterator[Dict]:
+    """
+    逐个解析原始SSE响应中的分块（直接用orjson解析，不为每个分块构建SDK模型对象）
+    生成器关闭时关闭底层连接
+    """
+    try:
+        for line in response.iter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            yield loads(data)
+    finally:
+        response.close()
+
+
+def _request_market_cancellable(
+    client,
+    limiter,
+    system_prompt: str,
+    user_prompt: str,
+    estimated: int,
+    target_country: str,
+    cancel: threading.Event,
+    wire_format: str = WIRE_FULL
+) -> str:
+    """
+    以流式方式请求单个市场，返回完整的响应文本（供对冲模式使用，解析由调用方在对冲之外单独计时）
+    cancel被设置时关闭流，服务端随之停止生成，不再为被取消的一方继续花费输出令牌
+    
+    返回:
+        响应文本
+    异常:
+        HedgeCancelled: 请求被取消
+    """
+    parts: List[str] = []
+    stream = limiter.stream(
+        lambda: _iter_sse_chunks(client.chat.completions.with_raw_response.create(
+            model=DEEPSEEK_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True},
+            **_max_tokens_kwargs(wire_format)
+        ).http_response),
+        estimated_tokens=estimated,
+        on_retry=lambda attempt, error: metrics.record_retry(target_country)
+    )
+    try:
+        for chunk in stream:
+            if cancel.is_set():
+                raise HedgeCancelled(target_country)
+            usage = chunk.get("usage")
+            if usage:
+                limiter.record_usage(estimated, usage.get("total_tokens"))
+                metrics.record_usage(target_country, SimpleNamespace(**usage))
+            choices = chunk.get("choices")
+            if choices:
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    parts.append(delta)
+    finally:
+        # 关闭生成器会释放并发名额并关闭底层连接
+        stream.close()
+    return "".join(parts)
+
+
 def generate_localized_keywords(
     api_key: str,
     seed_keyword: str,
     target_language: str,
     target_country: str,
-    interface_lang: str = "Chinese"
+    interface_lang: str = "Chinese",
+    hedge: bool = False,
+    wire_format: str = WIRE_FULL
 ) -> Dict:
     """
     调用DeepSeek API生成本地化关键词（通过OpenAI SDK）
@@ -337,95 +839,331 @@ def generate_localized_keywords(
         seed_keyword: 英文种子关键词
         target_language: 目标语言
         target_country: 目标国家
+        hedge: 是否启用对冲请求（请求超过近期p90耗时后再发一个相同请求，先返回有效结果的一方胜出）
+        wire_format: 响应线格式（WIRE_FORMATS之一），紧凑格式的响应会展开为完整的字典格式
     
     返回:
         包含市场洞察和关键词列表的字典
     """
-    # 初始化DeepSeek客户端（使用OpenAI兼容的API）
-    client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+    # 获取共享的DeepSeek客户端（使用OpenAI兼容的API，复用keep-alive连接）
+    client = get_client(api_key)
     
-    # 系统提示词：指导LLM作为本地SEO专家，返回严格JSON格式
-    # 确定界面语言描述
-    interface_lang_desc = "English" if interface_lang == "English" else "Chinese"
+    with metrics.timer("prompt_build", target_country):
+        system_prompt, user_prompt = _build_prompts(
+            seed_keyword, target_language, target_country, interface_lang, wire_format
+        )
+    
+    limiter = get_rate_limiter()
+    estimated = estimate_tokens(system_prompt + user_prompt) + WIRE_EXPECTED_OUTPUT_TOKENS[wire_format]
+    compact = wire_format != WIRE_FULL
     
-    system_prompt = f"""You are an experienced local SEO specialist focusing on search intent and keyword strategies in target markets.
+    hedger = get_hedger()
+    
+    try:
+        for attempt in range(MAX_FORMAT_RETRIES + 1):
+            if hedge:
+                # 对冲模式：每个请求都是可取消的流式请求，先收到完整响应的一方胜出；
+                # 网络计时和对冲阈值的耗时样本在收到响应时结束，解析与非对冲模式一样单独计时
+                with metrics.timer("network", target_country):
+                    response_text = hedger.run(
+                        lambda cancel: _request_market_cancellable(
+                            client, limiter, system_prompt, user_prompt, estimated, target_country, cancel,
+                            wire_format
+                        ),
+                        market=target_country
+                    )
+                try:
+                    with metrics.timer("parse", target_country):
+                        result, repaired = parse_market_response(response_text, compact=compact)
+                except ValueError:
+                    if attempt < MAX_FORMAT_RETRIES:
+                        metrics.record_retry(target_country)
+                        continue
+                    raise
+                if repaired:
+                    metrics.record_repair(target_country)
+                return result
+            
+            # 调用DeepSeek API（经过共享限流器，429/5xx会退避重试）
+            network_started = time.perf_counter()
+            with metrics.timer("network", target_country):
+                response = limiter.call(
+                    lambda: client.chat.completions.create(
+                        model=DEEPSEEK_MODEL,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        response_format={"type": "json_object"},  # 强制返回JSON格式
+                        temperature=0.7,
+                        **_max_tokens_kwargs(wire_format)
+                    ),
+                    estimated_tokens=estimated,
+                    on_retry=lambda attempt, error: metrics.record_retry(target_country)
+                )
+            # 未开启对冲的请求也记录耗时，使对冲阈值随时可用
+            hedger.observe(time.perf_counter() - network_started)
+            limiter.record_usage(estimated, response.usage.total_tokens if response.usage else None)
+            metrics.record_usage(target_country, response.usage)
+            
+            # 解析并验证JSON响应；截断或带代码块标记的响应会尽量修复
+            try:
+                with metrics.timer("parse", target_country):
+                    response_text = response.choices[0].message.content or ""
+                    result, repaired = parse_market_response(response_text, compact=compact)
+            except ValueError:
+                # 无法修复时只重新请求这一个市场
+                if attempt < MAX_FORMAT_RETRIES:
+                    metrics.record_retry(target_country)
+                    continue
+                raise
+            if repaired:
+                metrics.record_repair(target_country)
+            return result
+        
+    except json.JSONDecodeError as e:
+        error_msg = f"无法解析API返回的JSON：{str(e)}"
+        try:
+            error_msg += f"。原始响应：{response_text[:200]}"
+        except NameError:
+            pass
+        raise ValueError(error_msg)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise Exception(f"API调用失败：{str(e)}")
 
-Your tasks are:
-1. Analyze the search intent of English seed keywords in target markets
-2. Generate localized keywords, not direct translations
-3. Consider local consumer search habits, language conventions, and cultural background
-4. Estimate the relative popularity of each keyword (based on your training data knowledge)
-5. Return a response in strict JSON format
 
-Required JSON format:
-{{
-  "market_insight": "A summary of the local market search landscape (in {interface_lang_desc})",
-  "keywords": [
-    {{
-      "native_term": "Local keyword (in target language)",
-      "english_translation": "English translation",
-      "intent_type": "Primary" | "Synonym" | "Long-tail",
-      "rationale": "Explanation of why this keyword was chosen (in {interface_lang_desc})",
-      "popularity_score": integer (0-100)
-    }}
-  ]
-}}
+def generate_localized_keywords_batch(
+    api_key: str,
+    seed_keyword: str,
+    target_language: str,
+    target_countries: List[str],
+    interface_lang: str = "Chinese"
+) -> Dict[str, Dict]:
+    """
+    在一次DeepSeek请求中为多个同语言市场生成本地化关键词
+    
+    参数:
+        api_key: DeepSeek API密钥
+        seed_keyword: 英文种子关键词
+        target_language: 这些市场共同的目标语言
+        target_countries: 目标国家列表
+        interface_lang: 界面语言
+    
+    返回:
+        国家 -> 市场结果字典（与generate_localized_keywords的返回结构相同）
+        响应中缺失或格式不正确的国家不会出现在返回值中；响应被截断时保留其中已经完整的市场
+    """
+    client = get_client(api_key)
+    
+    interface_lang_desc = "English" if interface_lang == "English" else "Chinese"
+    
+    system_prompt = BATCH_SYSTEM_PROMPT
+    
+    user_prompt = BATCH_USER_PROMPT_TEMPLATE.format(
+        seed_keyword=seed_keyword,
+        target_countries=", ".join(target_countries),
+        target_language=target_language,
+        interface_lang_desc=interface_lang_desc
+    )
+    
+    limiter = get_rate_limiter()
+    estimated = (
+        estimate_tokens(system_prompt + user_prompt)
+        + EXPECTED_OUTPUT_TOKENS_PER_MARKET * len(target_countries)
+    )
+    
+    # 批量请求的指标按语言汇总
+    metrics_label = f"{target_language} (batch)"
+    
+    try:
+        with metrics.timer("network", metrics_label):
+            response = limiter.call(
+                lambda: client.chat.completions.create(
+                    model=DEEPSEEK_MODEL,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    response_format={"type": "json_object"},
+                    temperature=0.7,
+                    max_tokens=BATCH_MAX_OUTPUT_TOKENS
+                ),
+                estimated_tokens=estimated,
+                on_retry=lambda attempt, error: metrics.record_retry(metrics_label)
+            )
+        limiter.record_usage(estimated, response.usage.total_tokens if response.usage else None)
+        metrics.record_usage(metrics_label, response.usage)
+        
+        with metrics.timer("parse", metrics_label):
+            response_text = response.choices[0].message.content or ""
+            try:
+                payload = loads_lenient(response_text)
+                markets = payload.get("markets") if isinstance(payload, dict) else None
+            except json.JSONDecodeError:
+                # 响应被截断时保留已经完整的市场，其余市场由调用方单独请求
+                markets = salvage_entries(response_text, "markets")
+                if not markets:
+                    raise
+                metrics.record_repair(metrics_label)
+        
+        if not isinstance(markets, dict):
+            raise ValueError("API返回的JSON格式不正确，缺少markets字段")
+        
+        # 拆分回每个市场各自的结果
+        results = {}
+        with metrics.timer("validate", metrics_label):
+            for country in target_countries:
+                try:
+                    results[country] = validate_market_result(markets.get(country))
+                except (ValueError, TypeError):
+                    continue
+        return results
+        
+    except json.JSONDecodeError as e:
+        error_msg = f"无法解析API返回的JSON：{str(e)}"
+        try:
+            error_msg += f"。原始响应：{response_text[:200]}"
+        except NameError:
+            pass
+        raise ValueError(error_msg)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise Exception(f"API调用失败：{str(e)}")
 
-Important rules:
-- intent_type must be one of: "Primary", "Synonym", or "Long-tail"
-- Generate 5-8 high-quality keywords
-- Consider different search intents: purchase intent, informational intent, navigational intent, etc.
-- Do not directly translate; generate keywords based on search intent and local habits
-- **popularity_score rules**:
-  * popularity_score must be an integer from 0 to 100
-  * 100 = Extremely common head term (e.g., "Rasenmähroboter" in the German market should score 90-100)
-  * 80-99 = Very popular keywords
-  * 60-79 = Moderately popular keywords
-  * 40-59 = Less used keywords
-  * 0-39 = Very rare long-tail keywords
-  * You must estimate this score based on knowledge from your training data; common head terms should score high, long-tail specific queries should score low
-- **CRITICAL: Output the 'market_insight' and 'rationale' fields strictly in {interface_lang_desc}. For example, if the interface language is English, explain the German keywords using English.**
-- **Important: Must return raw JSON string, do not use Markdown code block format (do not use ```json markers), return JSON object directly**"""
+
+def plan_seed_packs(
+    seed_keywords: List[str],
+    output_token_budget: int = PACK_OUTPUT_TOKEN_BUDGET,
+    max_pack_size: int = MAX_SEEDS_PER_PACK
+) -> List[List[str]]:
+    """
+    根据调用前估算的令牌预算，把种子关键词切分成多个打包请求
+    每个种子预计消耗EXPECTED_OUTPUT_TOKENS_PER_MARKET个输出令牌，外加种子本身在输出中重复出现的令牌
     
-    user_prompt = f"""Generate localized keywords for the following English seed keyword in the {target_country} ({target_language}) market:
+    返回:
+        种子关键词分组列表，保持原有顺序
+    """
+    packs: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    for seed in seed_keywords:
+        cost = EXPECTED_OUTPUT_TOKENS_PER_MARKET + estimate_tokens(seed)
+        if current and (used + cost > output_token_budget or len(current) >= max_pack_size):
+            packs.append(current)
+            current = []
+            used = 0
+        current.append(seed)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
 
-Seed keyword: {seed_keyword}
 
-Target market: {target_country}
-Target language: {target_language}
+def plan_market_batches(
+    countries: List[str],
+    output_token_budget: int = BATCH_OUTPUT_TOKEN_BUDGET,
+    max_batch_size: int = MAX_MARKETS_PER_BATCH
+) -> List[List[str]]:
+    """
+    根据调用前估算的输出令牌预算，把同语言市场切分成多个批量请求
+    每个市场预计消耗EXPECTED_OUTPUT_TOKENS_PER_MARKET个输出令牌，外加国家名作为键在输出中出现的令牌
+    
+    返回:
+        国家分组列表，保持原有顺序
+    """
+    batches: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    for country in countries:
+        cost = EXPECTED_OUTPUT_TOKENS_PER_MARKET + estimate_tokens(country)
+        if current and (used + cost > output_token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current = []
+            used = 0
+        current.append(country)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
 
-Generate keywords based on search intent (not direct translation) and estimate popularity_score for each keyword (based on your training data knowledge). Return results in pure JSON format (do not use Markdown format). All explanations must be in {interface_lang_desc}."""
+
+def generate_localized_keywords_packed(
+    api_key: str,
+    seed_keywords: List[str],
+    target_language: str,
+    target_country: str,
+    interface_lang: str = "Chinese"
+) -> Dict[str, Dict]:
+    """
+    在一次DeepSeek请求中为同一市场的多个种子关键词生成本地化关键词
+    
+    参数:
+        api_key: DeepSeek API密钥
+        seed_keywords: 英文种子关键词列表
+        target_language: 目标语言
+        target_country: 目标国家
+        interface_lang: 界面语言
+    
+    返回:
+        种子关键词 -> 市场结果字典（与generate_localized_keywords的返回结构相同）
+        响应中缺失或格式不正确的种子不会出现在返回值中
+    """
+    client = get_client(api_key)
+    
+    interface_lang_desc = "English" if interface_lang == "English" else "Chinese"
+    
+    user_prompt = PACKED_USER_PROMPT_TEMPLATE.format(
+        seed_keywords=json.dumps(seed_keywords, ensure_ascii=False),
+        target_country=target_country,
+        target_language=target_language,
+        interface_lang_desc=interface_lang_desc
+    )
+    
+    limiter = get_rate_limiter()
+    estimated = (
+        estimate_tokens(PACKED_SYSTEM_PROMPT + user_prompt)
+        + EXPECTED_OUTPUT_TOKENS_PER_MARKET * len(seed_keywords)
+    )
     
     try:
-        # 调用DeepSeek API
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={"type": "json_object"},  # 强制返回JSON格式
-            temperature=0.7
-        )
+        with metrics.timer("network", target_country):
+            response = limiter.call(
+                lambda: client.chat.completions.create(
+                    model=DEEPSEEK_MODEL,
+                    messages=[
+                        {"role": "system", "content": PACKED_SYSTEM_PROMPT},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    response_format={"type": "json_object"},
+                    temperature=0.7,
+                    max_tokens=PACK_MAX_OUTPUT_TOKENS
+                ),
+                estimated_tokens=estimated,
+                on_retry=lambda attempt, error: metrics.record_retry(target_country)
+            )
+        limiter.record_usage(estimated, response.usage.total_tokens if response.usage else None)
+        metrics.record_usage(target_country, response.usage)
         
-        # 解析JSON响应
-        response_text = response.choices[0].message.content
-        result = json.loads(response_text)
+        with metrics.timer("parse", target_country):
+            response_text = response.choices[0].message.content or ""
+            payload = loads_lenient(response_text)
         
-        # 验证返回的数据结构
-        if "market_insight" not in result or "keywords" not in result:
-            raise ValueError("API返回的JSON格式不正确，缺少必要字段")
+        packed = payload.get("results") if isinstance(payload, dict) else None
+        if not isinstance(packed, dict):
+            raise ValueError("API返回的JSON格式不正确，缺少results字段")
         
-        # 验证每个关键词都有popularity_score字段
-        for kw in result.get("keywords", []):
-            if "popularity_score" not in kw:
-                # 如果没有提供，设置默认值
-                kw["popularity_score"] = 50
-            else:
-                # 确保popularity_score在0-100范围内
-                kw["popularity_score"] = max(0, min(100, int(kw.get("popularity_score", 50))))
-        
-        return result
+        # 拆分回每个种子各自的结果（模型可能改动大小写或空白，按规范化后的种子匹配）
+        by_normalized = {normalize_seed_keyword(key): value for key, value in packed.items()}
+        results = {}
+        for seed in seed_keywords:
+            try:
+                results[seed] = validate_market_result(by_normalized.get(normalize_seed_keyword(seed)))
+            except (ValueError, TypeError):
+                continue
+        return results
         
     except json.JSONDecodeError as e:
         error_msg = f"无法解析API返回的JSON：{str(e)}"
@@ -434,46 +1172,776 @@ Generate keywords based on search intent (not direct translation) and estimate p
         except NameError:
             pass
         raise ValueError(error_msg)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise Exception(f"API调用失败：{str(e)}")
+
+
+def stream_localized_keywords(
+    api_key: str,
+    seed_keyword: str,
+    target_language: str,
+    target_country: str,
+    interface_lang: str = "Chinese",
+    wire_format: str = WIRE_FULL
+) -> Iterator[Tuple[str, Any]]:
+    """
+    以流式方式调用DeepSeek API生成本地化关键词，边接收边解析
+    
+    参数:
+        与generate_localized_keywords相同（紧凑格式的事件同样展开为完整格式后产出）
+    
+    产出:
+        ("market_insight", str)  市场洞察生成完成时
+        ("keyword", dict)        每个关键词对象生成完成时
+        ("result", dict)         最后产出完整并经过验证的结果
+    """
+    client = get_client(api_key)
+    
+    with metrics.timer("prompt_build", target_country):
+        system_prompt, user_prompt = _build_prompts(
+            seed_keyword, target_language, target_country, interface_lang, wire_format
+        )
+    
+    limiter = get_rate_limiter()
+    estimated = estimate_tokens(system_prompt + user_prompt) + WIRE_EXPECTED_OUTPUT_TOKENS[wire_format]
+    compact = wire_format != WIRE_FULL
+    
+    if compact:
+        parser = KeywordStreamParser(COMPACT_KEYWORDS_FIELD, COMPACT_INSIGHT_FIELD)
+    else:
+        parser = KeywordStreamParser()
+    started = time.perf_counter()
+    try:
+        # 建立流的过程经过限流器重试，读取期间一直占用并发名额
+        stream = limiter.stream(
+            lambda: client.chat.completions.create(
+                model=DEEPSEEK_MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.7,
+                stream=True,
+                stream_options={"include_usage": True},  # 最后一个分块携带usage
+                **_max_tokens_kwargs(wire_format)
+            ),
+            estimated_tokens=estimated,
+            on_retry=lambda attempt, error: metrics.record_retry(target_country)
+        )
+        
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                limiter.record_usage(estimated, chunk.usage.total_tokens)
+                metrics.record_usage(target_country, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            for event, payload in parser.feed(delta):
+                if event == "keyword":
+                    if compact:
+                        payload = expand_compact_keyword(payload)
+                    # 两种格式都可能出现不是对象的数组元素（例如单独的字符串），跳过，最终结果由校验器处理
+                    if type(payload) is not dict:
+                        continue
+                    # 与校验器相同的规范化（coerce_score/normalize_intent），流式和非流式结果的分数一致
+                    payload["popularity_score"] = coerce_score(payload.get("popularity_score", DEFAULT_SCORE))
+                    payload["intent_type"] = normalize_intent(payload.get("intent_type"))
+                yield event, payload
+        
+        network_seconds = time.perf_counter() - started
+        metrics.CALL_DURATION.observe(network_seconds, stage="network", market=target_country)
+        tracing.record_span("network", network_seconds, market=target_country, stream=True)
+        
+        # 流结束后再完整解析一次，保证最终结果与非流式模式一致（截断的响应保留已完整的关键词）
+        with metrics.timer("parse", target_country):
+            result, repaired = parse_market_response(parser.text, compact=compact)
+        if repaired:
+            metrics.record_repair(target_country)
+        yield "result", result
+        
+    except json.JSONDecodeError as e:
+        raise ValueError(f"无法解析API返回的JSON：{str(e)}。原始响应：{parser.text[:200]}")
+    except ValueError:
+        raise
     except Exception as e:
         raise Exception(f"API调用失败：{str(e)}")
 
 
+def _cached_result(
+    cache_key: str,
+    seed_keyword: str,
+    target_language: str,
+    target_country: str,
+    interface_lang: str,
+    template_hash: str = PROMPT_TEMPLATE_HASH
+) -> Tuple[Optional[Dict], str]:
+    """
+    查找缓存结果：先按缓存键精确查找，未命中时在种子索引中查找相似的已回答种子，复用它在同一市场的缓存结果
+    
+    返回:
+        (缓存结果或None, 缓存状态："hit"精确命中 / "near"相似种子命中 / "miss"未命中)
+    """
+    with tracing.span("cache_lookup", market=target_country) as span:
+        cache = get_response_cache()
+        cached = cache.get(cache_key)
+        status = "hit"
+        if cached is None:
+            status = "miss"
+            for similar_seed, _ in get_seed_index().similar(seed_keyword):
+                cached = cache.get(make_cache_key(
+                    similar_seed, target_country, target_language, interface_lang, template_hash
+                ))
+                if cached is not None:
+                    status = "near"
+                    break
+        if span is not None:
+            span.set(cache=status)
+        return cached, status
+
+
+def _store_result(cache_key: str, seed_keyword: str, result: Dict) -> None:
+    """写入响应缓存，并把种子登记到近似匹配索引"""
+    get_response_cache().set(cache_key, result)
+    get_seed_index().add(seed_keyword)
+
+
+def _flight_key(cache_key: str, api_key: str) -> Tuple[str, str]:
+    """
+    请求合并的键：缓存键加上API密钥摘要
+    只合并使用同一密钥的请求，避免等待者拿到其它用户密钥的鉴权/额度错误，或把请求记到别人的账单上
+    """
+    return cache_key, api_key_hash(api_key)
+
+
 def get_keywords(
     api_key: Optional[str],
     seed_keyword: str,
     target_language: str,
     target_country: str,
-    interface_lang: str = "Chinese"
+    interface_lang: str = "Chinese",
+    use_cache: bool = True,
+    hedge: bool = False,
+    refresh: bool = False,
+    wire_format: str = WIRE_FULL
 ) -> Dict:
     """
     获取本地化关键词的主函数
     如果提供了API密钥，调用真实API；否则返回模拟数据
+    真实API的结果会写入响应缓存，相同请求再次调用时直接返回缓存结果
     
     参数:
         api_key: DeepSeek API密钥（可选）
         seed_keyword: 英文种子关键词
         target_language: 目标语言
         target_country: 目标国家
+        interface_lang: 界面语言
+        use_cache: 是否使用响应缓存
+        hedge: 是否对慢请求发出对冲请求
+        refresh: 不读取缓存而是重新生成，并用新结果覆盖缓存（缓存预热使用）
+        wire_format: 响应线格式，不同线格式的结果分开缓存
     
     返回:
         包含市场洞察和关键词列表的字典
     """
+    started = time.perf_counter()
     if api_key and api_key.strip():
-        # 使用真实API
+        # 先查缓存，命中时不调用API
+        template_hash = WIRE_TEMPLATE_HASHES[wire_format]
+        cache_key = make_cache_key(
+            seed_keyword, target_country, target_language, interface_lang, template_hash
+        )
+        if use_cache and not refresh:
+            cached, status = _cached_result(
+                cache_key, seed_keyword, target_language, target_country, interface_lang, template_hash
+            )
+            if cached is not None:
+                metrics.record_call(target_country, status, "success", time.perf_counter() - started)
+                return cached
+        
+        # 使用真实API；其它会话正在请求相同内容时等待并共享其结果
         try:
-            return generate_localized_keywords(
+            result, shared = get_single_flight().do(_flight_key(cache_key, api_key), lambda: generate_localized_keywords(
                 api_key=api_key,
                 seed_keyword=seed_keyword,
                 target_language=target_language,
                 target_country=target_country,
+                interface_lang=interface_lang,
+                hedge=hedge,
+                wire_format=wire_format
+            ))
+        except Exception:
+            metrics.record_call(target_country, "miss", "error", time.perf_counter() - started)
+            raise
+        if shared:
+            metrics.record_coalesced(target_country)
+            metrics.record_call(target_country, "coalesced", "success", time.perf_counter() - started)
+            return result
+        if use_cache:
+            _store_result(cache_key, seed_keyword, result)
+        metrics.record_call(target_country, "miss", "success", time.perf_counter() - started)
+        return result
+    else:
+        # 使用模拟数据
+        result = get_mock_response(
+            keyword=seed_keyword,
+            target_language=target_language,
+            target_country=target_country
+        )
+        metrics.record_call(target_country, "mock", "success", time.perf_counter() - started)
+        return result
+
+
+def get_keywords_for_language_group(
+    api_key: Optional[str],
+    seed_keyword: str,
+    target_language: str,
+    target_countries: List[str],
+    interface_lang: str = "Chinese",
+    use_cache: bool = True,
+    hedge: bool = False,
+    wire_format: str = WIRE_FULL
+) -> Dict[str, Dict]:
+    """
+    获取一组同语言市场的本地化关键词
+    缓存未命中的市场合并为一次批量请求，批量响应中缺失的市场再单独请求
+    批量请求只有完整线格式，选择紧凑线格式时逐个市场单独请求
+    
+    参数:
+        api_key: DeepSeek API密钥（可选）
+        seed_keyword: 英文种子关键词
+        target_language: 这些市场共同的目标语言
+        target_countries: 目标国家列表
+        interface_lang: 界面语言
+        use_cache: 是否使用响应缓存
+        hedge: 单市场请求是否启用对冲（批量请求不对冲）
+        wire_format: 响应线格式
+    
+    返回:
+        国家 -> 包含市场洞察和关键词列表的字典
+    """
+    if not (api_key and api_key.strip()) or len(target_countries) == 1 or wire_format != WIRE_FULL:
+        return {
+            country: get_keywords(
+                api_key=api_key,
+                seed_keyword=seed_keyword,
+                target_language=target_language,
+                target_country=country,
+                interface_lang=interface_lang,
+                use_cache=use_cache,
+                hedge=hedge,
+                wire_format=wire_format
+            )
+            for country in target_countries
+        }
+    
+    results: Dict[str, Dict] = {}
+    cache_keys = {
+        country: make_cache_key(
+            seed_keyword, country, target_language, interface_lang, PROMPT_TEMPLATE_HASH
+        )
+        for country in target_countries
+    }
+    
+    # 先从缓存中取出已有的市场
+    if use_cache:
+        for country in target_countries:
+            started = time.perf_counter()
+            cached, status = _cached_result(
+                cache_keys[country], seed_keyword, target_language, country, interface_lang
+            )
+            if cached is not None:
+                results[country] = cached
+                metrics.record_call(country, status, "success", time.perf_counter() - started)
+    
+    missing = [country for country in target_countries if country not in results]
+    for batch in plan_market_batches(missing):
+        if len(batch) == 1:
+            continue
+        started = time.perf_counter()
+        try:
+            batch_results = generate_localized_keywords_batch(
+                api_key=api_key,
+                seed_keyword=seed_keyword,
+                target_language=target_language,
+                target_countries=batch,
                 interface_lang=interface_lang
             )
+        except ValueError:
+            # 批量响应无法解析时不重跑整组，下面逐个市场单独请求
+            batch_results = {}
+        for country, result in batch_results.items():
+            results[country] = result
+            metrics.record_call(country, "miss", "success", time.perf_counter() - started)
+            if use_cache:
+                _store_result(cache_keys[country], seed_keyword, result)
+    
+    # 批量响应中缺失的市场（或单独成组的市场）走单市场请求
+    for country in target_countries:
+        if country not in results:
+            results[country] = get_keywords(
+                api_key=api_key,
+                seed_keyword=seed_keyword,
+                target_language=target_language,
+                target_country=country,
+                interface_lang=interface_lang,
+                use_cache=use_cache,
+                hedge=hedge
+            )
+    
+    return results
+
+
+def get_keywords_packed(
+    api_key: Optional[str],
+    seed_keywords: List[str],
+    target_language: str,
+    target_country: str,
+    interface_lang: str = "Chinese",
+    use_cache: bool = True
+) -> Dict[str, Dict]:
+    """
+    获取同一市场多个种子关键词的本地化关键词
+    缓存未命中的种子按令牌预算打包请求，打包响应中缺失的种子再单独请求
+    
+    参数:
+        api_key: DeepSeek API密钥（可选）
+        seed_keywords: 英文种子关键词列表
+        target_language: 目标语言
+        target_country: 目标国家
+        interface_lang: 界面语言
+        use_cache: 是否使用响应缓存
+    
+    返回:
+        种子关键词 -> 包含市场洞察和关键词列表的字典
+    """
+    if not (api_key and api_key.strip()):
+        return {
+            seed: get_mock_response(
+                keyword=seed,
+                target_language=target_language,
+                target_country=target_country
+            )
+            for seed in seed_keywords
+        }
+    
+    results: Dict[str, Dict] = {}
+    cache_keys = {
+        seed: make_cache_key(
+            seed, target_country, target_language, interface_lang, PROMPT_TEMPLATE_HASH
+        )
+        for seed in seed_keywords
+    }
+    
+    if use_cache:
+        for seed in seed_keywords:
+            started = time.perf_counter()
+            cached, status = _cached_result(cache_keys[seed], seed, target_language, target_country, interface_lang)
+            if cached is not None:
+                results[seed] = cached
+                metrics.record_call(target_country, status, "success", time.perf_counter() - started)
+    
+    missing = [seed for seed in seed_keywords if seed not in results]
+    for pack in plan_seed_packs(missing):
+        if len(pack) == 1:
+            continue
+        try:
+            pack_results = generate_localized_keywords_packed(
+                api_key=api_key,
+                seed_keywords=pack,
+                target_language=target_language,
+                target_country=target_country,
+                interface_lang=interface_lang
+            )
+        except ValueError:
+            # 打包响应无法解析时，这个包里的种子下面逐个单独请求
+            pack_results = {}
+        for seed, result in pack_results.items():
+            results[seed] = result
+            metrics.CALLS.inc(market=target_country, cache="miss", outcome="success")
+            if use_cache:
+                _store_result(cache_keys[seed], seed, result)
+    
+    # 打包响应中缺失的种子（或单独成包的种子）走单市场请求
+    for seed in seed_keywords:
+        if seed not in results:
+            results[seed] = get_keywords(
+                api_key=api_key,
+                seed_keyword=seed,
+                target_language=target_language,
+                target_country=target_country,
+                interface_lang=interface_lang,
+                use_cache=use_cache
+            )
+    
+    return results
+
+
+def group_markets_by_language(
+    markets: List[str],
+    output_token_budget: int = BATCH_OUTPUT_TOKEN_BUDGET,
+    max_group_size: int = MAX_MARKETS_PER_BATCH
+) -> List[Tuple[str, List[str]]]:
+    """
+    将市场按目标语言分组，保持市场在输入中的先后顺序
+    每组预计的输出令牌不超过output_token_budget（见plan_market_batches），超出部分拆成新的组
+    
+    返回:
+        (语言, 国家列表) 的列表
+    """
+    by_language: Dict[str, List[str]] = {}
+    for country in markets:
+        by_language.setdefault(MARKET_CONFIG.get(country, "English"), []).append(country)
+    
+    groups = []
+    for language, countries in by_language.items():
+        for batch in plan_market_batches(countries, output_token_budget, max_group_size):
+            groups.append((language, batch))
+    return groups
+
+
+def prioritize_markets(markets: List[str], by_popularity: bool = False) -> List[str]:
+    """
+    确定市场的调度顺序
+    默认保持用户选择的顺序；by_popularity为True时按预期热度排序（MARKET_CONFIG大致按市场规模排列），
+    时间预算不足时优先完成更重要的市场
+    """
+    if not by_popularity:
+        return list(markets)
+    rank = {country: index for index, country in enumerate(MARKET_NAMES)}
+    return sorted(markets, key=lambda country: rank.get(country, len(rank)))
+
+
+def _expected_market_seconds() -> float:
+    """
+    根据最近的网络耗时（p50）估计单个市场请求需要的时间，用于判断截止时间前是否还来得及派发
+    还没有样本时返回0，即截止时间到达前都会派发
+    """
+    observed = metrics.CALL_DURATION.quantile(0.5, stage="network")
+    return observed or 0.0
+
+
+def generate_keywords_within_budget(
+    api_key: Optional[str],
+    seed_keyword: str,
+    markets: List[str],
+    interface_lang: str = "Chinese",
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    on_market_done: Optional[Callable[[int, int, str, str], None]] = None,
+    batch_by_language: bool = False,
+    hedge: bool = False,
+    time_budget: Optional[float] = None,
+    stop_on_error: bool = False,
+    wire_format: str = WIRE_FULL
+) -> List[Dict]:
+    """
+    在时间预算内并发获取多个市场的本地化关键词，返回每个市场的状态和已完成的结果
+    市场按传入顺序（即优先级）派发；轮到某个市场时剩余时间已不足以完成一次请求就不再派发，
+    截止时间到达时仍在进行的市场标记为跳过（它们完成后仍会写入响应缓存，续跑时直接命中）
+    
+    参数:
+        与generate_keywords_for_markets相同，另外:
+        time_budget: 本次运行的时间预算（秒），为空或0表示不限时
+        stop_on_error: 任一市场出错时是否立即抛出异常（否则记为failed并继续其它市场）
+    
+    返回:
+        与markets顺序一致的列表，每项包含 country、language、status（done/failed/skipped）、
+        result（未完成时为None）和error（失败原因）
+    """
+    total = len(markets)
+    if total == 0:
+        return []
+    
+    deadline = time.monotonic() + time_budget if time_budget else None
+    expected = _expected_market_seconds()
+    outcomes = {
+        country: {
+            "country": country,
+            "language": MARKET_CONFIG.get(country, "English"),
+            "status": MARKET_SKIPPED,
+            "result": None,
+            "error": None
+        }
+        for country in markets
+    }
+    
+    # 每个任务是一组共享语言的市场；不批量时每组只有一个市场
+    if batch_by_language:
+        groups = group_markets_by_language(markets)
+    else:
+        groups = [(MARKET_CONFIG.get(country, "English"), [country]) for country in markets]
+    
+    def run_group(language: str, countries: List[str]) -> Optional[Dict[str, Dict]]:
+        # 在线程真正开始执行时检查截止时间：线程池按提交顺序取任务，剩余时间不足时直接跳过
+        if deadline is not None and time.monotonic() + expected > deadline:
+            return None
+        with tracing.span("markets", language=language, markets=",".join(countries)):
+            return get_keywords_for_language_group(
+                api_key=api_key,
+                seed_keyword=seed_keyword,
+                target_language=language,
+                target_countries=countries,
+                interface_lang=interface_lang,
+                hedge=hedge,
+                wire_format=wire_format
+            )
+    
+    workers = max(1, min(int(max_workers), MAX_WORKERS_LIMIT, len(groups)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="keywords")
+    timed_out = False
+    try:
+        futures = {executor.submit(tracing.wrap(run_group), language, countries): (language, countries) for language, countries in groups}
+        
+        # 按完成顺序更新进度，但按输入顺序返回结果
+        completed = 0
+        try:
+            for future in as_completed(futures, timeout=None if deadline is None else max(0.0, deadline - time.monotonic())):
+                language, countries = futures[future]
+                try:
+                    group_results = future.result()
+                except Exception as e:
+                    if stop_on_error:
+                        raise
+                    group_results = {}
+                    for country in countries:
+                        outcomes[country].update(status=MARKET_FAILED, error=str(e))
+                if group_results is None:
+                    continue
+                for country in countries:
+                    if country in group_results:
+                        outcomes[country].update(status=MARKET_DONE, result=group_results[country])
+                    completed += 1
+                    if on_market_done is not None:
+                        on_market_done(completed, total, country, language)
+        except TimeoutError:
+            timed_out = True
+    finally:
+        # 出错或超时时取消尚未开始的请求，避免继续消耗API配额；超时时不等待仍在进行的请求
+        executor.shutdown(wait=not timed_out, cancel_futures=True)
+    
+    return [outcomes[country] for country in markets]
+
+
+def generate_keywords_for_markets(
+    api_key: Optional[str],
+    seed_keyword: str,
+    markets: List[str],
+    interface_lang: str = "Chinese",
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    on_market_done: Optional[Callable[[int, int, str, str], None]] = None,
+    batch_by_language: bool = False,
+    hedge: bool = False,
+    wire_format: str = WIRE_FULL
+) -> List[Dict]:
+    """
+    并发获取多个市场的本地化关键词
+    每个请求提交到有界线程池中执行，总耗时取决于最慢的请求而不是所有请求之和
+    
+    参数:
+        api_key: DeepSeek API密钥（可选）
+        seed_keyword: 英文种子关键词
+        markets: 目标国家列表
+        interface_lang: 界面语言
+        max_workers: 本次运行的最大并发数
+        on_market_done: 每个市场完成时的回调 (已完成数, 总数, 国家, 语言)，在调用线程中执行
+        batch_by_language: 是否将同语言的市场合并为一次请求
+        hedge: 是否对慢请求发出对冲请求（只作用于单市场请求）
+        wire_format: 响应线格式（紧凑格式可减少输出令牌，结果展开为完整格式）
+    
+    返回:
+        与markets顺序一致的列表，每项包含 country、language 和 result
+        任一市场出错时抛出该异常
+    """
+    outcomes = generate_keywords_within_budget(
+        api_key=api_key,
+        seed_keyword=seed_keyword,
+        markets=markets,
+        interface_lang=interface_lang,
+        max_workers=max_workers,
+        on_market_done=on_market_done,
+        batch_by_language=batch_by_language,
+        hedge=hedge,
+        stop_on_error=True,
+        wire_format=wire_format
+    )
+    return [
+        {"country": outcome["country"], "language": outcome["language"], "result": outcome["result"]}
+        for outcome in outcomes
+    ]
+
+
+def _replay_result(result: Dict) -> Iterator[Tuple[str, Any]]:
+    """
+    将完整结果按流式事件的顺序重新产出（用于缓存命中和模拟数据）
+    """
+    yield "market_insight", result.get("market_insight", "")
+    for kw in result.get("keywords", []):
+        yield "keyword", kw
+    yield "result", result
+
+
+def stream_keywords(
+    api_key: Optional[str],
+    seed_keyword: str,
+    target_language: str,
+    target_country: str,
+    interface_lang: str = "Chinese",
+    use_cache: bool = True,
+    wire_format: str = WIRE_FULL
+) -> Iterator[Tuple[str, Any]]:
+    """
+    get_keywords的流式版本：缓存命中或使用模拟数据时立即产出全部事件，
+    否则边生成边产出，完成后写入缓存
+    
+    产出:
+        与stream_localized_keywords相同的事件
+    """
+    started = time.perf_counter()
+    if api_key and api_key.strip():
+        template_hash = WIRE_TEMPLATE_HASHES[wire_format]
+        cache_key = make_cache_key(
+            seed_keyword, target_country, target_language, interface_lang, template_hash
+        )
+        if use_cache:
+            cached, status = _cached_result(
+                cache_key, seed_keyword, target_language, target_country, interface_lang, template_hash
+            )
+            if cached is not None:
+                metrics.record_call(target_country, status, "success", time.perf_counter() - started)
+                yield from _replay_result(cached)
+                return
+        
+        # 其它会话正在请求相同内容时等待其完成后回放结果；对方中途放弃时自己重新请求
+        flight = get_single_flight()
+        flight_key = _flight_key(cache_key, api_key)
+        call, leader = flight.begin(flight_key)
+        if not leader:
+            try:
+                shared_result = call.wait()
+            except FlightAbandoned:
+                pass
+            except Exception:
+                metrics.record_call(target_country, "miss", "error", time.perf_counter() - started)
+                raise
+            else:
+                metrics.record_coalesced(target_country)
+                metrics.record_call(target_country, "coalesced", "success", time.perf_counter() - started)
+                yield from _replay_result(shared_result)
+                return
+        
+        finished = not leader
+        try:
+            for event, payload in stream_localized_keywords(
+                api_key=api_key,
+                seed_keyword=seed_keyword,
+                target_language=target_language,
+                target_country=target_country,
+                interface_lang=interface_lang,
+                wire_format=wire_format
+            ):
+                if event == "result":
+                    if use_cache:
+                        _store_result(cache_key, seed_keyword, payload)
+                    if not finished:
+                        flight.finish(flight_key, call, result=payload)
+                        finished = True
+                    metrics.record_call(target_country, "miss", "success", time.perf_counter() - started)
+                yield event, payload
         except Exception as e:
-            raise e
+            metrics.record_call(target_country, "miss", "error", time.perf_counter() - started)
+            if not finished:
+                flight.finish(flight_key, call, error=e)
+                finished = True
+            raise
+        finally:
+            if not finished:
+                # 调用方提前关闭了流，等待者需要自行请求
+                flight.finish(flight_key, call, error=FlightAbandoned("流式请求被提前关闭"))
     else:
-        # 使用模拟数据
-        return get_mock_response(
+        yield from _replay_result(get_mock_response(
             keyword=seed_keyword,
             target_language=target_language,
             target_country=target_country
-        )
+        ))
+
+
+def stream_keywords_for_markets(
+    api_key: Optional[str],
+    seed_keyword: str,
+    markets: List[str],
+    interface_lang: str = "Chinese",
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    time_budget: Optional[float] = None,
+    stop_on_error: bool = True,
+    wire_format: str = WIRE_FULL
+) -> Iterator[Tuple[str, str, str, Any]]:
+    """
+    并发流式获取多个市场的本地化关键词
+    工作线程把各市场的事件放入队列，由调用线程按到达顺序逐个产出，
+    因此调用方可以在生成过程中直接更新Streamlit界面
+    
+    参数:
+        与generate_keywords_within_budget相同
+    
+    产出:
+        (国家, 语言, 事件类型, 事件内容)，事件类型见stream_localized_keywords，另外:
+        ("error", 异常)   stop_on_error为False时某个市场出错
+        ("skipped", None) 时间预算内来不及完成的市场
+        stop_on_error为True时任一市场出错会在调用线程中抛出该异常
+    """
+    total = len(markets)
+    if total == 0:
+        return
+    
+    deadline = time.monotonic() + time_budget if time_budget else None
+    expected = _expected_market_seconds()
+    events: "queue.Queue[Tuple[str, str, str, Any]]" = queue.Queue()
+    
+    def run_market(country: str, language: str) -> None:
+        # 轮到该市场时剩余时间已不足以完成一次请求，不再派发
+        if deadline is not None and time.monotonic() + expected > deadline:
+            events.put((country, language, "skipped", None))
+            return
+        try:
+            with tracing.span("markets", language=language, markets=country):
+                for event, payload in stream_keywords(
+                    api_key=api_key,
+                    seed_keyword=seed_keyword,
+                    target_language=language,
+                    target_country=country,
+                    interface_lang=interface_lang,
+                    wire_format=wire_format
+                ):
+                    events.put((country, language, event, payload))
+        except Exception as e:
+            events.put((country, language, "error", e))
+    
+    workers = max(1, min(int(max_workers), MAX_WORKERS_LIMIT, total))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="keywords-stream")
+    try:
+        for country in markets:
+            executor.submit(tracing.wrap(run_market), country, MARKET_CONFIG.get(country, "English"))
+        
+        finished = set()
+        while len(finished) < total:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                country, language, event, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                # 截止时间已到：尚未完成的市场全部标记为跳过
+                for country in markets:
+                    if country not in finished:
+                        yield country, MARKET_CONFIG.get(country, "English"), "skipped", None
+                return
+            if event == "error" and stop_on_error:
+                raise payload
+            if event in ("result", "error", "skipped"):
+                finished.add(country)
+            yield country, language, event, payload
+    finally:
+        # 不等待仍在进行的流（它们完成后仍会写入缓存），只取消尚未开始的市场
+        executor.shutdown(wait=False, cancel_futures=True)